@@ -0,0 +1,52 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from webscraper.items import WebscraperItem
+from webscraper.pipelines import MySqlPipeline
+from webscraper.storage import SqliteBackend
+
+
+def make_item(**fields):
+    """Returns a cleansed item, with the given fields replaced"""
+    item = WebscraperItem(
+        publication_date=date(2024, 5, 30),
+        issuer="Issuer AB",
+        name="Person A",
+        role="Verkställande direktör",
+        related="Nej",
+        nature_of_purchase="Förvärv",
+        instrument_name="Issuer AB B",
+        instrument_type="Aktie",
+        isin="SE0000000001",
+        transaction_date=date(2024, 5, 29),
+        volume=1000,
+        volume_unit="Antal",
+        price=Decimal("12.5"),
+        currency="SEK",
+        status="NaN",
+    )
+    item.update(fields)
+    return item
+
+
+@pytest.fixture
+def sqlite_pipeline(tmp_path):
+    """MySqlPipeline writing to a new SQLite database, opened on the calling thread"""
+    pipeline = MySqlPipeline(backend=SqliteBackend(str(tmp_path / "ik_index.sqlite3")))
+    pipeline.open_db()
+    yield pipeline
+    pipeline.close_db_connection()
+
+
+def count_rows(pipeline, table):
+    pipeline.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return pipeline.cursor.fetchone()[0]
+
+
+class Stats(dict):
+    """Crawler stats kept in a dict"""
+
+    def inc_value(self, name, count=1):
+        self[name] = self.get(name, 0) + count
@@ -0,0 +1,49 @@
+from datetime import date
+
+from conftest import make_item
+
+from webscraper.activity import ALL_NATURES, ActivityTables
+from webscraper.pipelines import MySqlPipeline
+from webscraper.storage import SqliteBackend
+
+
+def issuer_month(pipeline):
+    pipeline.cursor.execute(
+        """SELECT transactions, volume, net_volume FROM IssuerActivity
+        WHERE period = %s AND period_start = %s AND nature_of_purchase = %s""",
+        (ActivityTables.MONTHLY, date(2024, 5, 1), ALL_NATURES),
+    )
+    return pipeline.cursor.fetchall()
+
+
+def test_activity_tables_are_off_by_default(sqlite_pipeline):
+    assert sqlite_pipeline.activity is None
+    assert sqlite_pipeline.write_batch([make_item()]) == {}
+
+    sqlite_pipeline.cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'IssuerActivity'"
+    )
+    assert sqlite_pipeline.cursor.fetchone()[0] == 0
+
+
+def test_batch_refresh_matches_rebuild(tmp_path):
+    pipeline = MySqlPipeline(
+        backend=SqliteBackend(str(tmp_path / "ik_index.sqlite3")),
+        activity_tables=True,
+    )
+    pipeline.open_db()
+    try:
+        items = [
+            make_item(),
+            make_item(occurrence=2),
+            make_item(nature_of_purchase="Avyttring", volume=300),
+        ]
+        assert pipeline.write_batch(items) == {}
+        assert issuer_month(pipeline) == [(3, 2300, 1700)]
+
+        activity = ActivityTables()
+        activity.clear(pipeline.cursor)
+        activity.refresh(pipeline.cursor, activity.transaction_days(pipeline.cursor))
+        assert issuer_month(pipeline) == [(3, 2300, 1700)]
+    finally:
+        pipeline.close_db_connection()
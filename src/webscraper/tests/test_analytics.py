@@ -0,0 +1,29 @@
+import pytest
+
+from twisted.python.failure import Failure
+
+from conftest import Stats, make_item
+
+from webscraper import analytics
+from webscraper.pipelines import AnalyticsPipeline
+
+pytest.importorskip("pyarrow")
+
+
+def test_failed_write_is_logged_and_counted(tmp_path, caplog):
+    pipeline = AnalyticsPipeline(directory=str(tmp_path))
+    pipeline.stats = Stats()
+    pipeline.store = analytics.ParquetStore(str(tmp_path), pipeline.stats)
+
+    items = [make_item(), make_item(volume=5)]
+    for item in items:
+        pipeline.store.add(item)
+    pipeline.store.take_pending()
+
+    pipeline.write_failed(Failure(OSError("No space left on device")), items)
+
+    assert "Error writing analytics: No space left on device" in caplog.text
+    assert pipeline.stats["analytics/write_failures"] == 1
+    assert pipeline.stats["analytics/rows_failed"] == 2
+    # The rows that were never written are queued again
+    assert pipeline.store.add(items[0])
@@ -0,0 +1,76 @@
+import gzip
+import os
+
+from datetime import date
+
+import pytest
+
+from conftest import count_rows, make_item
+
+from webscraper.pipelines import BulkLoadPipeline
+from webscraper.storage import MySqlBackend
+
+
+def test_calendar_dates_can_be_left_to_the_callers_commit(sqlite_pipeline):
+    sqlite_pipeline.extend_calendar([date(2040, 1, 2)], commit=False)
+    sqlite_pipeline.conn.rollback()
+
+    sqlite_pipeline.cursor.execute(
+        "SELECT COUNT(*) FROM Dates WHERE date = %s", (date(2040, 1, 2),)
+    )
+    assert sqlite_pipeline.cursor.fetchone()[0] == 0
+
+
+@pytest.fixture
+def mysql_bulk_pipeline(tmp_path):
+    """BulkLoadPipeline on an empty MySQL database named by DB_TEST_SCHEMA
+
+    The server is the one of DB_HOST, DB_USER and DB_PASSWORD and needs
+    local_infile enabled. The database is dropped before and after the test.
+    """
+    schema = os.getenv("DB_TEST_SCHEMA")
+    if not schema:
+        pytest.skip("DB_TEST_SCHEMA is not set, no MySQL server to test against")
+
+    backend = MySqlBackend()
+    pipeline = BulkLoadPipeline(spool_dir=str(tmp_path), backend=backend)
+    backend.use_throwaway(schema)
+    pipeline.open_db()
+    yield pipeline
+    pipeline.close_db_connection()
+    backend.drop_database()
+
+
+def write_spool(pipeline, path, items):
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as spool:
+        for item in items:
+            spool.write(pipeline.spool_line(item))
+    return [str(path)]
+
+
+def test_bulk_load_inserts_then_updates(mysql_bulk_pipeline, tmp_path, caplog):
+    pipeline = mysql_bulk_pipeline
+    items = [
+        make_item(),
+        make_item(occurrence=2),
+        make_item(isin=None, instrument_name="Issuer AB A", volume=5),
+        make_item(transaction_date=date(2039, 12, 31)),
+    ]
+
+    with caplog.at_level("INFO"):
+        pipeline.load_spools(write_spool(pipeline, tmp_path / "first.tsv.gz", items))
+    assert count_rows(pipeline, "Transactions") == 4
+    assert "4 rows inserted into and 0 rows updated" in caplog.text
+
+    # The calendar was extended in the same transaction as the rows
+    pipeline.cursor.execute(
+        "SELECT COUNT(*) FROM Dates WHERE date = %s", (date(2039, 12, 31),)
+    )
+    assert pipeline.cursor.fetchone()[0] == 1
+
+    caplog.clear()
+    items[0]["related"] = "Ja"
+    with caplog.at_level("INFO"):
+        pipeline.load_spools(write_spool(pipeline, tmp_path / "second.tsv.gz", items))
+    assert count_rows(pipeline, "Transactions") == 4
+    assert "0 rows inserted into and 1 rows updated" in caplog.text
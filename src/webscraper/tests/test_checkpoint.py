@@ -0,0 +1,95 @@
+from conftest import make_item
+
+from webscraper.extensions import CheckpointExtension
+from webscraper.items import row_identity
+from webscraper.state import CrawlCheckpoint, HighWaterMark
+from webscraper.storage import SqliteBackend
+
+
+def page_item(page, **fields):
+    item = make_item(**fields)
+    item["page"] = page
+    return item
+
+
+def test_pages_fold_once_every_item_is_committed():
+    checkpoint = CrawlCheckpoint("2024-05-31", "2024-01-01")
+    checkpoint.open_page(10)
+    checkpoint.page_parsed(11, 1, "2024-05-20")
+    checkpoint.item_settled(11, make_item(volume=11), committed=True)
+    assert checkpoint.completed_through == 9
+
+    # Page 10 settles after page 11 and both fold together
+    checkpoint.item_settled(10, make_item(volume=10), committed=True)
+    checkpoint.page_parsed(10, 1, "2024-05-25")
+    assert checkpoint.completed_through == 11
+    assert checkpoint.pages == {}
+    assert checkpoint.boundary_date == "2024-05-20"
+    assert checkpoint.resume_page() == 12
+    assert checkpoint.resume_date() == "2024-05-20"
+
+
+def test_dropped_item_keeps_its_page_open():
+    checkpoint = CrawlCheckpoint("2024-05-31", "2024-01-01")
+    checkpoint.page_parsed(1, 2, "2024-05-30")
+    checkpoint.item_settled(1, make_item(), committed=True)
+    checkpoint.item_settled(1, make_item(volume=5), committed=False)
+    checkpoint.page_parsed(2, 0, "2024-05-29")
+
+    assert checkpoint.completed_through == 0
+    assert checkpoint.resume_page() == 1
+    assert sorted(checkpoint.pages) == [1, 2]
+
+
+def test_reopen_keeps_the_rows_of_open_pages(tmp_path):
+    checkpoint = CrawlCheckpoint("2024-05-31", "2024-01-01")
+    checkpoint.page_parsed(1, 1, "2024-05-30")
+    checkpoint.item_settled(1, make_item(), committed=True)
+    checkpoint.page_parsed(2, 2, "2024-05-28")
+    checkpoint.item_settled(2, make_item(volume=5), committed=True)
+    checkpoint.finished = "shutdown"
+    checkpoint.save(str(tmp_path / "checkpoint.json"))
+
+    resumed = CrawlCheckpoint.load(str(tmp_path / "checkpoint.json"))
+    resumed.reopen()
+
+    assert resumed.resume_page() == 2
+    assert resumed.pages == {} and resumed.finished is None
+    assert resumed.is_committed(make_item(volume=5))
+    assert resumed.identities == {
+        row_identity(make_item()),
+        row_identity(make_item(volume=5)),
+    }
+
+
+class Spider:
+    def __init__(self):
+        self.CHECKPOINT = CrawlCheckpoint("2024-05-31", "2024-01-01")
+
+
+class Response:
+    def __init__(self, page):
+        self.meta = {"page": page}
+
+
+def test_items_settle_on_the_page_they_were_scraped_from(tmp_path):
+    extension = CheckpointExtension(str(tmp_path / "checkpoint.json"))
+    spider = Spider()
+    spider.CHECKPOINT.page_parsed(10, 1, "2024-05-30")
+
+    # A probed page parsed in the callback of a later probe
+    extension.item_scraped(page_item(10), Response(25), spider)
+
+    assert spider.CHECKPOINT.completed_through == 10
+    assert 25 not in spider.CHECKPOINT.pages
+
+
+def test_unreadable_high_water_mark_is_logged(tmp_path, caplog):
+    # A database without tables, as the query fails on a broken one
+    backend = SqliteBackend(str(tmp_path / "empty.sqlite3"))
+
+    with caplog.at_level("ERROR"):
+        mark = HighWaterMark.load_from_db(backend)
+
+    assert not mark
+    assert "every row is collected" in caplog.text
@@ -0,0 +1,28 @@
+import sqlite3
+
+from webscraper.pipelines import MySqlPipeline
+from webscraper.storage import SqliteBackend
+
+
+class BrokenCursor:
+    def close(self):
+        raise sqlite3.OperationalError("connection lost")
+
+
+class RecordingConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_close_db_connection_closes_connection_after_cursor_errors(tmp_path):
+    pipeline = MySqlPipeline(backend=SqliteBackend(str(tmp_path / "db.sqlite3")))
+    pipeline.statements = {"SELECT 1": BrokenCursor()}
+    pipeline.cursor = BrokenCursor()
+    pipeline.conn = RecordingConnection()
+
+    pipeline.close_db_connection()
+
+    assert pipeline.conn.closed
+    assert pipeline.statements == {}
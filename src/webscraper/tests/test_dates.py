@@ -0,0 +1,55 @@
+import sqlite3
+
+from datetime import date
+
+from webscraper.dates import DateCalendar
+
+
+def test_consecutive_dates_are_merged_into_runs():
+    calendar = DateCalendar()
+    calendar.load([(3, "2024-01-03"), (1, "2024-01-01"), (2, "2024-01-02")])
+    calendar.add(date(2024, 1, 10), 9)
+    calendar.add(date(2024, 1, 5), 5)
+    assert len(calendar.runs) == 3
+
+    # Filling the gap with the ids in between joins the runs either side of it
+    calendar.add(date(2024, 1, 4), 4)
+    assert calendar.runs == [(date(2024, 1, 1), 1, 5), (date(2024, 1, 10), 9, 1)]
+    assert len(calendar) == 6
+    assert calendar.first_date == date(2024, 1, 1)
+    assert calendar.last_date == date(2024, 1, 10)
+
+
+def test_dates_with_ids_out_of_sequence_keep_their_ids():
+    calendar = DateCalendar()
+    calendar.load([(1, date(2024, 1, 1)), (7, date(2024, 1, 2)), (2, date(2024, 1, 3))])
+
+    assert len(calendar.runs) == 3
+    assert [calendar.id_of(f"2024-01-0{day}") for day in (1, 2, 3)] == [1, 7, 2]
+    assert calendar.id_of(date(2023, 12, 31)) is None
+    assert calendar.id_of(date(2024, 1, 4)) is None
+    assert calendar.id_of("not a date") is None
+
+    # A date already in the calendar keeps its first id
+    calendar.add(date(2024, 1, 2), 3)
+    assert calendar.id_of(date(2024, 1, 2)) == 7
+
+
+def test_dates_inserted_by_another_writer_are_read_back(sqlite_pipeline, tmp_path):
+    other = sqlite3.connect(tmp_path / "ik_index.sqlite3")
+    other.execute("INSERT INTO Dates (date) VALUES ('2040-01-05')")
+    other.commit()
+    other_id = other.execute(
+        "SELECT id FROM Dates WHERE date = '2040-01-05'"
+    ).fetchone()[0]
+    other.close()
+
+    sqlite_pipeline.extend_calendar([date(2040, 1, 6)])
+
+    assert sqlite_pipeline.calendar.id_of(date(2040, 1, 5)) == other_id
+    sqlite_pipeline.cursor.execute(
+        "SELECT id FROM Dates WHERE date = %s", (date(2040, 1, 6),)
+    )
+    assert sqlite_pipeline.calendar.id_of(date(2040, 1, 6)) == (
+        sqlite_pipeline.cursor.fetchone()[0]
+    )
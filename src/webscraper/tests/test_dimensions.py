@@ -0,0 +1,39 @@
+from conftest import count_rows, make_item
+
+
+def test_batch_finds_instruments_without_isin_again(sqlite_pipeline):
+    items = [
+        make_item(isin=None, instrument_type=None, volume=100),
+        make_item(isin=None, instrument_name="Issuer AB A", volume=200),
+    ]
+    assert sqlite_pipeline.write_batch(items) == {}
+
+    # A new batch starts with empty caches, so the keys are read back
+    for cache in sqlite_pipeline.caches.values():
+        cache.clear()
+    again = [
+        make_item(isin=None, instrument_type=None, volume=300),
+        make_item(isin=None, instrument_name="Issuer AB A", volume=400),
+    ]
+    assert sqlite_pipeline.write_batch(again) == {}
+
+    assert count_rows(sqlite_pipeline, "Instruments") == 2
+    assert count_rows(sqlite_pipeline, "Transactions") == 4
+
+
+def test_batch_finds_people_with_null_name_again(sqlite_pipeline):
+    assert sqlite_pipeline.write_batch([make_item(name=None)]) == {}
+    for cache in sqlite_pipeline.caches.values():
+        cache.clear()
+    assert sqlite_pipeline.write_batch([make_item(name=None, volume=5)]) == {}
+
+    assert count_rows(sqlite_pipeline, "People") == 1
+
+
+def test_item_finds_instrument_without_isin_again(sqlite_pipeline):
+    sqlite_pipeline.write_item(make_item(isin=None, instrument_type=None))
+    for cache in sqlite_pipeline.caches.values():
+        cache.clear()
+    sqlite_pipeline.write_item(make_item(isin=None, instrument_type=None, volume=5))
+
+    assert count_rows(sqlite_pipeline, "Instruments") == 1
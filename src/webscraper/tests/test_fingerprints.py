@@ -0,0 +1,86 @@
+import pytest
+
+from conftest import Stats, count_rows
+
+from webscraper.fingerprints import FingerprintStore
+from webscraper.items import WebscraperItem
+from webscraper.pipelines import DataCleansePipeline
+
+
+def scraped_item(**fields):
+    """Returns a row as the spider scrapes it, with the given fields replaced"""
+    item = WebscraperItem(
+        publication_date="2024-05-30",
+        issuer="Issuer AB",
+        name="Person A",
+        role="Verkställande direktör",
+        related=None,
+        nature_of_purchase="Förvärv",
+        instrument_name="Issuer AB B",
+        instrument_type="Aktie",
+        isin="SE0000000001",
+        transaction_date="2024-05-29",
+        volume="1\xa0000",
+        volume_unit="Antal",
+        price="12,5",
+        currency="SEK",
+        status=None,
+    )
+    item.update(fields)
+    return item
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite3"), stats=Stats())
+    yield store
+    store.close()
+
+
+def stored_pages(store):
+    return [page for page, in store.conn.execute("SELECT page FROM Pages")]
+
+
+def test_page_is_stored_once_repeated_rows_are_committed(store):
+    # The same row twice, as when it also arrives from another page
+    items = [scraped_item(), scraped_item(), scraped_item(volume="5")]
+    assert store.changed_rows(1, items) == items
+
+    for item in items:
+        store.row_committed(item)
+
+    assert stored_pages(store) == [1]
+    assert store.pending_rows == {}
+    assert store.changed_rows(1, items) == []
+
+
+def test_identical_trades_are_separate_rows(store):
+    items = [scraped_item(), scraped_item(occurrence=2)]
+    assert store.changed_rows(1, items) == items
+
+    store.row_committed(items[0])
+    assert stored_pages(store) == []
+    store.row_committed(items[1])
+    assert stored_pages(store) == [1]
+
+
+def test_only_rows_updated_in_place_are_changed(store, sqlite_pipeline):
+    cleanse = DataCleansePipeline()
+    original = scraped_item()
+    store.changed_rows(1, [original])
+    sqlite_pipeline.write_item(cleanse.process_item(original, None))
+    store.row_committed(original)
+
+    revised = scraped_item(status="Reviderad", related="Ja")
+    other_currency = scraped_item(currency="EUR")
+    other_volume = scraped_item(volume="2\xa0000")
+    store.stats.clear()
+    changed = store.changed_rows(2, [revised, other_currency, other_volume])
+
+    assert changed == [revised, other_currency, other_volume]
+    assert store.stats["fingerprints/rows_changed"] == 1
+    assert store.stats["fingerprints/rows_new"] == 2
+
+    # The changed row updates the stored transaction instead of adding one
+    sqlite_pipeline.write_item(cleanse.process_item(revised, None))
+    assert count_rows(sqlite_pipeline, "Transactions") == 1
@@ -0,0 +1,119 @@
+from datetime import date, timedelta
+
+import pytest
+
+from scrapy.exceptions import CloseSpider
+from scrapy.http import HtmlResponse, Request
+
+from webscraper.extensions import CheckpointExtension
+from webscraper.items import row_page
+from webscraper.spiders.collect_all_spider import AllFinancialDataSpider
+
+PAGES = 60
+ROWS_PER_PAGE = 10
+
+
+def listing_page(page):
+    """Returns a page of a listing of two pages per publication day, newest first"""
+    published = date(2024, 6, 30) - timedelta(days=(page - 1) // 2)
+    rows = "".join(
+        "<tr>"
+        + "".join(
+            f"<td>{value}</td>"
+            for value in (
+                published,
+                "Issuer AB",
+                f"Person {page}-{row}",
+                "Styrelseledamot",
+                "",
+                "Förvärv",
+                "Issuer AB B",
+                "Aktie",
+                "SE0000000001",
+                published,
+                "100",
+                "Antal",
+                "10,5",
+                "SEK",
+            )
+        )
+        + "<td></td></tr>"
+        for row in range(ROWS_PER_PAGE)
+    )
+    pagination = "".join(
+        f"<li><a>{number}</a></li>"
+        for number in list(range(1, 14)) + [f"{PAGES}s", PAGES, PAGES]
+    )
+    return (
+        '<html><body><div id="grid-list">'
+        f"<div><div><table><tbody>{rows}</tbody></table></div></div>"
+        f"<div><div><div><div><ul>{pagination}</ul></div></div></div></div>"
+        "</div></body></html>"
+    )
+
+
+def crawl(spider):
+    """Runs the spider on the listing, answering its requests in order
+
+    Returns:
+        tuple: The requested page numbers, and every item with the response of
+            the callback that yielded it
+    """
+    requested = []
+    scraped = []
+    queue = list(spider.start_requests())
+
+    while queue:
+        request = queue.pop(0)
+        page = request.meta["page"]
+        requested.append(page)
+        response = HtmlResponse(
+            url=request.url,
+            body=listing_page(page),
+            encoding="utf-8",
+            request=request,
+        )
+
+        try:
+            for output in request.callback(response):
+                if isinstance(output, Request):
+                    queue.append(output)
+                else:
+                    scraped.append((output, response))
+        except CloseSpider:
+            pass
+
+    return requested, scraped
+
+
+@pytest.mark.parametrize("concurrency", ["1", "4"])
+def test_window_is_located_and_every_page_fetched_once(concurrency):
+    spider = AllFinancialDataSpider(
+        start_date="2024-06-20", end_date="2024-06-09", concurrency=concurrency
+    )
+    requested, scraped = crawl(spider)
+
+    # 2024-06-20 is on pages 21-22 and 2024-06-09 starts on page 43
+    assert spider.LOCATED_PAGES == [21, 43]
+    assert len(requested) == len(set(requested))
+    assert set(range(21, 44)) <= set(requested)
+    assert spider.PROBED_PAGES == {}
+
+    assert len(scraped) == 22 * ROWS_PER_PAGE
+    assert {row_page(item) for item, _ in scraped} == set(range(21, 43))
+
+
+@pytest.mark.parametrize("concurrency", ["1", "4"])
+def test_checkpoint_completes_the_located_window(tmp_path, concurrency):
+    spider = AllFinancialDataSpider(
+        start_date="2024-06-20", end_date="2024-06-09", concurrency=concurrency
+    )
+    extension = CheckpointExtension(str(tmp_path / "checkpoint.json"))
+
+    _, scraped = crawl(spider)
+    for item, response in scraped:
+        extension.item_scraped(item, response, spider)
+
+    assert spider.CHECKPOINT.completed_through == 43
+    assert spider.CHECKPOINT.pages == {}
+    assert spider.CHECKPOINT.items_committed == 22 * ROWS_PER_PAGE
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from webscraper.commands.backfill import Command
+from webscraper.shards import ShardQueue, split_window
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = ShardQueue(str(tmp_path / "backfill.sqlite3"), attempts=2)
+    yield queue
+    queue.close()
+
+
+def test_window_is_split_without_gaps():
+    assert split_window("2024-06-30", "2024-06-01", 10) == [
+        ("2024-06-30", "2024-06-20"),
+        ("2024-06-20", "2024-06-10"),
+        ("2024-06-10", "2024-06-01"),
+    ]
+
+
+def test_shards_are_leased_newest_first_and_once(queue):
+    assert queue.add(split_window("2024-06-30", "2024-06-10", 10)) == 2
+    assert queue.add(split_window("2024-06-30", "2024-06-10", 10)) == 0
+
+    first = queue.lease("a")
+    second = queue.lease("b")
+    assert first == (first[0], "2024-06-30", "2024-06-20", 1)
+    assert second[1:] == ("2024-06-20", "2024-06-10", 1)
+    assert queue.lease("c") is None
+
+    assert queue.renew(first[0], "a")
+    assert not queue.renew(first[0], "b")
+
+    queue.complete(first[0], "a")
+    queue.fail(second[0], "b", "2 items dropped")
+    assert queue.counts() == {"done": 1, "pending": 1}
+
+
+def test_expired_lease_is_taken_over_until_attempts_run_out(queue):
+    queue.lease_seconds = -1
+    queue.add([("2024-06-30", "2024-06-20")])
+
+    shard_id = queue.lease("a")[0]
+    assert queue.lease("b") == (shard_id, "2024-06-30", "2024-06-20", 2)
+    assert not queue.renew(shard_id, "a")
+
+    # The lease of the second attempt runs out as well
+    assert queue.lease("c") is None
+    assert queue.counts() == {"failed": 1}
+    assert queue.unfinished() == 0
+
+
+def test_shard_with_dropped_items_is_not_done(tmp_path):
+    command = Command()
+    command.state_dir = str(tmp_path)
+    shard = (1, "2024-06-30", "2024-06-20", 1)
+
+    def result(**fields):
+        with open(tmp_path / "shard-1.result.json", "w", encoding="utf-8") as file:
+            json.dump({"reason": "finished", "items": 10, "errors": 0, **fields}, file)
+        return command.shard_error(shard, 0)
+
+    assert result(dropped=0) is None
+    assert result(dropped=2) == "2 items dropped"
+    assert result(errors=1, dropped=0) == "1 errors logged"
+    assert command.shard_error(shard, 1) == "exit code 1"
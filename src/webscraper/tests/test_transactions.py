@@ -0,0 +1,29 @@
+from conftest import count_rows, make_item
+
+from webscraper.items import row_identity
+
+
+def test_batch_keeps_identical_trades_apart(sqlite_pipeline):
+    sqlite_pipeline.publish_ids = True
+    items = [make_item(), make_item(occurrence=2), make_item(volume=5)]
+    assert sqlite_pipeline.write_batch(items) == {}
+    assert count_rows(sqlite_pipeline, "Transactions") == 3
+
+    ids = [item["ids"]["transaction_id"] for item in items]
+    assert None not in ids and len(set(ids)) == 3
+
+    # Crawling the page again updates the rows instead of adding more
+    assert sqlite_pipeline.write_batch([make_item(), make_item(occurrence=2)]) == {}
+    assert count_rows(sqlite_pipeline, "Transactions") == 3
+
+
+def test_item_keeps_identical_trades_apart(sqlite_pipeline):
+    for item in (make_item(), make_item(occurrence=2), make_item()):
+        sqlite_pipeline.write_item(item)
+
+    assert count_rows(sqlite_pipeline, "Transactions") == 2
+
+
+def test_first_occurrence_keeps_its_identity():
+    assert row_identity(make_item(occurrence=1)) == row_identity(make_item())
+    assert row_identity(make_item(occurrence=2)) != row_identity(make_item())
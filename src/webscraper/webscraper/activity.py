@@ -0,0 +1,200 @@
+from datetime import date
+
+from .analytics import BUY_NATURES, SELL_NATURES
+from .dates import to_date
+
+# Value of nature_of_purchase in the rows summing every nature
+ALL_NATURES = "*"
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month_start(day):
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+class ActivityTables:
+    """Daily and monthly net volume and value per instrument, issuer and role
+
+    Every table has one row per period, key, nature of purchase and currency, and
+    a row with nature_of_purchase "*" summing every nature, so a dashboard reads
+    a figure with a single primary key lookup instead of aggregating
+    Transactions. Days are dated by the transaction date. Buying natures count
+    positive and selling natures negative in net_volume and net_value.
+
+    The rows of a day are recomputed from Transactions, and those of its month
+    from the daily rows, by `scrapy rebuild_activity`, or with
+    ACTIVITY_TABLES_ENABLED in the transaction that writes the day's
+    transactions. A refresh is idempotent, so rows written twice are never
+    counted twice.
+    """
+
+    # Table, key column and the expression of the key in the refresh query
+    TABLES = (
+        ("InstrumentActivity", "instrument_id", "t.instrument_id"),
+        ("IssuerActivity", "company_id", "i.company_id"),
+        ("RoleActivity", "role_id", "p.role_id"),
+    )
+    DAILY = "D"
+    MONTHLY = "M"
+    # Days refreshed per statement
+    CHUNK_SIZE = 500
+
+    def create_tables(self, cursor):
+        """Creates the activity tables if they do not exist
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+        """
+        for table, key_column, _ in self.TABLES:
+            # Periods lead the key, so the rows of a refreshed day are deleted
+            # with a range scan
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                period CHAR(1) NOT NULL,
+                period_start DATE NOT NULL,
+                {key_column} INT NOT NULL,
+                nature_of_purchase VARCHAR(100) NOT NULL,
+                currency_id INT NOT NULL,
+                transactions INT NOT NULL,
+                volume BIGINT,
+                value DECIMAL(24, 6),
+                net_volume BIGINT,
+                net_value DECIMAL(24, 6),
+                PRIMARY KEY (period, period_start, {key_column},
+                nature_of_purchase, currency_id)
+                )"""
+            )
+
+    def refresh(self, cursor, days):
+        """Recomputes the rows of some days and of their months, without committing
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+            days (Iterable): Transaction dates, or strings in YYYY-MM-DD format
+        """
+        days = sorted({to_date(day) for day in days} - {None})
+
+        for start in range(0, len(days), self.CHUNK_SIZE):
+            chunk = days[start : start + self.CHUNK_SIZE]
+            for table, key_column, key in self.TABLES:
+                self.refresh_days(cursor, table, key_column, key, chunk)
+
+        for month in sorted({month_start(day) for day in days}):
+            for table, key_column, _ in self.TABLES:
+                self.refresh_month(cursor, table, key_column, month)
+
+    def refresh_days(self, cursor, table, key_column, key, days):
+        """Replaces the daily rows of some days of a table with sums of Transactions
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+            table (str): The activity table
+            key_column (str): The key column of the table
+            key (str): The expression of the key in the query
+            days (list): The days to refresh
+        """
+        placeholders = ", ".join(["%s"] * len(days))
+        cursor.execute(
+            f"""DELETE FROM {table}
+            WHERE period = %s AND period_start IN ({placeholders})""",
+            (self.DAILY, *days),
+        )
+
+        direction = self.direction("t.nature_of_purchase")
+        sums = f"""COUNT(*), SUM(t.volume), SUM(t.volume * t.price),
+            SUM({direction} * t.volume), SUM({direction} * t.volume * t.price)"""
+        joins = f"""FROM Transactions t
+            JOIN Dates d ON d.id = t.purchase_date_id
+            JOIN Instruments i ON i.id = t.instrument_id
+            JOIN People p ON p.id = t.people_id
+            WHERE d.date IN ({placeholders}) AND {key} IS NOT NULL"""
+
+        cursor.execute(
+            f"""INSERT INTO {table}
+            (period, period_start, {key_column}, nature_of_purchase, currency_id,
+            transactions, volume, value, net_volume, net_value)
+            SELECT %s, d.date, {key}, COALESCE(t.nature_of_purchase, ''),
+            COALESCE(t.currency_id, 0), {sums}
+            {joins}
+            GROUP BY d.date, {key}, t.nature_of_purchase, t.currency_id
+            UNION ALL
+            SELECT %s, d.date, {key}, %s, COALESCE(t.currency_id, 0), {sums}
+            {joins}
+            GROUP BY d.date, {key}, t.currency_id""",
+            (self.DAILY, *days, self.DAILY, ALL_NATURES, *days),
+        )
+
+    def refresh_month(self, cursor, table, key_column, month):
+        """Replaces the monthly rows of a month of a table with sums of its daily rows
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+            table (str): The activity table
+            key_column (str): The key column of the table
+            month (date): The first day of the month
+        """
+        cursor.execute(
+            f"DELETE FROM {table} WHERE period = %s AND period_start = %s",
+            (self.MONTHLY, month),
+        )
+        cursor.execute(
+            f"""INSERT INTO {table}
+            (period, period_start, {key_column}, nature_of_purchase, currency_id,
+            transactions, volume, value, net_volume, net_value)
+            SELECT %s, %s, {key_column}, nature_of_purchase, currency_id,
+            SUM(transactions), SUM(volume), SUM(value), SUM(net_volume),
+            SUM(net_value)
+            FROM {table}
+            WHERE period = %s AND period_start >= %s AND period_start < %s
+            GROUP BY {key_column}, nature_of_purchase, currency_id""",
+            (self.MONTHLY, month, self.DAILY, month, next_month_start(month)),
+        )
+
+    def clear(self, cursor):
+        """Deletes every row of the activity tables
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+        """
+        for table, _, _ in self.TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+
+    def transaction_days(self, cursor):
+        """Returns every transaction date of Transactions
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+
+        Returns:
+            list: The dates, oldest first
+        """
+        cursor.execute(
+            """SELECT DISTINCT d.date FROM Transactions t
+            JOIN Dates d ON d.id = t.purchase_date_id
+            ORDER BY d.date"""
+        )
+        return [to_date(day) for day, in cursor.fetchall()]
+
+    @staticmethod
+    def direction(column):
+        """Returns the expression that is 1 for buying, -1 for selling and 0 otherwise
+
+        Args:
+            column (str): The nature of purchase column
+
+        Returns:
+            str: The SQL expression
+        """
+
+        def quoted(natures):
+            return ", ".join(
+                "'" + nature.replace("'", "''") + "'" for nature in natures
+            )
+
+        return f"""(CASE WHEN {column} IN ({quoted(BUY_NATURES)}) THEN 1
+            WHEN {column} IN ({quoted(SELL_NATURES)}) THEN -1 ELSE 0 END)"""
@@ -0,0 +1,291 @@
+import glob
+import hashlib
+import os
+import time
+import uuid
+
+from datetime import date, datetime, timezone
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from .fingerprints import row_key
+
+# pyarrow and duckdb are only needed for the analytics store
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+TEXT_FIELDS = ("name", "instrument_name")
+# Few distinct values, stored as dictionary indexes
+DICTIONARY_FIELDS = (
+    "issuer",
+    "role",
+    "related",
+    "nature_of_purchase",
+    "instrument_type",
+    "isin",
+    "volume_unit",
+    "currency",
+    "status",
+)
+DATE_FIELDS = ("publication_date", "transaction_date")
+DECIMAL_FIELDS = ("volume", "price")
+DECIMAL_SCALE = Decimal("0.000001")
+
+# Natures counted as buying and as selling in the net figures
+BUY_NATURES = ("Förvärv", "Teckning", "Tilldelning")
+SELL_NATURES = ("Avyttring",)
+
+
+def arrow_schema():
+    """Returns the schema of the Parquet files of the store
+
+    Returns:
+        pyarrow.Schema: Typed columns, dictionary encoded where values repeat
+    """
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+
+    return pa.schema(
+        [("row_key", pa.binary(16)), ("row_digest", pa.binary(16))]
+        + [(field, pa.date32()) for field in DATE_FIELDS]
+        + [(field, dictionary) for field in DICTIONARY_FIELDS]
+        + [(field, pa.string()) for field in TEXT_FIELDS]
+        + [(field, pa.decimal128(20, 6)) for field in DECIMAL_FIELDS]
+        + [("ingested_at", pa.timestamp("ms", tz="UTC"))]
+    )
+
+
+def typed_value(field, value):
+    """Converts a cleansed value to the type of its column
+
+    Values the cleansing could not parse, such as a price that is not a number,
+    are stored as NULL.
+
+    Args:
+        field (str): The field name
+        value (Any): The cleansed value
+
+    Returns:
+        Any: The value for the Parquet column
+    """
+    if value is None:
+        return None
+    if field in DATE_FIELDS:
+        return value if isinstance(value, date) else None
+    if field in DECIMAL_FIELDS:
+        if isinstance(value, int):
+            return Decimal(value)
+        if isinstance(value, Decimal) and value.is_finite():
+            return value.quantize(DECIMAL_SCALE, rounding=ROUND_HALF_EVEN)
+        return None
+    return str(value)
+
+
+def row_digest(row):
+    """Returns the content hash of a typed row
+
+    Args:
+        row (dict): The typed values of the row
+
+    Returns:
+        bytes: A digest of every stored field
+    """
+    return hashlib.blake2b(
+        "\x1f".join(
+            "" if row[field] is None else str(row[field])
+            for field in DATE_FIELDS + DICTIONARY_FIELDS + TEXT_FIELDS + DECIMAL_FIELDS
+        ).encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+class ParquetStore:
+    """Month partitioned Parquet files of the cleansed transactions
+
+    Rows are appended as new files under transactions/publication_month=YYYY-MM,
+    files that have been written are never changed. A row already stored with
+    the same content is skipped, a changed row (a correction) is appended again
+    and the newest version wins in the transactions view.
+    """
+
+    def __init__(self, root: str, stats=None):
+        self.root = root
+        self.stats = stats
+        self.schema = arrow_schema()
+
+        self.pending = {}
+        # (row key, content hash) of the stored rows per loaded month
+        self.stored = {}
+
+    def partition_dir(self, month):
+        return os.path.join(self.root, "transactions", f"publication_month={month}")
+
+    def stored_rows(self, month):
+        """Reads the keys and hashes of the rows stored for a month, once per month
+
+        Args:
+            month (str): The month in YYYY-MM format
+
+        Returns:
+            set: The (row key, content hash) pairs
+        """
+        if month not in self.stored:
+            paths = sorted(
+                glob.glob(os.path.join(self.partition_dir(month), "*.parquet"))
+            )
+            pairs = set()
+            for path in paths:
+                table = pq.read_table(path, columns=["row_key", "row_digest"])
+                pairs.update(
+                    zip(
+                        table.column("row_key").to_pylist(),
+                        table.column("row_digest").to_pylist(),
+                    )
+                )
+            self.stored[month] = pairs
+
+        return self.stored[month]
+
+    def add(self, item):
+        """Queues a cleansed item unless it is stored with the same content
+
+        Args:
+            item (scrapy.Item): A cleansed item
+
+        Returns:
+            bool: True if the item is queued
+        """
+        row = {
+            field: typed_value(field, item[field])
+            for field in DATE_FIELDS + DICTIONARY_FIELDS + TEXT_FIELDS + DECIMAL_FIELDS
+        }
+        if row["publication_date"] is None:
+            self.inc_stat("rows_skipped")
+            return False
+
+        month = row["publication_date"].strftime("%Y-%m")
+        row["row_key"] = row_key(item)
+        row["row_digest"] = row_digest(row)
+
+        pair = (row["row_key"], row["row_digest"])
+        stored = self.stored_rows(month)
+        if pair in stored:
+            self.inc_stat("rows_unchanged")
+            return False
+
+        stored.add(pair)
+        self.pending.setdefault(month, []).append(row)
+        return True
+
+    def forget_stored(self):
+        """Drops the keys and hashes read so far, they are read from the files again"""
+        self.stored = {}
+
+    def pending_rows(self):
+        return sum(len(rows) for rows in self.pending.values())
+
+    def take_pending(self):
+        """Hands over the queued rows, so they can be written on another thread
+
+        Returns:
+            dict: The queued rows per month
+        """
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def write(self, pending):
+        """Writes rows as one new file per month
+
+        Args:
+            pending (dict): The rows per month, from take_pending
+        """
+        ingested_at = datetime.now(timezone.utc)
+
+        for month, rows in sorted(pending.items()):
+            directory = self.partition_dir(month)
+            os.makedirs(directory, exist_ok=True)
+
+            table = pa.Table.from_pydict(
+                {
+                    field: (
+                        [ingested_at] * len(rows)
+                        if field == "ingested_at"
+                        else [row[field] for row in rows]
+                    )
+                    for field in self.schema.names
+                },
+                schema=self.schema,
+            )
+
+            name = f"part-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            temp_path = os.path.join(directory, f".{name}.tmp")
+            # Readers only pick up complete files
+            pq.write_table(table, temp_path, compression="zstd")
+            os.replace(temp_path, os.path.join(directory, f"{name}.parquet"))
+
+            self.inc_stat("rows_written", len(rows))
+            self.inc_stat("files_written")
+
+    def flush(self):
+        """Writes the queued rows"""
+        self.write(self.take_pending())
+
+    def close(self):
+        self.flush()
+
+    def inc_stat(self, name, count=1):
+        if self.stats is not None and count:
+            self.stats.inc_value(f"analytics/{name}", count)
+
+
+def connect(root):
+    """Opens an in-memory DuckDB with views over the Parquet files of a store
+
+    transactions_all holds every stored version of a row, transactions only the
+    newest, with the signed volume and value of the buying and selling natures.
+
+    Args:
+        root (str): The directory of the store
+
+    Returns:
+        duckdb.DuckDBPyConnection: The connection
+    """
+    conn = duckdb.connect()
+    files = os.path.join(root, "transactions", "*", "*.parquet").replace("'", "''")
+    buy = ", ".join("'" + nature.replace("'", "''") + "'" for nature in BUY_NATURES)
+    sell = ", ".join("'" + nature.replace("'", "''") + "'" for nature in SELL_NATURES)
+
+    conn.execute(
+        f"""
+        CREATE VIEW transactions_all AS
+        SELECT * FROM read_parquet('{files}', hive_partitioning = true)"""
+    )
+    conn.execute(
+        f"""
+        CREATE VIEW transactions AS
+        SELECT * EXCLUDE (version),
+            CAST(volume * price AS DECIMAL(38, 6)) AS value,
+            CASE
+                WHEN nature_of_purchase IN ({buy}) THEN 1
+                WHEN nature_of_purchase IN ({sell}) THEN -1
+                ELSE 0
+            END AS direction,
+            direction * volume AS net_volume,
+            direction * value AS net_value
+        FROM (
+            SELECT *, row_number() OVER (
+                PARTITION BY row_key ORDER BY ingested_at DESC
+            ) AS version
+            FROM transactions_all
+        )
+        WHERE version = 1"""
+    )
+
+    return conn
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key when full"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Returns the value for a key and marks it as recently used
+
+        Args:
+            key (Hashable): The key to look up
+            default (Any): Value returned when the key is not cached
+
+        Returns:
+            Any: The cached value or the default
+        """
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            return default
+        return self.entries[key]
+
+    def put(self, key, value):
+        """Stores a value and evicts the oldest entry if the cache is full
+
+        Args:
+            key (Hashable): The key to store
+            value (Any): The value to store
+        """
+        if self.maxsize <= 0:
+            return
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Removes a key from the cache
+
+        Args:
+            key (Hashable): The key to remove
+            default (Any): Value returned when the key is not cached
+
+        Returns:
+            Any: The removed value or the default
+        """
+        return self.entries.pop(key, default)
+
+    def clear(self):
+        """Removes every entry from the cache"""
+        self.entries.clear()
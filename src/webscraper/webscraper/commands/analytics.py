@@ -0,0 +1,151 @@
+import glob
+import os
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from .. import analytics
+from ..dates import to_date
+
+
+class Command(ScrapyCommand):
+    """Queries the Parquet analytics store written by AnalyticsPipeline with DuckDB
+
+    The reports sum the signed volume and value of the buying and selling natures
+    per issuer, role, instrument or publication month. Any other question can be
+    asked with --sql against the transactions view.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    REPORTS = {
+        "issuer": "issuer",
+        "role": "role",
+        "instrument": "isin, instrument_name",
+        "month": "publication_month",
+    }
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Net insider buying and SQL queries on the analytics store"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--dir",
+            metavar="DIR",
+            help="the analytics store (default: ANALYTICS_DIR)",
+        )
+        parser.add_argument(
+            "--by",
+            choices=sorted(self.REPORTS),
+            default="issuer",
+            help="group the net buying by this column (default: issuer)",
+        )
+        parser.add_argument(
+            "--since",
+            metavar="YYYY-MM-DD",
+            help="first publication date included",
+        )
+        parser.add_argument(
+            "--until",
+            metavar="YYYY-MM-DD",
+            help="last publication date included",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=20, help="rows shown (default: 20)"
+        )
+        parser.add_argument(
+            "--sql",
+            metavar="QUERY",
+            help="run this query instead, on the views transactions and transactions_all",
+        )
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        if analytics.duckdb is None:
+            raise UsageError("duckdb is not installed", print_help=False)
+
+        directory = opts.dir or self.settings.get("ANALYTICS_DIR")
+        if not directory:
+            raise UsageError("No analytics store, set ANALYTICS_DIR", print_help=False)
+        if not glob.glob(os.path.join(directory, "transactions", "*", "*.parquet")):
+            raise UsageError(f"No Parquet files in {directory}", print_help=False)
+
+        conn = analytics.connect(directory)
+        if opts.sql:
+            query, params = opts.sql, []
+        else:
+            query, params = self.report_query(opts)
+
+        start = time.perf_counter()
+        result = conn.execute(query, params)
+        columns = [column[0] for column in result.description]
+        rows = result.fetchall()
+        elapsed = time.perf_counter() - start
+
+        self.print_table(columns, rows)
+        print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms")
+
+    def report_query(self, opts):
+        """Builds the net buying query of the --by report
+
+        Args:
+            opts (Namespace): The command options
+
+        Returns:
+            tuple: The query and its parameters
+        """
+        conditions, params = [], []
+        for option, operator in (("since", ">="), ("until", "<=")):
+            value = getattr(opts, option)
+            if value is None:
+                continue
+            day = to_date(value)
+            if day is None:
+                raise UsageError(f"--{option} is not a YYYY-MM-DD date")
+            # The month condition skips the partitions outside the window
+            conditions.append(f"publication_month {operator} ?")
+            conditions.append(f"publication_date {operator} ?")
+            params += [day.strftime("%Y-%m"), day]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        group = self.REPORTS[opts.by]
+
+        # Values are only summed within a currency
+        query = f"""
+            SELECT {group}, currency,
+                count(*) AS transactions,
+                sum(net_volume) FILTER (WHERE direction = 1) AS bought_volume,
+                -sum(net_volume) FILTER (WHERE direction = -1) AS sold_volume,
+                sum(net_volume) AS net_volume,
+                sum(net_value) AS net_value
+            FROM transactions
+            {where}
+            GROUP BY ALL
+            ORDER BY abs(sum(net_value)) DESC NULLS LAST
+            LIMIT {int(opts.limit)}"""
+
+        return query, params
+
+    def print_table(self, columns, rows):
+        """Prints rows as aligned columns
+
+        Args:
+            columns (list): The column names
+            rows (list): The rows
+        """
+        lines = [columns] + [
+            ["" if value is None else str(value) for value in row] for row in rows
+        ]
+        widths = [max(len(str(line[i])) for line in lines) for i in range(len(columns))]
+
+        for line in lines:
+            print(
+                "  ".join(str(value).ljust(width) for value, width in zip(line, widths))
+            )
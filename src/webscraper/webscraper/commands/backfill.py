@@ -0,0 +1,266 @@
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..pipelines import BulkLoadPipeline
+from ..storage import storage_backend
+from ..shards import ShardQueue, split_window
+
+
+class Command(ScrapyCommand):
+    """Collects a date window with several cas spider processes
+
+    The window is split into shards in a SQLite lease queue. Every worker slot
+    leases a shard and runs `scrapy crawl cas` for it in its own process, renewing
+    the lease while it runs. Shards whose crawl fails, or whose lease runs out
+    because their coordinator died, are leased again up to --attempts times.
+    """
+
+    requires_project = True
+
+    # Close reasons of a crawl that collected its whole window
+    SUCCESS_REASONS = ("finished", "End date reached!", "Maximum page reached!")
+
+    def syntax(self):
+        return "[options] [<start_date> <end_date>]"
+
+    def short_desc(self):
+        return "Collect a date window with several spider processes"
+
+    def long_desc(self):
+        return (
+            "Split the window from start_date down to end_date into shards and "
+            "collect them with several cas spider processes. Without dates the "
+            "shards left in the queue are collected."
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 2,
+            help="number of spider processes (default: number of cores)",
+        )
+        parser.add_argument(
+            "--days", type=int, default=30, help="days per shard (default: 30)"
+        )
+        parser.add_argument(
+            "--queue", metavar="FILE", help="shard queue (default: BACKFILL_QUEUE_FILE)"
+        )
+        parser.add_argument(
+            "--lease",
+            type=float,
+            default=300.0,
+            help="seconds before an unrenewed lease runs out",
+        )
+        parser.add_argument(
+            "--attempts",
+            type=int,
+            default=3,
+            help="tries per shard before it is failed",
+        )
+        parser.add_argument(
+            "--spool",
+            action="store_true",
+            help="spool every shard to disk and bulk load all of them at the end",
+        )
+        parser.add_argument(
+            "-a",
+            dest="spargs",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="set a spider argument of every shard (may be repeated)",
+        )
+
+    def run(self, args, opts):
+        if len(args) not in (0, 2):
+            raise UsageError()
+        if opts.workers < 1:
+            raise UsageError("At least one worker is needed", print_help=False)
+        if opts.spool and not storage_backend(self.settings).LOAD_DATA:
+            raise UsageError(
+                "--spool needs a backend with bulk loads", print_help=False
+            )
+
+        queue_path = opts.queue or self.settings.get(
+            "BACKFILL_QUEUE_FILE", ".state/backfill.sqlite3"
+        )
+        self.state_dir = os.path.join(os.path.dirname(queue_path) or ".", "shards")
+        self.spool_dir = self.settings.get("BULK_LOAD_SPOOL_DIR", ".spool")
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        queue = ShardQueue(queue_path, opts.lease, opts.attempts)
+
+        if args:
+            try:
+                shards = split_window(args[0], args[1], opts.days)
+            except ValueError as err:
+                raise UsageError(str(err), print_help=False)
+            print(f"Backfill: {queue.add(shards)} of {len(shards)} shards queued")
+
+        try:
+            self.run_workers(queue, opts)
+
+            counts = queue.counts()
+            print(f"Backfill: {counts}")
+
+            if opts.spool:
+                self.merge_spools(queue)
+
+            if counts.get("failed"):
+                self.exitcode = 1
+        finally:
+            queue.close()
+
+    def run_workers(self, queue, opts):
+        """Leases shards to the worker slots until the queue is drained
+
+        Args:
+            queue (ShardQueue): The shard queue
+            opts (argparse.Namespace): The command options
+        """
+        workers = {}
+
+        while workers or queue.unfinished():
+            for slot in range(opts.workers):
+                name = ShardQueue.worker_name(slot)
+
+                if slot in workers:
+                    shard, process = workers[slot]
+
+                    if process.poll() is None:
+                        if not queue.renew(shard[0], name):
+                            print(f"Backfill: lost the lease of shard {shard[0]}")
+                            process.terminate()
+                            process.wait()
+                            del workers[slot]
+                        continue
+
+                    del workers[slot]
+                    error = self.shard_error(shard, process.returncode)
+                    if error is None:
+                        queue.complete(shard[0], name)
+                    else:
+                        print(f"Backfill: shard {shard[0]} failed: {error}")
+                        queue.fail(shard[0], name, error)
+
+                shard = queue.lease(name)
+                if shard is not None:
+                    print(f"Backfill: shard {shard[0]} {shard[1]} - {shard[2]}")
+                    workers[slot] = (shard, self.start_crawl(shard, opts))
+
+            time.sleep(1)
+
+    def start_crawl(self, shard, opts):
+        """Starts the spider process of a shard
+
+        Args:
+            shard (tuple): The (id, start_date, end_date, attempts) of the shard
+            opts (argparse.Namespace): The command options
+
+        Returns:
+            subprocess.Popen: The spider process
+        """
+        shard_id, start_date, end_date, attempts = shard
+        prefix = os.path.join(self.state_dir, f"shard-{shard_id}")
+
+        command = [sys.executable, "-m", "scrapy", "crawl", "cas"]
+        command += ["-a", f"start_date={start_date}", "-a", f"end_date={end_date}"]
+        for arg in opts.spargs:
+            command += ["-a", arg]
+        for setting in opts.set:
+            command += ["-s", setting]
+
+        # Shards finish out of order, so none of them may move the high water mark
+        command += ["-s", "HIGH_WATER_MARK_FILE="]
+        command += ["-s", f"LOG_FILE={prefix}.log"]
+        command += ["-s", f"CRAWL_RESULT_FILE={prefix}.result.json"]
+
+        if opts.spool:
+            # A retried shard starts over, so the spool of the failed attempt goes
+            spool_dir = self.shard_spool_dir(shard_id)
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            command += ["-s", "MYSQL_BULK_LOAD=1", "-s", "BULK_LOAD_DEFERRED=1"]
+            command += ["-s", f"BULK_LOAD_SPOOL_DIR={spool_dir}"]
+        else:
+            command += ["-s", f"CHECKPOINT_FILE={prefix}.json"]
+            if attempts > 1:
+                command += ["-a", "resume=1"]
+
+        if os.path.exists(f"{prefix}.result.json"):
+            os.remove(f"{prefix}.result.json")
+
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    def shard_error(self, shard, returncode):
+        """Checks how the spider process of a shard ended
+
+        Args:
+            shard (tuple): The (id, start_date, end_date, attempts) of the shard
+            returncode (int): The exit code of the spider process
+
+        Returns:
+            str: Why the shard failed, or None if it was collected
+        """
+        if returncode != 0:
+            return f"exit code {returncode}"
+
+        path = os.path.join(self.state_dir, f"shard-{shard[0]}.result.json")
+        try:
+            with open(path, encoding="utf-8") as file:
+                result = json.load(file)
+        except (OSError, ValueError):
+            return "no crawl result"
+
+        if result["reason"] not in self.SUCCESS_REASONS:
+            return f"closed with {result['reason']}"
+        if result["errors"]:
+            return f"{result['errors']} errors logged"
+        # MySqlPipeline logs the items it drops as warnings
+        if result.get("dropped"):
+            return f"{result['dropped']} items dropped"
+
+        return None
+
+    def shard_spool_dir(self, shard_id):
+        return os.path.join(self.spool_dir, f"shard-{shard_id}")
+
+    def merge_spools(self, queue):
+        """Loads the spools of every collected shard in one bulk load
+
+        Args:
+            queue (ShardQueue): The shard queue
+        """
+        paths = []
+        for shard_id, *_ in queue.shards("done"):
+            paths.extend(
+                sorted(glob.glob(os.path.join(self.shard_spool_dir(shard_id), "*.gz")))
+            )
+
+        if not paths:
+            print("Backfill: no spools to load")
+            return
+
+        pipeline = BulkLoadPipeline(
+            spool_dir=self.spool_dir,
+            **BulkLoadPipeline.settings_kwargs(self.settings),
+        )
+
+        try:
+            pipeline.open_db()
+            pipeline.with_reconnect(pipeline.load_spools, paths)
+        finally:
+            pipeline.close_db()
+
+        for shard_id, *_ in queue.shards("done"):
+            shutil.rmtree(self.shard_spool_dir(shard_id), ignore_errors=True)
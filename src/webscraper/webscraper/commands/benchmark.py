@@ -0,0 +1,391 @@
+import glob
+import gzip
+import json
+import os
+import re
+import resource
+import time
+
+from collections import Counter, defaultdict
+
+import requests
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import CloseSpider, UsageError
+from scrapy.http import HtmlResponse, Request
+
+from ..metrics import CountingConnection, CountingCursor, statement_table
+from ..pipelines import DataCleansePipeline, MySqlPipeline
+from ..spiders.collect_all_spider import AllFinancialDataSpider
+from ..state import write_json_atomically
+
+
+class StageTimes:
+    """Wall time samples of every stage of the benchmark"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage, func):
+        """Returns a version of a function that records its wall time
+
+        Args:
+            stage (str): The stage the function belongs to
+            func (Callable): The function to time
+
+        Returns:
+            Callable: The timed function
+        """
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        return timed
+
+    def summary(self):
+        """Summarises the samples of every stage
+
+        Returns:
+            dict: The count, total seconds and latency percentiles in ms per stage
+        """
+        summary = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            summary[stage] = {
+                "count": len(ordered),
+                "total_s": round(sum(ordered), 6),
+                **{
+                    f"p{percentile}_ms": round(
+                        self.percentile(ordered, percentile) * 1000, 4
+                    )
+                    for percentile in (50, 90, 99)
+                },
+            }
+        return summary
+
+    @staticmethod
+    def percentile(ordered, percentile):
+        """Returns the nearest-rank percentile of sorted samples"""
+        if not ordered:
+            return 0.0
+        rank = max(0, -(-percentile * len(ordered) // 100) - 1)
+        return ordered[rank]
+
+
+class Command(ScrapyCommand):
+    """Replays recorded listing pages through the spider and the pipelines
+
+    Reports items per second, latency percentiles of every stage, database round
+    trips per item and peak memory as JSON, and fails when a result is worse than
+    the stored baseline by more than the tolerance. The repository ships 40
+    synthetic pages in the listing markup, --record replaces them with live ones.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    PAGE_FILE = re.compile(r"page-(\d+)\.html\.gz$")
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Benchmark the spider and pipelines on recorded pages"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--pages",
+            metavar="DIR",
+            help="recorded pages (default: BENCHMARK_PAGES_DIR)",
+        )
+        parser.add_argument(
+            "--record",
+            type=int,
+            metavar="N",
+            help="record the first N live listing pages instead of benchmarking, "
+            "replacing the synthetic pages of the same numbers",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="times the pages are replayed"
+        )
+        parser.add_argument(
+            "--no-db",
+            dest="db",
+            action="store_false",
+            help="leave out MySqlPipeline",
+        )
+        parser.add_argument(
+            "--schema",
+            help="throwaway database or SQLite file, dropped first (default: DB_SCHEMA_benchmark)",
+        )
+        parser.add_argument("-o", "--output", metavar="FILE", help="write JSON here")
+        parser.add_argument(
+            "--baseline",
+            metavar="FILE",
+            help="results to compare against (default: BENCHMARK_BASELINE_FILE)",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="store the results as the new baseline",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="allowed relative slowdown before a result is a regression",
+        )
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+
+        pages_dir = opts.pages or self.settings.get(
+            "BENCHMARK_PAGES_DIR", "benchmarks/pages"
+        )
+
+        if opts.record:
+            self.record_pages(pages_dir, opts.record)
+            return
+
+        pages = self.load_pages(pages_dir)
+        if not pages:
+            raise UsageError(
+                f"No pages in {pages_dir}, record live pages with --record N",
+                print_help=False,
+            )
+
+        results = self.replay(pages, opts)
+        baseline_path = opts.baseline or self.settings.get("BENCHMARK_BASELINE_FILE")
+
+        if opts.save_baseline:
+            if not baseline_path:
+                raise UsageError("No baseline file to save to", print_help=False)
+            write_json_atomically(baseline_path, results)
+        elif baseline_path and os.path.exists(baseline_path):
+            with open(baseline_path, encoding="utf-8") as file:
+                baseline = json.load(file)
+            results["regressions"] = self.regressions(results, baseline, opts.tolerance)
+            if results["regressions"]:
+                self.exitcode = 1
+
+        output = json.dumps(results, indent=2)
+        if opts.output:
+            with open(opts.output, "w", encoding="utf-8") as file:
+                file.write(output + "\n")
+        else:
+            print(output)
+
+    def record_pages(self, pages_dir, count):
+        """Downloads the first listing pages to gzipped files
+
+        Args:
+            pages_dir (str): The directory of the recorded pages
+            count (int): The number of pages to record
+        """
+        os.makedirs(pages_dir, exist_ok=True)
+        page_url = self.settings.get("CAS_PAGE_URL") or AllFinancialDataSpider.page_url
+        headers = {"User-Agent": self.settings.get("USER_AGENT")}
+        delay = self.settings.getfloat("DOWNLOAD_DELAY") or 2
+
+        for page in range(1, count + 1):
+            response = requests.get(page_url.format(page), headers=headers, timeout=30)
+            response.raise_for_status()
+
+            path = os.path.join(pages_dir, f"page-{page:05d}.html.gz")
+            with gzip.open(path, "wb") as file:
+                file.write(response.content)
+
+            print(f"Recorded {path}")
+            if page < count:
+                time.sleep(delay)
+
+    def load_pages(self, pages_dir):
+        """Reads the recorded pages
+
+        Args:
+            pages_dir (str): The directory of the recorded pages
+
+        Returns:
+            list: The (page number, body) of every page in page order
+        """
+        pages = []
+        for path in glob.glob(os.path.join(pages_dir, "page-*.html.gz")):
+            match = self.PAGE_FILE.search(path)
+            if match:
+                with gzip.open(path, "rb") as file:
+                    pages.append((int(match.group(1)), file.read()))
+
+        return sorted(pages)
+
+    def replay(self, pages, opts):
+        """Runs the recorded pages through the spider and the pipelines
+
+        Args:
+            pages (list): The (page number, body) of every page
+            opts (argparse.Namespace): The command options
+
+        Returns:
+            dict: The benchmark results
+        """
+        times = StageTimes()
+        statements = Counter()
+        commits = Counter()
+
+        spider = AllFinancialDataSpider(
+            start_date="9999-12-31", end_date="2000-01-01", page_jump=pages[0][0]
+        )
+        spider.COMPACT_ITEMS = self.settings.getbool("COMPACT_ITEMS")
+        spider.extract_item = times.wrap("extract_item", spider.extract_item)
+        parse = times.wrap("parse", lambda response: list(spider.parse(response)))
+
+        cleanse = times.wrap("cleanse", DataCleansePipeline().process_item)
+
+        store = pipeline = None
+        if opts.db:
+            pipeline = self.open_pipeline(opts, statements, commits)
+            if pipeline.batch_size > 0:
+                store = times.wrap("write_batch", pipeline.write_batch)
+            else:
+                store = times.wrap("write_item", pipeline.write_item)
+
+        items = 0
+        start = time.perf_counter()
+
+        try:
+            for _ in range(opts.repeat):
+                for page, body in pages:
+                    spider.CURRENT_PAGE_NUMBER = page
+                    request = Request(spider.page_url.format(page), meta={"page": page})
+                    response = HtmlResponse(
+                        url=request.url, body=body, encoding="utf-8", request=request
+                    )
+
+                    try:
+                        scraped = parse(response)
+                    except CloseSpider:
+                        continue
+
+                    batch = [
+                        cleanse(item, spider)
+                        for item in scraped
+                        if not isinstance(item, Request)
+                    ]
+                    items += len(batch)
+
+                    if pipeline is None:
+                        continue
+                    if pipeline.batch_size > 0:
+                        for offset in range(0, len(batch), pipeline.batch_size):
+                            store(batch[offset : offset + pipeline.batch_size])
+                    else:
+                        for item in batch:
+                            store(item)
+        finally:
+            if pipeline is not None:
+                pipeline.close_db_connection()
+
+        elapsed = time.perf_counter() - start
+        round_trips = sum(statements.values()) + commits["commits"]
+
+        return {
+            "pages": len(pages) * opts.repeat,
+            "items": items,
+            "seconds": round(elapsed, 6),
+            "items_per_second": round(items / elapsed, 2) if elapsed else 0.0,
+            "stages": times.summary(),
+            "db": {
+                "statements": sum(statements.values()),
+                "commits": commits["commits"],
+                "statements_by_table": dict(statements),
+                "round_trips_per_item": (
+                    round(round_trips / items, 4) if opts.db and items else None
+                ),
+            },
+            "peak_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "compact_items": spider.COMPACT_ITEMS,
+            "backend": pipeline.backend.name if pipeline is not None else None,
+        }
+
+    def open_pipeline(self, opts, statements, commits):
+        """Opens MySqlPipeline on an empty throwaway database
+
+        Args:
+            opts (argparse.Namespace): The command options
+            statements (Counter): Statements sent per table
+            commits (Counter): The number of commits
+
+        Returns:
+            MySqlPipeline: The open pipeline, counting its round trips
+        """
+        pipeline = MySqlPipeline(**MySqlPipeline.settings_kwargs(self.settings))
+        pipeline.backend.use_throwaway(opts.schema)
+        pipeline.high_water_mark_file = None
+
+        pipeline.open_db()
+
+        # Only the writes of the replay are counted, not the schema setup
+        pipeline.statements = {}
+
+        def count_statement(query):
+            statements[statement_table(query)] += 1
+
+        def count_commit():
+            commits["commits"] += 1
+
+        pipeline.conn = CountingConnection(pipeline.conn, count_statement, count_commit)
+        pipeline.cursor = CountingCursor(pipeline.cursor, count_statement)
+
+        return pipeline
+
+    def regressions(self, results, baseline, tolerance):
+        """Compares results with the baseline
+
+        Args:
+            results (dict): The results of this run
+            baseline (dict): The stored results
+            tolerance (float): The allowed relative slowdown
+
+        Returns:
+            list: A description of every result that got worse
+        """
+        found = []
+
+        def worse(name, value, reference, higher_is_better=False):
+            if value is None or not reference:
+                return
+            change = (value - reference) / reference
+            if higher_is_better:
+                change = -change
+            if change > tolerance:
+                found.append(f"{name}: {reference} -> {value}")
+
+        worse(
+            "items_per_second",
+            results["items_per_second"],
+            baseline.get("items_per_second"),
+            higher_is_better=True,
+        )
+        worse(
+            "round_trips_per_item",
+            results["db"]["round_trips_per_item"],
+            baseline.get("db", {}).get("round_trips_per_item"),
+        )
+        worse(
+            "peak_memory_kb",
+            results["peak_memory_kb"],
+            baseline.get("peak_memory_kb"),
+        )
+
+        for stage, summary in results["stages"].items():
+            reference = baseline.get("stages", {}).get(stage, {})
+            for key in ("p50_ms", "p90_ms"):
+                worse(f"{stage} {key}", summary[key], reference.get(key))
+
+        return found
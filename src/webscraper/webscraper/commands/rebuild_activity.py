@@ -0,0 +1,80 @@
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..activity import ActivityTables
+from ..dates import date_range, to_date
+from ..storage import storage_backend
+
+
+class Command(ScrapyCommand):
+    """Recomputes the activity tables from Transactions
+
+    Crawls only refresh the tables as they write with ACTIVITY_TABLES_ENABLED
+    on, otherwise this brings them up to date after a crawl. It also repairs
+    them after rows were changed by hand. Days are committed in chunks, so a
+    long rebuild does not hold one huge transaction.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] [<start_date> <end_date>]"
+
+    def short_desc(self):
+        return "Rebuild the daily and monthly activity tables"
+
+    def long_desc(self):
+        return (
+            "Recompute the activity rows of every transaction date between "
+            "start_date and end_date, or clear the tables and recompute every "
+            "transaction date without dates."
+        )
+
+    def run(self, args, opts):
+        if len(args) not in (0, 2):
+            raise UsageError()
+
+        backend = storage_backend(self.settings)
+        activity = ActivityTables()
+        conn = backend.connect()
+        cursor = conn.cursor()
+
+        try:
+            activity.create_tables(cursor)
+
+            if args:
+                dates = [to_date(value) for value in args]
+                if None in dates:
+                    raise UsageError("Dates must be in YYYY-MM-DD format")
+                first, last = sorted(dates)
+                # Every day, so rows of days without transactions are removed
+                days = list(date_range(first, last))
+            else:
+                activity.clear(cursor)
+                days = activity.transaction_days(cursor)
+
+            start = time.perf_counter()
+            for offset in range(0, len(days), activity.CHUNK_SIZE):
+                chunk = days[offset : offset + activity.CHUNK_SIZE]
+                activity.refresh(cursor, chunk)
+                conn.commit()
+                print(f"Activity: refreshed {chunk[0]} to {chunk[-1]}")
+            # Commits the clearing when there are no transactions
+            conn.commit()
+
+            print(
+                f"Activity: {len(days)} days rebuilt in "
+                f"{time.perf_counter() - start:.1f} s"
+            )
+
+        except backend.Error as err:
+            conn.rollback()
+            print(f"Error: {err}")
+            self.exitcode = 1
+
+        finally:
+            cursor.close()
+            conn.close()
@@ -0,0 +1,57 @@
+from scrapy.commands import BaseRunSpiderCommand
+from scrapy.exceptions import UsageError
+
+
+class Command(BaseRunSpiderCommand):
+    """Runs the cas spider in watch mode until it is stopped
+
+    New rows are written one at a time so they are committed as soon as they are
+    seen. The checkpoint, the listing cache and the fingerprint store only make
+    sense for date windows and are left out.
+    """
+
+    requires_project = True
+    default_settings = {
+        "MYSQL_BATCH_SIZE": 0,
+        "CHECKPOINT_FILE": None,
+        "LISTING_CACHE_ENABLED": False,
+        "FINGERPRINT_FILE": None,
+    }
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Poll the first listing pages and store new rows as they appear"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            metavar="SECONDS",
+            help="seconds between polls after new rows, WATCH_MIN_INTERVAL if unset",
+        )
+        parser.add_argument(
+            "--max-interval",
+            type=float,
+            metavar="SECONDS",
+            help="longest wait between polls, WATCH_MAX_INTERVAL if unset",
+        )
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        if opts.min_interval is not None:
+            self.settings.set("WATCH_MIN_INTERVAL", opts.min_interval, "cmdline")
+        if opts.max_interval is not None:
+            self.settings.set("WATCH_MAX_INTERVAL", opts.max_interval, "cmdline")
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+
+        self.crawler_process.crawl("cas", watch="1", **opts.spargs)
+        self.crawler_process.start()
+
+        if self.crawler_process.bootstrap_failed:
+            self.exitcode = 1
@@ -0,0 +1,131 @@
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+
+def to_date(value):
+    """Converts a YYYY-MM-DD string, datetime or date into a date
+
+    Args:
+        value (str | date | datetime): The value to convert
+
+    Returns:
+        date: The date, or None if the value is not a valid date
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value.strip()[:10])
+    except (AttributeError, ValueError):
+        return None
+
+
+def date_range(first, last):
+    """Yields every date from first to last, both included
+
+    Args:
+        first (date): The first date
+        last (date): The last date
+
+    Yields:
+        date: The next date of the range
+    """
+    for offset in range((last - first).days + 1):
+        yield first + timedelta(days=offset)
+
+
+class DateCalendar:
+    """In-memory date -> id mapping of the Dates table
+
+    The table is a dense calendar, so it is stored as runs of consecutive dates
+    with consecutive ids and an id is computed from the start of its run.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.runs = []
+
+    def __len__(self):
+        return sum(length for _, _, length in self.runs)
+
+    @property
+    def first_date(self):
+        return self.runs[0][0] if self.runs else None
+
+    @property
+    def last_date(self):
+        if not self.runs:
+            return None
+        start, _, length = self.runs[-1]
+        return start + timedelta(days=length - 1)
+
+    def load(self, rows):
+        """Adds (id, date) rows to the calendar
+
+        Args:
+            rows (Iterable): The (id, date) rows of the Dates table
+        """
+        for row_id, value in sorted(rows, key=lambda row: to_date(row[1]) or date.min):
+            self.add(to_date(value), row_id)
+
+    def add(self, value, row_id):
+        """Adds a single date, extending a run when it follows on from one
+
+        Args:
+            value (date): The date
+            row_id (int): The id of the date in the Dates table
+        """
+        if value is None or self.id_of(value) is not None:
+            return
+
+        position = bisect_right(self.starts, value)
+
+        if position > 0:
+            start, first_id, length = self.runs[position - 1]
+            if start + timedelta(days=length) == value and first_id + length == row_id:
+                self.runs[position - 1] = (start, first_id, length + 1)
+                self.merge(position - 1)
+                return
+
+        self.starts.insert(position, value)
+        self.runs.insert(position, (value, row_id, 1))
+        self.merge(position)
+
+    def merge(self, position):
+        """Merges the run at position with the next run if they are contiguous"""
+        if position + 1 >= len(self.runs):
+            return
+
+        start, first_id, length = self.runs[position]
+        next_start, next_id, next_length = self.runs[position + 1]
+
+        if (
+            start + timedelta(days=length) == next_start
+            and first_id + length == next_id
+        ):
+            self.runs[position] = (start, first_id, length + next_length)
+            del self.runs[position + 1]
+            del self.starts[position + 1]
+
+    def id_of(self, value):
+        """Computes the id of a date
+
+        Args:
+            value (str | date): The date, or a string in YYYY-MM-DD format
+
+        Returns:
+            int: The id, or None if the date is not in the calendar
+        """
+        value = to_date(value)
+        if value is None:
+            return None
+
+        position = bisect_right(self.starts, value) - 1
+        if position < 0:
+            return None
+
+        start, first_id, length = self.runs[position]
+        offset = (value - start).days
+
+        return first_id + offset if offset < length else None
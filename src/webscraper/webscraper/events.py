@@ -0,0 +1,184 @@
+import json
+import time
+
+from collections import deque
+from datetime import date
+from decimal import Decimal
+
+from itemadapter import ItemAdapter
+from twisted.web import resource, server
+
+
+def transaction_event(item):
+    """Builds the event published for a committed item
+
+    Args:
+        item (scrapy.Item): The committed item
+
+    Returns:
+        dict: The database ids of the row and its cleansed fields
+    """
+    fields = ItemAdapter(item).asdict()
+    ids = fields.pop("ids", None)
+    fields.pop("page", None)
+
+    return {"ids": ids or {}, "transaction": fields}
+
+
+def json_value(value):
+    """Serializes the values json does not handle itself
+
+    Args:
+        value (Any): A date or a decimal of a cleansed item
+
+    Returns:
+        str: The value as text
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class EventChannel:
+    """Fans events out to the connected clients, keeping the latest ones for replay
+
+    Event ids are the start time of the channel and a sequence number, so a client
+    reconnecting with its last id gets the events it missed while they are still
+    buffered. A client that missed more than that, or whose id belongs to an
+    earlier crawl, is sent a reset event first and should query the database.
+    """
+
+    def __init__(self, replay_size: int = 1000, stats=None):
+        self.run = str(int(time.time()))
+        self.sequence = 0
+        self.replay = deque(maxlen=replay_size)
+        self.clients = set()
+        self.stats = stats
+
+    def publish(self, name, data):
+        """Sends an event to every client and adds it to the replay buffer
+
+        Args:
+            name (str): The event type
+            data (dict): The event payload
+        """
+        self.sequence += 1
+        message = (
+            f"id: {self.run}-{self.sequence}\n"
+            f"event: {name}\n"
+            f"data: {json.dumps(data, default=json_value)}\n\n"
+        ).encode("utf-8")
+
+        self.replay.append((self.sequence, message))
+        for request in self.clients:
+            request.write(message)
+
+        self.inc_stat("published")
+
+    def subscribe(self, request, last_event_id=None):
+        """Adds a client, first replaying the buffered events after its last id
+
+        Args:
+            request (Request): The open event stream request
+            last_event_id (str): The id of the last event the client received
+        """
+        for message in self.missed(last_event_id):
+            request.write(message)
+
+        self.clients.add(request)
+        self.inc_stat("subscribed")
+        if self.stats is not None:
+            self.stats.max_value("events/clients_max", len(self.clients))
+
+    def unsubscribe(self, request):
+        self.clients.discard(request)
+
+    def missed(self, last_event_id):
+        """Returns the buffered events a client has not received
+
+        Args:
+            last_event_id (str): The id of the last event the client received
+
+        Returns:
+            list: The messages to replay, led by a reset event if some are gone
+        """
+        if not last_event_id:
+            return []
+
+        run, _, sequence = last_event_id.partition("-")
+        oldest = self.replay[0][0] if self.replay else self.sequence + 1
+
+        if run == self.run and sequence.isdigit() and int(sequence) >= oldest - 1:
+            return [
+                message for number, message in self.replay if number > int(sequence)
+            ]
+
+        self.inc_stat("resets")
+        reset = (
+            f"event: reset\ndata: {json.dumps({'last_event_id': last_event_id})}\n\n"
+        )
+        return [reset.encode("utf-8")] + [message for _, message in self.replay]
+
+    def keep_alive(self):
+        """Writes a comment to idle clients so proxies keep their connections open"""
+        for request in self.clients:
+            request.write(b": keep-alive\n\n")
+
+    def close(self):
+        """Ends every open event stream"""
+        for request in list(self.clients):
+            request.finish()
+        self.clients.clear()
+
+    def inc_stat(self, name, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f"events/{name}", count)
+
+
+class EventStreamResource(resource.Resource):
+    """Server-Sent Events endpoint of an EventChannel
+
+    The last event id is read from the Last-Event-ID header browsers send when
+    they reconnect, or from the last_event_id query argument.
+    """
+
+    isLeaf = True
+
+    def __init__(self, channel):
+        super().__init__()
+        self.channel = channel
+
+    def render_GET(self, request):
+        request.setHeader(b"content-type", b"text/event-stream; charset=utf-8")
+        request.setHeader(b"cache-control", b"no-cache")
+
+        last_event_id = request.getHeader(b"last-event-id")
+        if last_event_id is None:
+            last_event_id = request.args.get(b"last_event_id", [b""])[0]
+        last_event_id = last_event_id.decode("utf-8", "replace")
+
+        # Sends the headers right away and asks clients to reconnect quickly
+        request.write(b"retry: 2000\n\n")
+        self.channel.subscribe(request, last_event_id)
+        request.notifyFinish().addBoth(lambda _: self.channel.unsubscribe(request))
+
+        return server.NOT_DONE_YET
+
+
+def event_site(channel):
+    """Builds the site serving the event stream of a channel under /events
+
+    Args:
+        channel (EventChannel): The channel to serve
+
+    Returns:
+        Site: The twisted.web site
+    """
+    root = resource.Resource()
+    root.putChild(b"events", EventStreamResource(channel))
+
+    site = server.Site(root)
+    site.noisy = False
+    return site
@@ -0,0 +1,262 @@
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+from .fingerprints import FingerprintStore
+from .items import row_page
+from .metrics import dropped_table, prometheus_text
+from .state import write_json_atomically, write_text_atomically
+from .storage import bulk_load_enabled
+
+
+class CheckpointExtension:
+    """Writes the checkpoint of the spider to disk while the crawl runs
+
+    Items are only counted once they have left every pipeline, which is after the
+    MySQL pipeline has committed them, so the checkpoint never gets ahead of the
+    database.
+    """
+
+    def __init__(self, path: str, interval: float = 30.0):
+        self.path = path
+        self.interval = interval
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get("CHECKPOINT_FILE")
+
+        # Bulk loads only commit when the spider closes, so there is nothing to resume
+        if not path or bulk_load_enabled(settings):
+            raise NotConfigured
+
+        extension = cls(path, settings.getfloat("CHECKPOINT_INTERVAL", 30.0))
+
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(extension.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(extension.item_error, signal=signals.item_error)
+
+        return extension
+
+    def spider_opened(self, spider):
+        self.loop = task.LoopingCall(self.save, spider)
+        self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+
+        checkpoint = getattr(spider, "CHECKPOINT", None)
+        if checkpoint is not None:
+            checkpoint.finished = None if reason == "shutdown" else reason
+            self.save(spider, force=True)
+
+    def item_scraped(self, item, response, spider):
+        self.settle(spider, item, response, committed=True)
+
+    def item_dropped(self, item, response, exception, spider):
+        self.settle(spider, item, response, committed=False)
+
+    def item_error(self, item, response, spider, failure):
+        self.settle(spider, item, response, committed=False)
+
+    def settle(self, spider, item, response, committed):
+        """Records an item that has left the pipelines on the checkpoint of the spider
+
+        The page is read from the item, since rows of a probed page are parsed in
+        the callback of a later probe.
+
+        Args:
+            spider (scrapy.Spider): The running spider
+            item (scrapy.Item): The item
+            response (Response): The response the item was scraped from
+            committed (bool): True if the item was stored
+        """
+        checkpoint = getattr(spider, "CHECKPOINT", None)
+        if checkpoint is None:
+            return
+
+        checkpoint.item_settled(row_page(item), item, committed)
+
+    def save(self, spider, force=False):
+        """Writes the checkpoint if it has changed since it was last written
+
+        Args:
+            spider (scrapy.Spider): The running spider
+            force (bool): Write the checkpoint even if it has not changed
+        """
+        checkpoint = getattr(spider, "CHECKPOINT", None)
+        if checkpoint is None or not (checkpoint.dirty or force):
+            return
+
+        try:
+            checkpoint.save(self.path)
+        except OSError as err:
+            spider.logger.error(f"Could not write checkpoint: {err}")
+
+
+class CrawlResultExtension:
+    """Writes how a crawl ended to CRAWL_RESULT_FILE for the process that started it"""
+
+    def __init__(self, path: str, stats):
+        self.path = path
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("CRAWL_RESULT_FILE")
+        if not path:
+            raise NotConfigured
+
+        extension = cls(path, crawler.stats)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+
+        return extension
+
+    def spider_closed(self, spider, reason):
+        write_json_atomically(
+            self.path,
+            {
+                "reason": reason,
+                "items": self.stats.get_value("item_scraped_count", 0),
+                "dropped": self.stats.get_value("item_dropped_count", 0),
+                "errors": self.stats.get_value("log_count/ERROR", 0),
+            },
+        )
+
+
+class MetricsExtension:
+    """Reports the stage timings and database counters of the crawler stats
+
+    A summary is logged every METRICS_INTERVAL seconds and, with
+    METRICS_PROMETHEUS_FILE set, the counters are written to that file in the
+    Prometheus text format for the node exporter textfile collector.
+    """
+
+    def __init__(self, stats, interval: float = 60.0, path: str = None):
+        self.stats = stats
+        self.interval = interval
+        self.path = path
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        interval = settings.getfloat("METRICS_INTERVAL", 60.0)
+        path = settings.get("METRICS_PROMETHEUS_FILE")
+
+        if interval <= 0 and not path:
+            raise NotConfigured
+
+        extension = cls(crawler.stats, interval, path)
+
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.item_dropped, signal=signals.item_dropped)
+
+        return extension
+
+    def spider_opened(self, spider):
+        if self.interval > 0:
+            self.loop = task.LoopingCall(self.report, spider)
+            self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+
+        self.report(spider)
+
+    def item_dropped(self, item, response, exception, spider):
+        self.stats.inc_value(f"dropped/{dropped_table(str(exception))}")
+
+    def report(self, spider):
+        """Logs a summary of the stats and writes the Prometheus file
+
+        Args:
+            spider (scrapy.Spider): The running spider
+        """
+        # The database thread adds keys while the copy is taken by the reactor
+        stats = dict(self.stats.get_stats())
+
+        stages = []
+        for key, seconds in stats.items():
+            if key.startswith("timing/") and key.endswith("/seconds"):
+                stage = key[len("timing/") : -len("/seconds")]
+                calls = stats.get(f"timing/{stage}/count") or 1
+                stages.append((seconds, stage, calls))
+
+        slowest = ", ".join(
+            f"{stage} {seconds:.1f}s ({seconds / calls * 1000:.2f} ms/call)"
+            for seconds, stage, calls in sorted(stages, reverse=True)[:5]
+        )
+        statements = sum(
+            value for key, value in stats.items() if key.startswith("mysql/statements/")
+        )
+        dropped = sum(
+            value for key, value in stats.items() if key.startswith("dropped/")
+        )
+
+        spider.logger.info(
+            f"Metrics: {stats.get('item_scraped_count', 0)} items, "
+            f"{statements} statements, {stats.get('mysql/commits', 0)} commits, "
+            f"{dropped} dropped; {slowest or 'no timings'}"
+        )
+
+        if self.path:
+            try:
+                write_text_atomically(self.path, prometheus_text(stats))
+            except OSError as err:
+                spider.logger.error(f"Could not write metrics: {err}")
+
+
+class FingerprintExtension:
+    """Opens the fingerprint store the spider checks its rows against
+
+    The hashes of rows are stored as the rows leave the pipelines, after the MySQL
+    pipeline has committed them, and forgotten again when they are dropped.
+    """
+
+    def __init__(self, path: str, stats=None):
+        self.path = path
+        self.stats = stats
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get("FINGERPRINT_FILE")
+
+        # Bulk loads only commit when the spider closes
+        if not path or bulk_load_enabled(settings):
+            raise NotConfigured
+
+        extension = cls(path, crawler.stats)
+
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(extension.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(extension.item_error, signal=signals.item_error)
+
+        return extension
+
+    def spider_opened(self, spider):
+        self.store = FingerprintStore(self.path, self.stats)
+        spider.FINGERPRINTS = self.store
+
+    def spider_closed(self, spider):
+        if self.store is not None:
+            self.store.close()
+
+    def item_scraped(self, item, response, spider):
+        self.store.row_committed(item)
+
+    def item_dropped(self, item, response, exception, spider):
+        self.store.row_failed(item)
+
+    def item_error(self, item, response, spider, failure):
+        self.store.row_failed(item)
@@ -0,0 +1,252 @@
+import hashlib
+import os
+import sqlite3
+
+from .items import WebscraperItem, transaction_identity
+
+# Every scraped field, so a changed status makes a row differ. The occurrence of
+# a repeated row is part of its key instead, and rows move between pages.
+FIELDS = tuple(
+    field
+    for field in WebscraperItem.fields
+    if field not in ("ids", "occurrence", "page")
+)
+
+
+def row_key(item):
+    """Returns the key of a row in the fingerprint store
+
+    The key covers every field the natural key of Transactions is built from, so
+    a changed row is one MySqlPipeline updates in place. A row corrected in any
+    of them is a new row.
+
+    Args:
+        item (scrapy.Item): A scraped or cleansed row
+
+    Returns:
+        bytes: A digest of the transaction identity, the same before and after cleansing
+    """
+    return hashlib.blake2b(
+        "\x1f".join(transaction_identity(item)).encode("utf-8"), digest_size=16
+    ).digest()
+
+
+def row_digest(item):
+    """Returns the content hash of a scraped row
+
+    Args:
+        item (scrapy.Item): A row as the spider scraped it
+
+    Returns:
+        bytes: A digest of every field of the row
+    """
+    return hashlib.blake2b(
+        "\x1f".join(
+            "" if item[field] is None else item[field] for field in FIELDS
+        ).encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+class FingerprintStore:
+    """SQLite backed content hashes of listing pages and of their rows
+
+    A row is passed on when its identity is new or its content hash changed, and a
+    page whose hash is unchanged skips the row lookups altogether. Hashes are only
+    stored once the rows they cover have been committed, so a row that never made
+    it to the database is offered again on the next crawl.
+    """
+
+    def __init__(self, path: str, stats=None):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.stats = stats
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS Pages (
+                page INTEGER PRIMARY KEY,
+                digest BLOB NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS Rows (
+                identity BLOB PRIMARY KEY,
+                digest BLOB NOT NULL
+            ) WITHOUT ROWID"""
+        )
+
+        # Hashes waiting for their rows to be committed, a list per row key as
+        # the same row can be passed on from more than one page
+        self.pending_pages = {}
+        self.pending_rows = {}
+        self.rows_to_save = []
+
+    def changed_rows(self, page, items):
+        """Returns the rows of a page that are new or changed since the last crawl
+
+        Args:
+            page (int): The page number
+            items (list): The rows of the page the spider would pass on
+
+        Returns:
+            list: The new and changed rows, in page order
+        """
+        digests = [row_digest(item) for item in items]
+        page_digest = hashlib.blake2b(b"".join(digests), digest_size=16).digest()
+
+        stored = self.conn.execute(
+            "SELECT digest FROM Pages WHERE page = ?", (page,)
+        ).fetchone()
+        if stored is not None and stored[0] == page_digest:
+            self.inc_stat("pages_unchanged")
+            self.inc_stat("rows_unchanged", len(items))
+            return []
+
+        keys = [row_key(item) for item in items]
+        known = self.stored_digests(keys)
+
+        changed = []
+        for item, key, digest in zip(items, keys, digests):
+            previous = known.get(key)
+            if previous == digest:
+                self.inc_stat("rows_unchanged")
+                continue
+
+            self.inc_stat("rows_new" if previous is None else "rows_changed")
+            self.pending_rows.setdefault(key, []).append((digest, page))
+            changed.append(item)
+
+        self.inc_stat("pages_compared")
+        self.pending_pages[page] = [page_digest, len(changed), False]
+        self.settle_page(page)
+
+        return changed
+
+    def stored_digests(self, keys):
+        """Reads the stored content hashes of rows
+
+        Args:
+            keys (list): The row keys
+
+        Returns:
+            dict: The stored hash per row key
+        """
+        if not keys:
+            return {}
+
+        placeholders = ", ".join("?" * len(keys))
+        return dict(
+            self.conn.execute(
+                f"SELECT identity, digest FROM Rows WHERE identity IN ({placeholders})",
+                keys,
+            )
+        )
+
+    def row_committed(self, item):
+        """Stores the hash of a row that has been committed
+
+        Args:
+            item (scrapy.Item): The committed row
+        """
+        key = row_key(item)
+        pending = self.take_pending(key)
+        if pending is None:
+            return
+
+        digest, page = pending
+        self.rows_to_save.append((key, digest))
+
+        state = self.pending_pages.get(page)
+        if state is not None:
+            state[1] -= 1
+            self.settle_page(page)
+
+    def row_failed(self, item):
+        """Forgets the hash of a row that was dropped, so it is offered again
+
+        Args:
+            item (scrapy.Item): The dropped row
+        """
+        pending = self.take_pending(row_key(item))
+        if pending is None:
+            return
+
+        state = self.pending_pages.get(pending[1])
+        if state is not None:
+            state[1] -= 1
+            state[2] = True
+            self.settle_page(pending[1])
+
+    def take_pending(self, key):
+        """Removes the oldest hash waiting for a row to be committed
+
+        Args:
+            key (bytes): The row key
+
+        Returns:
+            tuple: The content hash and page of the row, None if nothing waits
+        """
+        pending = self.pending_rows.get(key)
+        if not pending:
+            return None
+
+        if len(pending) == 1:
+            del self.pending_rows[key]
+        return pending.pop(0)
+
+    def settle_page(self, page):
+        """Stores the hash of a page once all its rows have left the pipelines
+
+        Args:
+            page (int): The page number
+        """
+        digest, remaining, failed = self.pending_pages[page]
+        if remaining > 0:
+            return
+
+        del self.pending_pages[page]
+        self.save(page, None if failed else digest)
+
+    def save(self, page=None, page_digest=None):
+        """Writes the hashes of the committed rows in one transaction
+
+        Args:
+            page (int): A settled page whose hash is written as well
+            page_digest (bytes): The hash of the page, None if it is not complete
+        """
+        if page is None and not self.rows_to_save:
+            return
+
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO Rows (identity, digest) VALUES (?, ?)",
+                self.rows_to_save,
+            )
+            if page is not None and page_digest is None:
+                self.conn.execute("DELETE FROM Pages WHERE page = ?", (page,))
+            elif page is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO Pages (page, digest) VALUES (?, ?)",
+                    (page, page_digest),
+                )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        self.rows_to_save = []
+
+    def close(self):
+        self.save()
+        self.conn.close()
+
+    def inc_stat(self, name, count=1):
+        if self.stats is not None and count:
+            self.stats.inc_value(f"fingerprints/{name}", count)
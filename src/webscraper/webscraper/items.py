@@ -1,5 +1,8 @@
 import scrapy
 
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
 
 class WebscraperItem(scrapy.Item):
     publication_date = scrapy.Field()
@@ -17,3 +20,144 @@ class WebscraperItem(scrapy.Item):
     price = scrapy.Field()
     currency = scrapy.Field()
     status = scrapy.Field()
+    # Position among identical rows of the same page, set from the second one on
+    occurrence = scrapy.Field()
+    # Database ids of the committed row, set by MySqlPipeline for the event stream
+    ids = scrapy.Field()
+    # Listing page the row was scraped from, set by the spider for the checkpoint
+    page = scrapy.Field()
+
+
+@dataclass(slots=True)
+class WebscraperRecord:
+    """Compact row with the fields of WebscraperItem, used when COMPACT_ITEMS is set
+
+    The fields live in slots instead of a dict per row, which keeps rows small and
+    field access cheap. Fields are read and written by key like on a scrapy.Item,
+    so the pipelines handle both, and Scrapy adapts it as a dataclass item.
+    """
+
+    publication_date: object = None
+    issuer: object = None
+    name: object = None
+    role: object = None
+    related: object = None
+    nature_of_purchase: object = None
+    instrument_name: object = None
+    instrument_type: object = None
+    isin: object = None
+    transaction_date: object = None
+    volume: object = None
+    volume_unit: object = None
+    price: object = None
+    currency: object = None
+    status: object = None
+    occurrence: object = None
+    ids: object = None
+    page: object = None
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field, value):
+        try:
+            setattr(self, field, value)
+        except AttributeError:
+            raise KeyError(
+                f"WebscraperRecord does not support field: {field}"
+            ) from None
+
+
+def row_identity(item):
+    """Identity of a listing row that stays the same before and after cleansing
+
+    Args:
+        item (scrapy.Item): A scraped, cleansed or stored row
+
+    Returns:
+        tuple: The normalised natural key of the row
+    """
+    identity = (
+        _identity_text(item["publication_date"])[:10],
+        _identity_text(item["issuer"]),
+        _identity_text(item["name"]),
+        _identity_text(item["isin"]),
+        _identity_text(item["instrument_name"]),
+        _identity_text(item["nature_of_purchase"]),
+        _identity_text(item["transaction_date"])[:10],
+        _identity_number(item["volume"]),
+        _identity_number(item["price"]),
+    )
+
+    # Repeated rows are told apart, the first one keeps the plain identity
+    occurrence = row_occurrence(item)
+    if occurrence > 1:
+        identity += (str(occurrence),)
+
+    return identity
+
+
+def transaction_identity(item):
+    """Identity of the Transactions row a listing row is stored as
+
+    Extends the row identity with the fields the natural key of Transactions is
+    built from as well, so rows with the same identity are stored in one row.
+
+    Args:
+        item (scrapy.Item): A scraped, cleansed or stored row
+
+    Returns:
+        tuple: The normalised natural key of the row
+    """
+    return row_identity(item) + (
+        _identity_text(item["instrument_type"]),
+        _identity_text(item["volume_unit"]),
+        _identity_text(item["currency"]),
+    )
+
+
+def row_occurrence(item):
+    """Position of a row among the identical rows of its page
+
+    Args:
+        item (scrapy.Item): A scraped, cleansed or stored row
+
+    Returns:
+        int: 1 for the first or only row, 2 for its first repeat and so on
+    """
+    try:
+        return int(item["occurrence"] or 1)
+    except KeyError:
+        return 1
+
+
+def row_page(item):
+    """Listing page a row was scraped from
+
+    Args:
+        item (scrapy.Item): A scraped, cleansed or stored row
+
+    Returns:
+        int: The page number, or None if the row was not scraped from a page
+    """
+    try:
+        return item["page"]
+    except KeyError:
+        return None
+
+
+def _identity_text(value):
+    if value is None:
+        return ""
+    return " ".join(str(value).split())
+
+
+def _identity_number(value):
+    text = "".join(_identity_text(value).split()).replace(",", ".")
+    try:
+        return format(Decimal(text).normalize(), "f")
+    except InvalidOperation:
+        return text
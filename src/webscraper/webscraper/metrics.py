@@ -0,0 +1,242 @@
+import functools
+import inspect
+import re
+import time
+
+# Tables named by the pipeline error messages, used to count dropped items
+TABLES = (
+    "Companies",
+    "Currencies",
+    "Dates",
+    "Instruments",
+    "People",
+    "Roles",
+    "Transactions",
+)
+TABLE_PATTERN = re.compile(
+    r"\b(?:FROM|INTO(?:\s+TABLE)?|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+`?(\w+)",
+    re.IGNORECASE,
+)
+DROPPED_PATTERN = re.compile(rf"\b({'|'.join(TABLES)})\b")
+
+
+def timed(func):
+    """Records the wall time and number of calls of a method in the stats of its instance
+
+    The stats are kept under timing/<Class.method>/seconds, /count and /max_seconds.
+    For generators only the time spent inside the generator is counted. Instances
+    without stats are not timed.
+
+    Args:
+        func (Callable): The method to time
+
+    Returns:
+        Callable: The timed method
+    """
+    stage = func.__qualname__
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def timed_generator(self, *args, **kwargs):
+            generator = func(self, *args, **kwargs)
+            if self.stats is None:
+                return (yield from generator)
+
+            elapsed = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        value = next(generator)
+                    except StopIteration as stop:
+                        return stop.value
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield value
+            finally:
+                record_time(self.stats, stage, elapsed)
+
+        return timed_generator
+
+    @functools.wraps(func)
+    def timed_method(self, *args, **kwargs):
+        if self.stats is None:
+            return func(self, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            record_time(self.stats, stage, time.perf_counter() - start)
+
+    return timed_method
+
+
+def record_time(stats, stage, elapsed):
+    """Adds a timing sample of a stage to the stats
+
+    Args:
+        stats (StatsCollector): The crawler stats
+        stage (str): The name of the stage
+        elapsed (float): The wall time in seconds
+    """
+    stats.inc_value(f"timing/{stage}/count")
+    stats.inc_value(f"timing/{stage}/seconds", elapsed, start=0.0)
+    stats.max_value(f"timing/{stage}/max_seconds", elapsed)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_table(query):
+    """Returns the table a SQL statement works on
+
+    Args:
+        query (str): The statement
+
+    Returns:
+        str: The first table of the statement, or "other"
+    """
+    match = TABLE_PATTERN.search(query)
+    return match.group(1) if match else "other"
+
+
+def dropped_table(reason):
+    """Returns the table named by the reason an item was dropped
+
+    Args:
+        reason (str): The message of the DropItem
+
+    Returns:
+        str: The table, or "other"
+    """
+    match = DROPPED_PATTERN.search(reason)
+    return match.group(1) if match else "other"
+
+
+class CountingCursor:
+    """Cursor proxy that reports every statement it sends"""
+
+    def __init__(self, cursor, on_statement):
+        self._cursor = cursor
+        self._on_statement = on_statement
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, *args, **kwargs):
+        self._on_statement(query)
+        return self._cursor.execute(query, *args, **kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        self._on_statement(query)
+        return self._cursor.executemany(query, *args, **kwargs)
+
+
+class CountingConnection:
+    """Connection proxy that reports commits and hands out counting cursors"""
+
+    def __init__(self, conn, on_statement, on_commit):
+        self._conn = conn
+        self._on_statement = on_statement
+        self._on_commit = on_commit
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._on_statement)
+
+    def commit(self):
+        self._on_commit()
+        return self._conn.commit()
+
+
+def prometheus_text(stats, prefix="webscraper"):
+    """Formats the counters of the crawler stats in the Prometheus text format
+
+    Args:
+        stats (dict): A copy of the crawler stats
+        prefix (str): Prefix of the metric names
+
+    Returns:
+        str: The exposition text
+    """
+    families = {}
+
+    def add(name, kind, help_text, value, labels=None):
+        family = families.setdefault(name, (kind, help_text, []))
+        label_text = ""
+        if labels:
+            label_text = (
+                "{"
+                + ",".join(f'{key}="{label}"' for key, label in labels.items())
+                + "}"
+            )
+        family[2].append(f"{prefix}_{name}{label_text} {value}")
+
+    for key, value in sorted(stats.items()):
+        if not isinstance(value, (int, float)):
+            continue
+
+        parts = key.split("/")
+        if parts[0] == "timing" and len(parts) == 3:
+            stage, field = parts[1], parts[2]
+            if field == "seconds":
+                add(
+                    "stage_seconds_total",
+                    "counter",
+                    "Wall time spent in a stage",
+                    value,
+                    {"stage": stage},
+                )
+            elif field == "count":
+                add(
+                    "stage_calls_total",
+                    "counter",
+                    "Calls of a stage",
+                    value,
+                    {"stage": stage},
+                )
+            elif field == "max_seconds":
+                add(
+                    "stage_max_seconds",
+                    "gauge",
+                    "Slowest call of a stage",
+                    value,
+                    {"stage": stage},
+                )
+        elif key.startswith("mysql/statements/"):
+            add(
+                "sql_statements_total",
+                "counter",
+                "SQL statements sent per table",
+                value,
+                {"table": parts[2]},
+            )
+        elif key == "mysql/commits":
+            add("sql_commits_total", "counter", "Committed transactions", value)
+        elif key.startswith("dropped/"):
+            add(
+                "dropped_items_total",
+                "counter",
+                "Items dropped per table",
+                value,
+                {"table": parts[1]},
+            )
+        elif key == "item_scraped_count":
+            add(
+                "items_scraped_total", "counter", "Items that left the pipelines", value
+            )
+        elif key == "response_received_count":
+            add("responses_total", "counter", "Responses received", value)
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines.extend(samples)
+
+    return "\n".join(lines) + "\n"
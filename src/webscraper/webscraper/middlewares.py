@@ -3,11 +3,31 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from datetime import date
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from twisted.internet.error import (
+    ConnectError,
+    ConnectionLost,
+    TCPTimedOutError,
+    TimeoutError,
+)
+from twisted.web.client import ResponseNeverReceived
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .dates import to_date
+from .state import write_bytes_atomically, write_json_atomically
+
 
 class WebscraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -57,47 +77,501 @@ class WebscraperSpiderMiddleware:
 
 
 class WebscraperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """Caches listing pages gzipped on disk and revalidates them with conditional requests
+
+    The rows of a listing page never change, they only shift to later pages as new
+    rows are published. A page whose newest row is older than LISTING_CACHE_RECENT_DAYS
+    is therefore served from the cache for LISTING_CACHE_OLD_TTL seconds and a more
+    recent page for LISTING_CACHE_RECENT_TTL seconds. An expired page is requested
+    again with If-None-Match and If-Modified-Since when the server sent an ETag or
+    Last-Modified header, and a 304 is answered from the cache.
+    """
+
+    CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+    def __init__(
+        self,
+        cache_dir: str,
+        recent_ttl: float = 600.0,
+        old_ttl: float = 30 * 86400.0,
+        recent_days: int = 7,
+        stats=None,
+    ):
+        self.cache_dir = cache_dir
+        self.recent_ttl = recent_ttl
+        self.old_ttl = old_ttl
+        self.recent_days = recent_days
+        self.stats = stats
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
+        settings = crawler.settings
+        if not settings.getbool("LISTING_CACHE_ENABLED"):
+            raise NotConfigured
+
+        middleware = cls(
+            settings.get("LISTING_CACHE_DIR", ".cache/listing"),
+            settings.getfloat("LISTING_CACHE_RECENT_TTL", 600.0),
+            settings.getfloat("LISTING_CACHE_OLD_TTL", 30 * 86400.0),
+            settings.getint("LISTING_CACHE_RECENT_DAYS", 7),
+            crawler.stats,
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        return middleware
 
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        """Answers a request from the cache, or makes it conditional when it expired
+
+        Args:
+            request (scrapy.Request): The request about to be downloaded
+            spider (scrapy.Spider): The running spider
+
+        Returns:
+            HtmlResponse: The cached page while it is fresh, otherwise None
+        """
+        if not self.is_cacheable(request):
+            return None
+
+        entry = self.load_entry(request)
+        if entry is None:
+            self.inc_stat("miss")
+            return None
+
+        if time.time() - entry["stored"] < self.ttl(entry):
+            response = self.cached_response(request, entry)
+            if response is not None:
+                self.inc_stat("hit")
+                return response
+
+        if entry.get("etag"):
+            request.headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            request.headers["If-Modified-Since"] = entry["last_modified"]
+
+        request.meta["listing_cache"] = entry
+        self.inc_stat("expired")
         return None
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+        """Stores downloaded pages and answers 304 responses from the cache
+
+        Args:
+            request (scrapy.Request): The downloaded request
+            response (scrapy.http.Response): Its response
+            spider (scrapy.Spider): The running spider
+
+        Returns:
+            scrapy.http.Response | scrapy.Request: The page, or the request without
+            its conditions when the cached page is gone
+        """
+        if not self.is_cacheable(request) or "cached" in response.flags:
+            return response
+
+        entry = request.meta.pop("listing_cache", None)
+
+        if response.status == 304 and entry is not None:
+            cached = self.cached_response(request, entry)
+            if cached is None:
+                self.discard(request)
+                for header in self.CONDITIONAL_HEADERS:
+                    request.headers.pop(header, None)
+                return request.replace(dont_filter=True)
+
+            entry["stored"] = time.time()
+            write_json_atomically(self.entry_paths(request)[1], entry)
+            self.inc_stat("not_modified")
+            return cached
+
+        if response.status == 200:
+            self.store(request, response, spider)
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
         return response
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def spider_opened(self, spider):
+        spider.logger.info(
+            "Listing cache in %s (recent pages %ss, older pages %ss)",
+            self.cache_dir,
+            self.recent_ttl,
+            self.old_ttl,
+        )
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def is_cacheable(self, request):
+        return request.method == "GET" and not request.meta.get("dont_cache")
+
+    def ttl(self, entry):
+        """Returns how long a cached page is fresh
+
+        Args:
+            entry (dict): The metadata of the cached page
+
+        Returns:
+            float: The time to live in seconds
+        """
+        newest = to_date(entry.get("newest"))
+        if newest is not None and (date.today() - newest).days > self.recent_days:
+            return self.old_ttl
+        return self.recent_ttl
+
+    def entry_paths(self, request):
+        """Returns the body and metadata files of the cached page of a request
+
+        Args:
+            request (scrapy.Request): The request
+
+        Returns:
+            tuple: The paths of the gzipped body and of the JSON metadata
+        """
+        key = hashlib.sha1(request.url.encode("utf-8")).hexdigest()
+        path = os.path.join(self.cache_dir, key[:2], key)
+        return path + ".html.gz", path + ".json"
+
+    def load_entry(self, request):
+        """Reads the metadata of the cached page of a request
+
+        Args:
+            request (scrapy.Request): The request
+
+        Returns:
+            dict: The metadata, or None if the page is not cached
+        """
+        try:
+            with open(self.entry_paths(request)[1], encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        return entry if entry.get("url") == request.url else None
+
+    def cached_response(self, request, entry):
+        """Builds a response from a cached page
+
+        Args:
+            request (scrapy.Request): The request the page answers
+            entry (dict): The metadata of the cached page
+
+        Returns:
+            HtmlResponse: The cached page, or None if its body cannot be read
+        """
+        try:
+            with gzip.open(self.entry_paths(request)[0], "rb") as file:
+                body = file.read()
+        except (OSError, EOFError):
+            return None
+
+        return HtmlResponse(
+            url=request.url,
+            status=200,
+            headers=entry.get("headers") or {},
+            body=body,
+            request=request,
+            flags=["cached"],
+        )
+
+    def discard(self, request):
+        """Removes the cached page of a request
+
+        Args:
+            request (scrapy.Request): The request
+        """
+        for path in self.entry_paths(request):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def store(self, request, response, spider):
+        """Writes a downloaded page to the cache
+
+        The body is written before the metadata, so metadata always points to a
+        complete body.
+
+        Args:
+            request (scrapy.Request): The downloaded request
+            response (scrapy.http.Response): Its response
+            spider (scrapy.Spider): The running spider
+        """
+        body_path, entry_path = self.entry_paths(request)
+        headers = {
+            name: response.headers.get(name).decode("latin-1")
+            for name in ("Content-Type", "ETag", "Last-Modified")
+            if response.headers.get(name) is not None
+        }
+        newest = self.newest_date(response, spider)
+
+        write_bytes_atomically(body_path, gzip.compress(response.body, 6))
+        write_json_atomically(
+            entry_path,
+            {
+                "url": request.url,
+                "stored": time.time(),
+                "newest": newest.isoformat() if newest else None,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "headers": headers,
+            },
+        )
+        self.inc_stat("stored")
+
+    def newest_date(self, response, spider):
+        """Returns the publication date of the first row of a listing page
+
+        Args:
+            response (scrapy.http.Response): The listing page
+            spider (scrapy.Spider): The spider that reads the listing
+
+        Returns:
+            date: The newest publication date of the page, or None
+        """
+        get_table_rows = getattr(spider, "get_table_rows", None)
+        if get_table_rows is None or not isinstance(response, HtmlResponse):
+            return None
+
+        rows = get_table_rows(response)
+        cells = spider.CELLS_XPATH(rows[0]) if rows else []
+        texts = spider.TEXT_XPATH(cells[0]) if cells else []
+        return to_date(str(texts[0])) if texts else None
+
+    def inc_stat(self, name):
+        if self.stats is not None:
+            self.stats.inc_value(f"listing_cache/{name}")
+
+
+class AdaptiveThrottleMiddleware:
+    """Adjusts the download delay and concurrency to how the server responds
+
+    Responses are looked at in windows of ADAPTIVE_THROTTLE_WINDOW. A window whose
+    mean latency is within ADAPTIVE_THROTTLE_TARGET_LATENCY shortens the delay and
+    lets one more page be in flight, a slower window does the opposite. A 429, a
+    5xx or a timeout backs off at once by doubling the delay (honouring Retry-After)
+    and halving the concurrency, at most once per delay, so errors that keep coming
+    back off exponentially. Every success after that halves the delay again until it
+    is close to the pace the errors started at. Both stay within their configured
+    bounds, and the spider only runs pages concurrently when it was started with a
+    concurrency above one.
+    """
+
+    TIMEOUTS = (TimeoutError, TCPTimedOutError)
+    CONNECTION_ERRORS = (ConnectError, ConnectionLost, ResponseNeverReceived)
+
+    def __init__(
+        self,
+        min_delay: float = 0.5,
+        max_delay: float = 60.0,
+        min_concurrency: int = 1,
+        max_concurrency: int = 4,
+        target_latency: float = 1.0,
+        window: int = 10,
+        stats=None,
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.window = window
+        self.stats = stats
+
+        self.crawler = None
+        self.start_delay = None
+        self.delay = None
+        self.concurrency = None
+        self.adjust_concurrency = False
+        self.latencies = []
+        self.backed_off_at = None
+        self.recover_to = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        if settings.getbool("AUTOTHROTTLE_ENABLED"):
+            raise NotConfigured("AutoThrottle already controls the download delay")
+
+        middleware = cls(
+            settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 0.5),
+            settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0),
+            settings.getint("ADAPTIVE_THROTTLE_MIN_CONCURRENCY", 1),
+            settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", 4),
+            settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 1.0),
+            settings.getint("ADAPTIVE_THROTTLE_WINDOW", 10),
+            crawler.stats,
+        )
+        middleware.crawler = crawler
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        return middleware
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        self.start_delay = getattr(
+            spider, "download_delay", self.crawler.settings.getfloat("DOWNLOAD_DELAY")
+        )
+        self.delay = min(max(self.start_delay, self.min_delay), self.max_delay)
+
+        # Only a spider running a window of pages can use more than one slot
+        self.adjust_concurrency = getattr(spider, "WINDOWED", False)
+        if self.adjust_concurrency:
+            self.concurrency = min(
+                max(spider.CONCURRENCY, self.min_concurrency), self.max_concurrency
+            )
+        else:
+            self.concurrency = 1
+
+        self.record("start", spider)
+
+    def process_response(self, request, response, spider):
+        if "cached" in response.flags or "download_latency" not in request.meta:
+            return response
+
+        if response.status == 429 or response.status >= 500:
+            self.back_off(
+                request, spider, str(response.status), self.retry_after(response)
+            )
+            return response
+
+        # Every success after a back off halves the delay until it is back near
+        # the pace the errors started at
+        if self.recover_to is not None:
+            if self.delay > self.recover_to:
+                self.adjust(
+                    request,
+                    spider,
+                    "recover",
+                    max(self.delay / 2, self.recover_to),
+                    self.concurrency,
+                )
+                return response
+            self.recover_to = None
+
+        self.latencies.append(request.meta["download_latency"])
+        if len(self.latencies) >= self.window:
+            latency = sum(self.latencies) / len(self.latencies)
+            self.latencies = []
+            self.inc_stat("windows")
+            self.max_stat("latency_max_ms", round(latency * 1000))
+
+            if latency <= self.target_latency:
+                self.adjust(
+                    request,
+                    spider,
+                    "speed_up",
+                    self.delay * 0.75,
+                    self.concurrency + 1,
+                )
+            else:
+                self.adjust(
+                    request,
+                    spider,
+                    "slow_down",
+                    self.delay * 1.5,
+                    self.concurrency - 1,
+                )
+
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, self.TIMEOUTS):
+            self.back_off(request, spider, "timeout")
+        elif isinstance(exception, self.CONNECTION_ERRORS):
+            self.back_off(request, spider, "connection")
+
+    def back_off(self, request, spider, cause, retry_after=None):
+        """Doubles the delay and halves the concurrency after an error
+
+        Args:
+            request (scrapy.Request): The request that failed
+            spider (scrapy.Spider): The running spider
+            cause (str): The status code or kind of error
+            retry_after (float): Seconds the server asked to wait, if any
+        """
+        self.inc_stat(f"errors/{cause}")
+        self.latencies = []
+
+        # Errors of requests sent at the old pace only count once
+        now = time.monotonic()
+        if self.backed_off_at is not None and now - self.backed_off_at < self.delay:
+            return
+        self.backed_off_at = now
+
+        # Recovery stops a little slower than the pace that ran into errors
+        if self.recover_to is None:
+            self.recover_to = self.delay * 1.5
+
+        delay = max(self.delay * 2, self.min_delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        self.adjust(request, spider, "back_off", delay, self.concurrency // 2)
+
+    def adjust(self, request, spider, decision, delay, concurrency):
+        """Applies a new delay and concurrency within the bounds
+
+        Args:
+            request (scrapy.Request): The request that led to the decision
+            spider (scrapy.Spider): The running spider
+            decision (str): The kind of change
+            delay (float): The wanted delay in seconds
+            concurrency (int): The wanted number of pages in flight
+        """
+        delay = round(min(max(delay, self.min_delay), self.max_delay), 3)
+        if self.adjust_concurrency:
+            concurrency = min(
+                max(concurrency, self.min_concurrency), self.max_concurrency
+            )
+        else:
+            concurrency = 1
+
+        if delay == self.delay and concurrency == self.concurrency:
+            return
+
+        self.delay = delay
+        self.concurrency = concurrency
+
+        slot = self.crawler.engine.downloader.slots.get(
+            request.meta.get("download_slot")
+        )
+        if slot is not None:
+            slot.delay = delay
+            slot.concurrency = concurrency
+        if self.adjust_concurrency:
+            spider.CONCURRENCY = concurrency
+
+        self.record(decision, spider)
+
+    def record(self, decision, spider):
+        """Keeps a decision and the resulting pace in the stats
+
+        Args:
+            decision (str): The kind of change
+            spider (scrapy.Spider): The running spider
+        """
+        self.inc_stat(f"decisions/{decision}")
+        if self.stats is not None:
+            self.stats.set_value("adaptive_throttle/delay", self.delay)
+            self.stats.set_value("adaptive_throttle/concurrency", self.concurrency)
+        self.max_stat("delay_max", self.delay)
+
+        log = spider.logger.info if decision == "back_off" else spider.logger.debug
+        log(f"Throttle {decision}: delay {self.delay}s, concurrency {self.concurrency}")
+
+    def retry_after(self, response):
+        """Returns the seconds a Retry-After header asks to wait
+
+        Args:
+            response (scrapy.http.Response): A 429 or 5xx response
+
+        Returns:
+            float: The seconds to wait, or None without a header in seconds
+        """
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value.decode("latin-1")) if value else None
+        except ValueError:
+            return None
+
+    def inc_stat(self, name):
+        if self.stats is not None:
+            self.stats.inc_value(f"adaptive_throttle/{name}")
+
+    def max_stat(self, name, value):
+        if self.stats is not None:
+            self.stats.max_value(f"adaptive_throttle/{name}", value)
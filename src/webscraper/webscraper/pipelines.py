@@ -1,16 +1,61 @@
+import gzip
+import logging
 import os
-import mysql.connector
-
-from scrapy.exceptions import DropItem
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import defer, task, threads
+from twisted.python.threadpool import ThreadPool
 from datetime import date, timedelta
-from dotenv import load_dotenv
-
-load_dotenv()
+from decimal import Decimal, InvalidOperation
+
+from . import analytics
+from .activity import ActivityTables
+from .cache import LRUCache
+from .dates import DateCalendar, date_range, to_date
+from .events import EventChannel, event_site, transaction_event
+from .items import row_occurrence
+from .metrics import CountingConnection, statement_table, timed
+from .state import HighWaterMark
+from .storage import (
+    TRANSACTION_KEY_COLUMNS,
+    MySqlBackend,
+    bulk_load_enabled,
+    storage_backend,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class DataCleansePipeline:
+    # Translation tables, every field is cleaned in a single pass
+    XA0_TABLE = str.maketrans({"\xa0": None})
+    NUMBER_TABLE = str.maketrans({" ": None, "\xa0": None, ",": "."})
+
+    # Columns with few distinct values
+    INTERNED_FIELDS = (
+        "role",
+        "related",
+        "nature_of_purchase",
+        "instrument_type",
+        "volume_unit",
+        "currency",
+        "status",
+    )
+
     def __init__(self):
-        pass
+        self.stats = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Creates the pipeline and hands it the crawler stats"""
+        pipeline = cls()
+        pipeline.stats = crawler.stats
+        return pipeline
 
     """OPEN SPIDER"""
 
@@ -20,21 +65,25 @@ class DataCleansePipeline:
 
     """PROCESS ITEM"""
 
+    @timed
     def process_item(self, item, spider):
         """Method called for every item pipeline component"""
         item["name"] = self.remove_duplicate_spaces(item["name"])
         item["role"] = self.remove_xa0(item["role"])
 
-        item["volume"] = self.remove_xa0(item["volume"])
-        item["volume"] = self.swap_decimal(item["volume"])
+        item["volume"] = self.parse_number(item["volume"], integer=True)
+        item["price"] = self.parse_number(item["price"])
 
-        item["price"] = self.remove_all_spaces(item["price"])
-        item["price"] = self.swap_decimal(item["price"])
+        item["publication_date"] = self.parse_date(item["publication_date"])
+        item["transaction_date"] = self.parse_date(item["transaction_date"])
 
         item["related"] = self.handle_related_none(item["related"])
 
         item["status"] = self.handle_status_none(item["status"])
 
+        for field in self.INTERNED_FIELDS:
+            item[field] = self.intern_text(item[field])
+
         return item
 
     def remove_duplicate_spaces(self, field):
@@ -46,44 +95,75 @@ class DataCleansePipeline:
         Returns:
             str: converted string
         """
+        if field is None:
+            return None
+
         return " ".join(field.split())
 
-    def remove_all_spaces(self, field):
-        """Removes all spaces from a string
+    def remove_xa0(self, field):
+        """Renoves \xa0 in a string
+
+        Args:
+              field (str): item field that should be converted
+
+          Returns:
+              str: converted string
+        """
+        if field is None:
+            return None
+
+        return field.translate(self.XA0_TABLE)
+
+    def parse_number(self, field, integer=False):
+        """Converts a number with spaces and a decimal comma in one pass
 
         Args:
             field (str): item field that should be converted
+            integer (bool): Return whole numbers as int
 
         Returns:
-            str: converted string
+            Decimal | int | str: The number, or the cleaned string if it is not a number
         """
-        temp = field.replace(" ", "")
-        return self.remove_xa0(temp)
+        if field is None:
+            return None
 
-    def remove_xa0(self, field):
-        """Renoves \xa0 in a string
+        text = field.translate(self.NUMBER_TABLE)
+        try:
+            number = Decimal(text)
+        except InvalidOperation:
+            return text
+
+        if not number.is_finite():
+            return text
+        if integer and number == number.to_integral_value():
+            return int(number)
+
+        return number
+
+    def parse_date(self, field):
+        """Converts a YYYY-MM-DD string into a date
 
         Args:
-              field (str): item field that should be converted
+            field (str): item field that should be converted
 
-          Returns:
-              str: converted string
+        Returns:
+            date | str: The date, or the string if it is not a date
         """
-        try:
-            return field.replace("\xa0", "")
-        except:
-            return field.replace("\xa0", " ")
+        return to_date(field) or field
 
-    def swap_decimal(self, field):
-        """Swaps all decimals to dots
+    def intern_text(self, field):
+        """Interns a string so items share one copy of every repeated value
 
         Args:
-             field (str): item field that should be converted
+            field (str): item field that should be converted
 
-         Returns:
-             str: converted string
+        Returns:
+            str: The interned string
         """
-        return field.replace(",", ".")
+        if field is None:
+            return None
+
+        return sys.intern(field)
 
     def handle_related_none(self, field):
         """Unifies all false boolean values
@@ -120,50 +200,304 @@ class DataCleansePipeline:
         pass
 
 
+class WriteBatch:
+    """Items flushed together by MySqlPipeline and the ids resolved for them"""
+
+    def __init__(self, items, caches):
+        self.items = items
+        self.caches = caches
+        self.failed = {}
+        self.resolved = {table: {} for table in caches}
+
+    def lookup(self, table, key):
+        """Looks up an id among the ids resolved in this batch and then in the cache
+
+        Args:
+            table (str): The table the key belongs to
+            key (Hashable): The natural key
+
+        Returns:
+            int: The id, or None if it is not known yet
+        """
+        row_id = self.resolved[table].get(key)
+        return row_id if row_id is not None else self.caches[table].get(key)
+
+    def fail(self, index, reason):
+        """Marks an item as failed, the first reason is kept
+
+        Args:
+            index (int): Position of the item in the batch
+            reason (str): Why the item could not be written
+        """
+        self.failed.setdefault(index, reason)
+
+    def pending_indices(self):
+        """Positions of the items that have not failed
+
+        Returns:
+            list: The item positions
+        """
+        return [index for index in range(len(self.items)) if index not in self.failed]
+
+    def publish(self):
+        """Moves the ids resolved in this batch into the shared caches"""
+        for table, keys in self.resolved.items():
+            for key, row_id in keys.items():
+                self.caches[table].put(key, row_id)
+
+
 class MySqlPipeline:
-    def __init__(self):
-        self.host = os.getenv("DB_HOST")
-        self.user = os.getenv("DB_USER")
-        self.password = os.getenv("DB_PASSWORD")
-        self.database = os.getenv("DB_SCHEMA")
+    CACHED_TABLES = (
+        "Companies",
+        "Roles",
+        "Currencies",
+        "Instruments",
+        "People",
+    )
+    TRANSACTION_COLUMNS = (
+        "people_id",
+        "instrument_id",
+        "purchase_date_id",
+        "publication_date_id",
+        "nature_of_purchase",
+        "related",
+        "volume",
+        "volume_unit",
+        "price",
+        "currency_id",
+        "occurrence",
+    )
+    IN_CHUNK_SIZE = 500
+    CALENDAR_START = date(2010, 1, 1)
+    CALENDAR_CHUNK_SIZE = 1000
+
+    def __init__(
+        self,
+        cache_size: int = 10000,
+        batch_size: int = 0,
+        flush_interval: float = 5.0,
+        high_water_mark_file: str = None,
+        ping_interval: float = 30.0,
+        reconnect_attempts: int = 3,
+        publish_ids: bool = False,
+        backend=None,
+        activity_tables: bool = False,
+    ):
+        # The database written to, MySQL unless another backend is configured
+        self.backend = backend if backend is not None else MySqlBackend()
+        # Aggregates refreshed in the transaction of the rows they sum
+        self.activity = ActivityTables() if activity_tables else None
         self.conn = None
         self.cursor = None
 
+        self.statements = {}
+        self.ping_interval = ping_interval
+        self.reconnect_attempts = reconnect_attempts
+        self.last_used = time.monotonic()
+
+        self.cache_size = cache_size
+        self.caches = {table: LRUCache(cache_size) for table in self.CACHED_TABLES}
+        self.calendar = DateCalendar()
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.flush_loop = None
+
+        self.high_water_mark_file = high_water_mark_file
+        self.high_water_mark = HighWaterMark()
+
+        # Committed items get their database ids for the event stream
+        self.publish_ids = publish_ids
+
+        # Crawler stats, timings and statement counts are only kept when set
+        self.stats = None
+
+        # A single database thread owns the connection, which keeps the items
+        # and their dimension rows in order while the reactor keeps crawling
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=1, name="MySqlPipeline")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Creates the pipeline using the crawler settings"""
+        if bulk_load_enabled(crawler.settings):
+            raise NotConfigured("MYSQL_BULK_LOAD is set, BulkLoadPipeline writes items")
+
+        pipeline = cls(**cls.settings_kwargs(crawler.settings))
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    @classmethod
+    def settings_kwargs(cls, settings):
+        """Reads the database options from the crawler settings
+
+        Args:
+            settings (Settings): The crawler settings
+
+        Returns:
+            dict: Keyword arguments of the pipeline
+        """
+        return dict(
+            cache_size=settings.getint("MYSQL_CACHE_SIZE", 10000),
+            batch_size=settings.getint("MYSQL_BATCH_SIZE", 0),
+            flush_interval=settings.getfloat("MYSQL_FLUSH_INTERVAL", 5.0),
+            high_water_mark_file=settings.get("HIGH_WATER_MARK_FILE"),
+            ping_interval=settings.getfloat("MYSQL_PING_INTERVAL", 30.0),
+            reconnect_attempts=settings.getint("MYSQL_RECONNECT_ATTEMPTS", 3),
+            publish_ids=settings.getbool("EVENT_STREAM_ENABLED"),
+            backend=storage_backend(settings),
+            activity_tables=settings.getbool("ACTIVITY_TABLES_ENABLED", False),
+        )
+
     """OPEN SPIDER"""
 
     def open_spider(self, spider):
         """Method called when the spider is opened"""
-        self.check_db_exists()
+        self.threadpool.start()
+
+        if self.batch_size > 0:
+            self.flush_loop = task.LoopingCall(self.flush_buffer)
+            self.flush_loop.start(self.flush_interval, now=False)
+
+        return self.run_in_pool(self.open_db)
+
+    def run_in_pool(self, func, *args):
+        """Runs a function on the database thread
+
+        Args:
+            func (Callable): The function to run
+            *args: Arguments of the function
+
+        Returns:
+            Deferred: Fires with the result of the function on the reactor thread
+        """
+        from twisted.internet import reactor
+
+        return threads.deferToThreadPool(reactor, self.threadpool, func, *args)
+
+    def open_db(self):
+        """Prepares the database and the in-memory state, called on the database thread"""
+        self.backend.create_database()
         self.create_db_connection()
         self.add_db_tables()
         self.fill_dates_table()
+        self.warm_caches()
 
-    def check_db_exists(self):
-        """Checks if the database exists and creates it if not."""
-        try:
-            db_conn = mysql.connector.connect(
-                user=self.user,
-                password=self.password,
-                host=self.host,
+        if self.high_water_mark_file:
+            self.high_water_mark = (
+                HighWaterMark.load(self.high_water_mark_file) or HighWaterMark()
             )
-            cursor = db_conn.cursor()
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
-        except mysql.connector.Error as err:
-            print(f"Error: {err}")
 
     def create_db_connection(self):
-        """Creates a connection to the database."""
-        try:
-            self.conn = mysql.connector.connect(
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                database=self.database,
-            )
-            self.cursor = self.conn.cursor(buffered=True)
+        """Opens a connection through the storage backend.
+
+        Raises:
+            StorageBackend.Error: The database could not be reached
+        """
+        for attempt in range(self.reconnect_attempts + 1):
+            try:
+                self.conn = self.backend.connect()
+                if self.stats is not None:
+                    self.conn = CountingConnection(
+                        self.conn, self.count_statement, self.count_commit
+                    )
+                self.cursor = self.conn.cursor(buffered=True)
+                self.statements = {}
+                self.last_used = time.monotonic()
+                return
+
+            except self.backend.Error as err:
+                print(f"Error: {err}")
+                if attempt == self.reconnect_attempts:
+                    raise
+                time.sleep(min(2**attempt, 30))
+
+    def count_statement(self, query):
+        """Counts a statement sent to the database in the stats
+
+        Args:
+            query (str): The statement
+        """
+        self.stats.inc_value(f"mysql/statements/{statement_table(query)}")
 
-        except mysql.connector.Error as err:
-            print(f"Error: {err}")
+    def count_commit(self):
+        """Counts a commit in the stats"""
+        self.stats.inc_value("mysql/commits")
+
+    def reconnect(self):
+        """Replaces a lost connection with a fresh one"""
+        self.close_db_connection()
+        self.conn = None
+        self.cursor = None
+        self.create_db_connection()
+
+    def check_connection(self):
+        """Reconnects before running work if an idle connection has been dropped"""
+        if time.monotonic() - self.last_used > self.ping_interval:
+            if not self.conn.is_connected():
+                self.reconnect()
+
+        self.last_used = time.monotonic()
+
+    def is_connection_error(self, err):
+        """Checks if an error means the connection to the server was lost
+
+        Args:
+            err (StorageBackend.Error): The raised error
+
+        Returns:
+            bool: True if the work should be replayed on a new connection
+        """
+        return self.backend.is_connection_error(err)
+
+    def with_reconnect(self, func, *args):
+        """Runs database work, replaying it on a new connection if the connection is lost
+
+        Work that fails halfway is rolled back by the server, so the whole item or
+        batch is written again.
+
+        Args:
+            func (Callable): The database work
+            *args: Arguments of the work
+
+        Returns:
+            Any: The result of the work
+        """
+        for attempt in range(self.reconnect_attempts + 1):
+            try:
+                self.check_connection()
+                return func(*args)
+
+            except self.backend.Error as err:
+                if not self.is_connection_error(err):
+                    raise
+                if attempt == self.reconnect_attempts:
+                    raise
+                logger.warning(f"Connection lost, reconnecting: {err}")
+                time.sleep(min(2**attempt, 30))
+                self.reconnect()
+
+    def execute(self, query, params=()):
+        """Executes a statement as a server-side prepared statement
+
+        Every distinct statement keeps its own prepared cursor, so it is only
+        parsed by the server once per connection.
+
+        Args:
+            query (str): The statement
+            params (tuple): Parameters of the statement
+
+        Returns:
+            MySQLCursorPrepared: The cursor, ready to fetch from
+        """
+        cursor = self.statements.get(query)
+
+        if cursor is None:
+            cursor = self.conn.cursor(prepared=True)
+            self.statements[query] = cursor
+
+        cursor.execute(query, params)
+        return cursor
 
     def add_db_tables(self):
         """Create necessary tables in the database."""
@@ -180,11 +514,16 @@ class MySqlPipeline:
         # Multi-dependet tables
         self.create_transactions_table()
 
+        if self.activity:
+            self.activity.create_tables(self.cursor)
+
+        self.backend.migrate(self.cursor)
+
     def create_instruments_table(self):
         """Create instruments table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Instruments (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            f"""CREATE TABLE IF NOT EXISTS Instruments (
+            {self.backend.ID_COLUMN},
             company_id INT,
             name VARCHAR(200),
             type VARCHAR(75),
@@ -196,17 +535,18 @@ class MySqlPipeline:
     def create_roles_table(self):
         """Create roles table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Roles (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            role VARCHAR(255)
+            f"""CREATE TABLE IF NOT EXISTS Roles (
+            {self.backend.ID_COLUMN},
+            role VARCHAR(255),
+            CONSTRAINT uq_roles_role UNIQUE (role)
             )"""
         )
 
     def create_companies_table(self):
         """Create people table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Companies (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            f"""CREATE TABLE IF NOT EXISTS Companies (
+            {self.backend.ID_COLUMN},
             name VARCHAR(255) UNIQUE
             )"""
         )
@@ -214,11 +554,12 @@ class MySqlPipeline:
     def create_people_table(self):
         """Create people table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS People (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            f"""CREATE TABLE IF NOT EXISTS People (
+            {self.backend.ID_COLUMN},
             role_id INT,
             company_id INT,
             name VARCHAR(255),
+            CONSTRAINT uq_people_company_name UNIQUE (company_id, name),
             FOREIGN KEY (role_id) REFERENCES Roles(id),
             FOREIGN KEY (company_id) REFERENCES Companies(id)
             )"""
@@ -227,49 +568,99 @@ class MySqlPipeline:
     def create_dates_table(self):
         """Create dates table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Dates (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            f"""CREATE TABLE IF NOT EXISTS Dates (
+            {self.backend.ID_COLUMN},
             date DATE UNIQUE
             )"""
         )
 
     def fill_dates_table(self):
-        """Inserts dates into the dates table in ascending order from 2010-01-01 to today.
+        """Loads the Dates calendar and fills it in bulk from 2010-01-01 to today.
 
         Raises:
             DropItem: Item could not be inserted into table
         """
-        self.cursor.execute("SELECT date FROM Dates")
-        dates_exist = self.cursor.fetchone()
+        self.cursor.execute("SELECT id, date FROM Dates ORDER BY date")
+        self.calendar.load(self.cursor.fetchall())
 
-        if not dates_exist:
-            start_date = date(2010, 1, 1)
-            end_date = date.today()
+        self.extend_calendar([date.today()])
 
-            delta = end_date - start_date
+    @timed
+    def extend_calendar(self, values, commit=True):
+        """Inserts the dates missing from the calendar in bulk and adds them to it
 
-            for i in range(delta.days + 1):
-                new_date = start_date + timedelta(days=i)
+        Dates after the last stored date extend the calendar up to the newest of
+        them so the table stays dense, older dates are inserted as they are. Dates
+        another writer inserted in the meantime are skipped, and the ids are read
+        back by date.
 
-                try:
-                    self.cursor.execute(
-                        """
-                        INSERT INTO Dates
-                        (date)
-                        VALUES
-                        (%s)""",
-                        (new_date,),
-                    )
-                    self.conn.commit()
+        Args:
+            values (Iterable): Dates, or strings in YYYY-MM-DD format
+            commit (bool): Commits the dates, False leaves them to the caller's commit
+
+        Raises:
+            DropItem: Dates could not be inserted into table
+        """
+        missing = {to_date(value) for value in values} - {None}
+        missing = {value for value in missing if self.calendar.id_of(value) is None}
+
+        if not missing:
+            return
+
+        last_date = self.calendar.last_date
+        first_new = last_date + timedelta(days=1) if last_date else self.CALENDAR_START
+
+        older = sorted(value for value in missing if value < first_new)
+        newer = []
+        if max(missing) >= first_new:
+            newer = list(date_range(first_new, max(missing)))
+
+        new_dates = older + newer
+
+        try:
+            for start in range(0, len(new_dates), self.CALENDAR_CHUNK_SIZE):
+                self.cursor.executemany(
+                    f"""
+                    INSERT INTO Dates
+                    (date)
+                    VALUES
+                    (%s)
+                    {self.backend.on_duplicate()}""",
+                    [
+                        (value,)
+                        for value in new_dates[start : start + self.CALENDAR_CHUNK_SIZE]
+                    ],
+                )
 
-                except mysql.connector.Error as err:
-                    raise DropItem(f"Error at Dates, inserting: {err}")
+            if commit:
+                self.conn.commit()
+
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            self.conn.rollback()
+            raise DropItem(f"Error at Dates, inserting: {err}")
+
+        if older:
+            placeholders = ", ".join(["%s"] * len(older))
+            self.cursor.execute(
+                f"""SELECT id, date FROM Dates WHERE date IN ({placeholders})""",
+                tuple(older),
+            )
+            self.calendar.load(self.cursor.fetchall())
+
+        if newer:
+            self.cursor.execute(
+                """SELECT id, date FROM Dates WHERE date >= %s ORDER BY date""",
+                (first_new,),
+            )
+            self.calendar.load(self.cursor.fetchall())
 
     def create_currencies_table(self):
         """Create currencies table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Currencies (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            f"""CREATE TABLE IF NOT EXISTS Currencies (
+            {self.backend.ID_COLUMN},
             currency VARCHAR(10) UNIQUE
             )"""
         )
@@ -277,8 +668,8 @@ class MySqlPipeline:
     def create_transactions_table(self):
         """Create transactions table if not exists."""
         self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Transactions (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            f"""CREATE TABLE IF NOT EXISTS Transactions (
+            {self.backend.ID_COLUMN},
             people_id INT,
             instrument_id INT,
             purchase_date_id INT,
@@ -289,6 +680,9 @@ class MySqlPipeline:
             volume_unit VARCHAR(50),
             price DECIMAL(14, 6),
             currency_id INT,
+            occurrence INT NOT NULL DEFAULT 1,
+            {self.backend.natural_key_column(TRANSACTION_KEY_COLUMNS)},
+            CONSTRAINT uq_transactions_natural_key UNIQUE (natural_key, occurrence),
             FOREIGN KEY (people_id) REFERENCES People(id),
             FOREIGN KEY (instrument_id) REFERENCES Instruments(id),
             FOREIGN KEY (purchase_date_id) REFERENCES Dates(id),
@@ -297,10 +691,54 @@ class MySqlPipeline:
             )"""
         )
 
+    def warm_caches(self):
+        """Loads the most recently inserted natural keys and ids into the dimension caches"""
+        if self.cache_size <= 0:
+            return
+
+        queries = {
+            "Companies": "SELECT name, id FROM Companies ORDER BY id DESC LIMIT %s",
+            "Roles": "SELECT role, id FROM Roles ORDER BY id DESC LIMIT %s",
+            "Currencies": "SELECT currency, id FROM Currencies ORDER BY id DESC LIMIT %s",
+            "People": "SELECT company_id, name, id FROM People ORDER BY id DESC LIMIT %s",
+        }
+
+        for table, query in queries.items():
+            self.cursor.execute(query, (self.cache_size,))
+            # Oldest rows first so that the newest end up most recently used
+            for *key, row_id in reversed(self.cursor.fetchall()):
+                self.caches[table].put(key[0] if len(key) == 1 else tuple(key), row_id)
+
+        self.cursor.execute(
+            """SELECT company_id, name, type, isin, id FROM Instruments
+            ORDER BY id DESC LIMIT %s""",
+            (self.cache_size,),
+        )
+        for company_id, name, type, isin, row_id in reversed(self.cursor.fetchall()):
+            self.caches["Instruments"].put(
+                self.instrument_key(company_id, name, type, isin), row_id
+            )
+
     """PROCESS ITEM"""
 
+    @timed
     def process_item(self, item, spider):
         """Method called for every item pipeline component"""
+        if self.batch_size > 0:
+            return self.buffer_item(item)
+
+        return self.run_in_pool(self.with_reconnect, self.write_item, item)
+
+    @timed
+    def write_item(self, item):
+        """Writes a single item, called on the database thread
+
+        Args:
+            item (scrapy.Item): The currently scraped item
+
+        Returns:
+            scrapy.Item: The written item
+        """
         # Non-dependet tables
         self.curerncies_entries(item)
         self.roles_entries(item)
@@ -313,9 +751,68 @@ class MySqlPipeline:
 
         # Multi-dependet tables
         self.transactions_entries(item)
+        self.high_water_mark.update(item)
 
         return item
 
+    def cached_id(self, table, key, query, params):
+        """Retrieves the id of a natural key, consulting the cache before the database
+
+        Args:
+            table (str): The table the key belongs to
+            key (Hashable): The natural key used in the cache
+            query (str): SELECT statement returning the id of the key
+            params (tuple): Parameters of the SELECT statement
+
+        Returns:
+            int: The id, or None if the key is not stored in the table
+        """
+        row_id = self.caches[table].get(key)
+
+        if row_id is None:
+            result = self.execute(query, params).fetchall()
+
+            if result:
+                row_id = result[0][0]
+                self.caches[table].put(key, row_id)
+
+        return row_id
+
+    def instrument_key(self, company_id, name, type, isin):
+        """Natural key of an instrument, the isin when present and otherwise the issuer, name and type
+
+        Returns:
+            Hashable: The cache key of the instrument
+        """
+        return isin if isin is not None else (company_id, name, type)
+
+    def upsert_id(self, table, key, query, params):
+        """Inserts a natural key unless it exists and returns its id in one statement
+
+        The statement ends with the on_duplicate clause of the backend returning the
+        id, so the id of an existing row is returned the same way as a new one.
+
+        Args:
+            table (str): The table the key belongs to
+            key (Hashable): The natural key used in the cache
+            query (str): The upsert statement
+            params (tuple): Parameters of the statement
+
+        Returns:
+            int: The id of the row
+        """
+        row_id = self.caches[table].get(key)
+
+        if row_id is None:
+            cursor = self.execute(query, params)
+            row_id = self.backend.upserted_id(cursor)
+            self.conn.commit()
+
+            self.caches[table].put(key, row_id)
+
+        return row_id
+
+    @timed
     def companies_entries(self, item):
         """Inserts a record into the companies table
 
@@ -325,62 +822,81 @@ class MySqlPipeline:
         Raises:
             DropItem: Item could not be inserted into table
         """
-        self.cursor.execute(
-            f"""SELECT * FROM Companies WHERE name = %s""", (item["issuer"],)
-        )
-        current_company_exits = self.cursor.fetchone()
-
-        if not current_company_exits:
-            try:
-                self.cursor.execute(
-                    f"""
-                    INSERT INTO Companies
-                    (name)
-                    VALUES
-                    (%s)""",
-                    (item["issuer"],),
-                )
-
-                self.conn.commit()
+        try:
+            self.upsert_id(
+                "Companies",
+                item["issuer"],
+                f"""
+                INSERT INTO Companies
+                (name)
+                VALUES
+                (%s)
+                {self.backend.on_duplicate(return_id=True)}""",
+                (item["issuer"],),
+            )
 
-            except mysql.connector.Error as err:
-                raise DropItem(f"Error at Companies, inserting: {err}")
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            raise DropItem(f"Error at Companies, inserting: {err}")
 
+    @timed
     def instruments_entries(self, item):
         """Inserts a record into the item table
 
+        Instruments without an isin have no unique key, those are looked up before
+        they are inserted.
+
         Args:
             item (scrapy.Item): The currently scraped item
 
         Raises:
             DropItem: Item could not be inserted into table
         """
-        self.cursor.execute(
-            f"""SELECT * FROM Instruments WHERE isin = %s""", (item["isin"],)
+        company_id = self.extract_company_id(item["issuer"])
+        key = self.instrument_key(
+            company_id,
+            item["instrument_name"],
+            item["instrument_type"],
+            item["isin"],
         )
-        current_isin_exits = self.cursor.fetchone()
 
-        if not current_isin_exits:
+        if item["isin"] is None:
             try:
-                self.cursor.execute(
-                    f"""
-                    INSERT INTO Instruments
-                    (company_id, name, type, isin)
-                    VALUES
-                    (%s, %s, %s, %s)""",
-                    (
-                        self.extract_company_id(item["issuer"]),
-                        item["instrument_name"],
-                        item["instrument_type"],
-                        item["isin"],
-                    ),
+                self.extract_instrument_id(
+                    item["issuer"],
+                    item["instrument_name"],
+                    item["instrument_type"],
+                    item["isin"],
                 )
+                return
+            except DropItem:
+                pass
 
-                self.conn.commit()
+        try:
+            self.upsert_id(
+                "Instruments",
+                key,
+                f"""
+                INSERT INTO Instruments
+                (company_id, name, type, isin)
+                VALUES
+                (%s, %s, %s, %s)
+                {self.backend.on_duplicate(return_id=True)}""",
+                (
+                    company_id,
+                    item["instrument_name"],
+                    item["instrument_type"],
+                    item["isin"],
+                ),
+            )
 
-            except mysql.connector.Error as err:
-                raise DropItem(f"Error at Instruements, inserting: {err}")
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            raise DropItem(f"Error at Instruments, inserting: {err}")
 
+    @timed
     def curerncies_entries(self, item):
         """Inserts a record into the currencies table
 
@@ -390,28 +906,25 @@ class MySqlPipeline:
         Raises:
             DropItem: Item could not be inserted into table
         """
-        self.cursor.execute(
-            f"""SELECT * FROM Currencies WHERE currency = %s""",
-            (item["currency"],),
-        )
-        current_currency_exits = self.cursor.fetchone()
-
-        if not current_currency_exits:
-            try:
-                self.cursor.execute(
-                    f"""
-                    INSERT INTO Currencies
-                    (currency)
-                    VALUES
-                    (%s)""",
-                    (item["currency"],),
-                )
-
-                self.conn.commit()
+        try:
+            self.upsert_id(
+                "Currencies",
+                item["currency"],
+                f"""
+                INSERT INTO Currencies
+                (currency)
+                VALUES
+                (%s)
+                {self.backend.on_duplicate(return_id=True)}""",
+                (item["currency"],),
+            )
 
-            except mysql.connector.Error as err:
-                raise DropItem(f"Error at Currencies, inserting: {err}")
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            raise DropItem(f"Error at Currencies, inserting: {err}")
 
+    @timed
     def roles_entries(self, item):
         """Inserts a record into the currencies table
 
@@ -421,25 +934,25 @@ class MySqlPipeline:
         Raises:
             DropItem: Item could not be inserted into table
         """
-        self.cursor.execute(f"""SELECT * FROM Roles WHERE role = %s""", (item["role"],))
-        current_role_exits = self.cursor.fetchone()
-
-        if not current_role_exits:
-            try:
-                self.cursor.execute(
-                    f"""
-                    INSERT INTO Roles
-                    (role)
-                    VALUES
-                    (%s)""",
-                    (item["role"],),
-                )
-
-                self.conn.commit()
+        try:
+            self.upsert_id(
+                "Roles",
+                item["role"],
+                f"""
+                INSERT INTO Roles
+                (role)
+                VALUES
+                (%s)
+                {self.backend.on_duplicate(return_id=True)}""",
+                (item["role"],),
+            )
 
-            except mysql.connector.Error as err:
-                raise DropItem(f"Error at Roles, inserting: {err}")
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            raise DropItem(f"Error at Roles, inserting: {err}")
 
+    @timed
     def people_entries(self, item):
         """Inserts a record into the people table
 
@@ -449,32 +962,31 @@ class MySqlPipeline:
         Raises:
             DropItem: Item could not be inserted into table
         """
-        self.cursor.execute(
-            f"""SELECT * FROM People WHERE company_id = %s AND name = %s""",
-            (self.extract_company_id(item["issuer"]), item["name"]),
-        )
-        current_role_exits = self.cursor.fetchone()
-
-        if not current_role_exits:
-            try:
-                self.cursor.execute(
-                    f"""
-                    INSERT INTO People
-                    (role_id, company_id, name)
-                    VALUES
-                    (%s, %s, %s)""",
-                    (
-                        self.extract_role_id(item["role"]),
-                        self.extract_company_id(item["issuer"]),
-                        item["name"],
-                    ),
-                )
+        company_id = self.extract_company_id(item["issuer"])
 
-                self.conn.commit()
+        try:
+            self.upsert_id(
+                "People",
+                (company_id, item["name"]),
+                f"""
+                INSERT INTO People
+                (role_id, company_id, name)
+                VALUES
+                (%s, %s, %s)
+                {self.backend.on_duplicate(return_id=True)}""",
+                (
+                    self.extract_role_id(item["role"]),
+                    company_id,
+                    item["name"],
+                ),
+            )
 
-            except mysql.connector.Error as err:
-                raise DropItem(f"Error at People, inserting: {err}")
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            raise DropItem(f"Error at People, inserting: {err}")
 
+    @timed
     def dates_entries(self, item):
         """Inserts a record into the dates table
         Args:
@@ -482,32 +994,11 @@ class MySqlPipeline:
         Raises:
             DropItem: Item could not be inserted into table
         """
-        item_dates = [item["publication_date"], item["transaction_date"]]
+        self.extend_calendar([item["publication_date"], item["transaction_date"]])
 
-        for date in item_dates:
-            self.cursor.execute(
-                f"""SELECT date FROM Dates WHERE date = %s""", (date,)
-            )
-            current_date_exits = self.cursor.fetchone()
-
-            if not current_date_exits:
-                try:
-                    self.cursor.execute(
-                        f"""
-                        INSERT INTO Dates
-                        (date)
-                        VALUES
-                        (%s)""",
-                        (date,),
-                    )
-
-                    self.conn.commit()
-
-                except mysql.connector.Error as err:
-                    raise DropItem(f"Error at Dates, inserting: {err}")
-
-    def transactions_entries(self, item):
-        """Inserts a record into the transactions table
+    @timed
+    def transactions_entries(self, item):
+        """Inserts a record into the transactions table, or updates it if it is already stored
 
         Args:
             item (scrapy.Item): The currently scraped item
@@ -516,37 +1007,52 @@ class MySqlPipeline:
             DropItem: Item could not be inserted into table
         """
         try:
-            self.cursor.execute(
-                """
+            row = (
+                self.extract_person_id(item["issuer"], item["name"]),
+                self.extract_instrument_id(
+                    item["issuer"],
+                    item["instrument_name"],
+                    item["instrument_type"],
+                    item["isin"],
+                ),
+                self.extract_date_id(item["transaction_date"]),
+                self.extract_date_id(item["publication_date"]),
+                item["nature_of_purchase"],
+                item["related"],
+                item["volume"],
+                item["volume_unit"],
+                item["price"],
+                self.extract_currency_id(item["currency"]),
+                row_occurrence(item),
+            )
+
+            cursor = self.execute(
+                f"""
                 INSERT INTO Transactions
                 (people_id, instrument_id, purchase_date_id, publication_date_id,
-                nature_of_purchase, related, volume, volume_unit, price, currency_id)
+                nature_of_purchase, related, volume, volume_unit, price, currency_id,
+                occurrence)
                 VALUES
-                (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                (
-                    self.extract_person_id(item["issuer"], item["name"]),
-                    self.extract_instrument_id(
-                        item["issuer"],
-                        item["instrument_name"],
-                        item["instrument_type"],
-                        item["isin"],
-                    ),
-                    self.extract_date_id(item["transaction_date"]),
-                    self.extract_date_id(item["publication_date"]),
-                    item["nature_of_purchase"],
-                    item["related"],
-                    item["volume"],
-                    item["volume_unit"],
-                    item["price"],
-                    self.extract_currency_id(item["currency"]),
-                ),
+                (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                {self.backend.on_duplicate(("related",), return_id=True)}""",
+                row,
             )
+            transaction_id = self.backend.upserted_id(cursor)
+            self.refresh_activity([item["transaction_date"]])
 
             self.conn.commit()
 
-        except mysql.connector.Error as err:
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
             raise DropItem(f"Error at Transactions, inserting: {err}")
 
+        if self.publish_ids:
+            item["ids"] = self.transaction_ids(
+                item, row, transaction_id, self.cached_lookup
+            )
+
+    @timed
     def extract_role_id(self, role):
         """Retrieves the role_id from the database corresponding to the current role
 
@@ -556,17 +1062,19 @@ class MySqlPipeline:
         Returns:
             str: The role_id
         """
-        self.cursor.execute(
+        result = self.cached_id(
+            "Roles",
+            role,
             f"""SELECT id FROM Roles WHERE role = %s""",
             (role,),
         )
 
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        if result is not None:
+            return result
         else:
             raise DropItem(f"Role {role} not found in Roles table")
 
+    @timed
     def extract_company_id(self, company_name):
         """Retrieves the company_id from the database corresponding to the current company name
 
@@ -576,17 +1084,19 @@ class MySqlPipeline:
         Returns:
             str: The company_id
         """
-        self.cursor.execute(
+        result = self.cached_id(
+            "Companies",
+            company_name,
             f"""SELECT id FROM Companies WHERE name = %s""",
             (company_name,),
         )
 
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        if result is not None:
+            return result
         else:
             raise DropItem(f"Company {company_name} not found in Companies table")
 
+    @timed
     def extract_person_id(self, company_name, person_name):
         """Retrieves the people_id from the database corresponding to the current item
 
@@ -597,17 +1107,21 @@ class MySqlPipeline:
         Returns:
             str: The person_id
         """
-        self.cursor.execute(
+        company_id = self.extract_company_id(company_name)
+
+        result = self.cached_id(
+            "People",
+            (company_id, person_name),
             f"""SELECT id FROM People WHERE name = %s AND company_id = %s""",
-            (person_name, self.extract_company_id(company_name)),
+            (person_name, company_id),
         )
 
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        if result is not None:
+            return result
         else:
             raise DropItem(f"Person {person_name} not found in People table")
 
+    @timed
     def extract_instrument_id(self, company_name, name, type, isin):
         """Retrieves the people_id from the database corresponding to the current item
 
@@ -621,26 +1135,29 @@ class MySqlPipeline:
             str: The instrument_id
         """
         if isin is not None:
-            self.cursor.execute(
+            result = self.cached_id(
+                "Instruments",
+                isin,
                 """SELECT id FROM Instruments WHERE isin = %s""",
                 (isin,),
             )
         else:
-            self.cursor.execute(
-                f"""SELECT id FROM Instruments WHERE company_id = %s AND name = %s AND type = %s""",
-                (
-                    self.extract_company_id(company_name),
-                    name,
-                    type,
-                ),
+            company_id = self.extract_company_id(company_name)
+            result = self.cached_id(
+                "Instruments",
+                self.instrument_key(company_id, name, type, isin),
+                f"""SELECT id FROM Instruments WHERE company_id = %s
+                AND name {self.backend.NULL_SAFE_EQUAL} %s
+                AND type {self.backend.NULL_SAFE_EQUAL} %s""",
+                (company_id, name, type),
             )
 
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        if result is not None:
+            return result
         else:
             raise DropItem(f"Instrument {name} ({type}) not found in Instruments table")
 
+    @timed
     def extract_date_id(self, date_value):
         """Retrieves the date_id from the database corresponding to the current date
 
@@ -650,17 +1167,14 @@ class MySqlPipeline:
         Returns:
             int: The date_id
         """
-        self.cursor.execute(
-            """SELECT id FROM Dates WHERE date = %s""",
-            (date_value,),
-        )
+        result = self.calendar.id_of(date_value)
 
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        if result is not None:
+            return result
         else:
             raise DropItem(f"Date {date_value} not found in Dates table")
 
+    @timed
     def extract_currency_id(self, currency):
         """Retrieves the currency_id from the database corresponding to the current currency
 
@@ -670,29 +1184,1165 @@ class MySqlPipeline:
         Returns:
             int: The currency_id
         """
-        self.cursor.execute(
+        result = self.cached_id(
+            "Currencies",
+            currency,
             """SELECT id FROM Currencies WHERE currency = %s""",
             (currency,),
         )
 
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        if result is not None:
+            return result
         else:
             raise DropItem(f"Currency {currency} not found in Currencies table")
 
+    """BATCH WRITES"""
+
+    def buffer_item(self, item):
+        """Adds an item to the write buffer and flushes it once the size threshold is reached
+
+        Args:
+            item (scrapy.Item): The currently scraped item
+
+        Returns:
+            Deferred: Fires with the item once its batch is committed
+        """
+        deferred = defer.Deferred()
+        self.buffer.append((item, deferred))
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush_buffer()
+
+        return deferred
+
+    def flush_buffer(self):
+        """Writes every buffered item in one transaction on the database thread
+
+        Returns:
+            Deferred: Fires once the deferreds of the buffered items are resolved
+        """
+        if not self.buffer:
+            return defer.succeed(None)
+
+        entries, self.buffer = self.buffer, []
+
+        deferred = self.run_in_pool(
+            self.with_reconnect, self.write_buffered, [item for item, _ in entries]
+        )
+        deferred.addCallbacks(
+            self.resolve_buffered,
+            self.fail_buffered,
+            callbackArgs=(entries,),
+            errbackArgs=(entries,),
+        )
+
+        return deferred
+
+    def write_buffered(self, items):
+        """Writes a flushed batch, called on the database thread
+
+        Args:
+            items (list): The buffered items
+
+        Returns:
+            dict: Index of every failed item mapped to the reason it failed
+        """
+        try:
+            failed = self.write_batch(items)
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            failed = {
+                index: f"Error at batch, writing: {err}" for index in range(len(items))
+            }
+
+        for index, item in enumerate(items):
+            if index not in failed:
+                self.high_water_mark.update(item)
+        self.save_high_water_mark()
+
+        return failed
+
+    def resolve_buffered(self, failed, entries):
+        """Fires the deferred of every item of a written batch
+
+        Args:
+            failed (dict): Index of every failed item mapped to the reason it failed
+            entries (list): The (item, deferred) pairs of the batch
+        """
+        for index, (item, deferred) in enumerate(entries):
+            if index in failed:
+                deferred.errback(DropItem(failed[index]))
+            else:
+                deferred.callback(item)
+
+    def fail_buffered(self, failure, entries):
+        """Fails every item of a batch that could not be written
+
+        Args:
+            failure (Failure): The error raised while writing
+            entries (list): The (item, deferred) pairs of the batch
+        """
+        for _, deferred in entries:
+            deferred.errback(failure)
+
+    @timed
+    def write_batch(self, items):
+        """Writes a batch of items, dimension tables first, and commits once
+
+        Rows that cannot be written only fail the items they belong to, the rest
+        of the batch is still committed.
+
+        Args:
+            items (list): The buffered items
+
+        Returns:
+            dict: Index of every failed item mapped to the reason it failed
+        """
+        batch = WriteBatch(items, self.caches)
+        lookup = batch.lookup
+
+        def instrument_row(item):
+            return (
+                lookup("Companies", item["issuer"]),
+                item["instrument_name"],
+                item["instrument_type"],
+                item["isin"],
+            )
+
+        # (table, natural key columns, inserted columns, key of item, row of item)
+        dimensions = [
+            # Non-dependet tables
+            (
+                "Currencies",
+                ("currency",),
+                ("currency",),
+                lambda item: item["currency"],
+                lambda item: (item["currency"],),
+            ),
+            (
+                "Roles",
+                ("role",),
+                ("role",),
+                lambda item: item["role"],
+                lambda item: (item["role"],),
+            ),
+            (
+                "Companies",
+                ("name",),
+                ("name",),
+                lambda item: item["issuer"],
+                lambda item: (item["issuer"],),
+            ),
+            # Dependet tables
+            (
+                "Instruments",
+                ("isin",),
+                ("company_id", "name", "type", "isin"),
+                lambda item: item["isin"],
+                instrument_row,
+            ),
+            (
+                "Instruments",
+                ("company_id", "name", "type"),
+                ("company_id", "name", "type", "isin"),
+                lambda item: (
+                    self.instrument_key(*instrument_row(item))
+                    if item["isin"] is None
+                    else None
+                ),
+                instrument_row,
+                False,
+            ),
+            (
+                "People",
+                ("company_id", "name"),
+                ("role_id", "company_id", "name"),
+                lambda item: (lookup("Companies", item["issuer"]), item["name"]),
+                lambda item: (
+                    lookup("Roles", item["role"]),
+                    lookup("Companies", item["issuer"]),
+                    item["name"],
+                ),
+            ),
+        ]
+
+        try:
+            self.extend_calendar(
+                [item["publication_date"] for item in items]
+                + [item["transaction_date"] for item in items]
+            )
+        except DropItem:
+            # Items whose dates are still missing fail below
+            pass
+
+        try:
+            for dimension in dimensions:
+                self.resolve_dimension(batch, *dimension)
+
+            for index in batch.pending_indices():
+                for column in ("publication_date", "transaction_date"):
+                    if self.calendar.id_of(items[index][column]) is None:
+                        batch.fail(
+                            index,
+                            f"Date {items[index][column]} not found in Dates table",
+                        )
+
+            # Multi-dependet tables
+            indices = batch.pending_indices()
+            rows = [self.transaction_row(items[index], lookup) for index in indices]
+            errors = self.insert_rows(
+                "Transactions",
+                self.TRANSACTION_COLUMNS,
+                rows,
+                self.backend.on_duplicate(("related",)),
+            )
+            for position, err in errors.items():
+                batch.fail(
+                    indices[position], f"Error at Transactions, inserting: {err}"
+                )
+
+            self.refresh_activity(items[index]["transaction_date"] for index in indices)
+
+            self.conn.commit()
+
+        except self.backend.Error as err:
+            if not self.is_connection_error(err):
+                self.conn.rollback()
+            raise
+
+        # Ids are only cached once they are committed
+        batch.publish()
+
+        if self.publish_ids:
+            committed = [
+                (index, row)
+                for index, row in zip(indices, rows)
+                if index not in batch.failed
+            ]
+            transaction_ids = self.fetch_transaction_ids([row for _, row in committed])
+            for (index, row), transaction_id in zip(committed, transaction_ids):
+                items[index]["ids"] = self.transaction_ids(
+                    items[index], row, transaction_id, self.cached_lookup
+                )
+
+        return batch.failed
+
+    def resolve_dimension(
+        self, batch, table, key_columns, columns, key_of, row_of, unique=True
+    ):
+        """Resolves the ids of a dimension table for a batch, inserting the missing keys
+
+        Keys with a unique index are upserted and then selected, keys without one
+        are selected first so that only the missing ones are inserted.
+
+        Args:
+            batch (WriteBatch): The batch being written
+            table (str): The dimension table
+            key_columns (tuple): The columns of the natural key
+            columns (tuple): The columns inserted for a new key
+            key_of (Callable): Returns the natural key of an item, or None to skip it
+            row_of (Callable): Returns the inserted row of an item
+            unique (bool): If the natural key has a unique index
+        """
+        pending = {}
+        for index in batch.pending_indices():
+            key = key_of(batch.items[index])
+            if key is not None and batch.lookup(table, key) is None:
+                pending.setdefault(key, []).append(index)
+
+        if not pending:
+            return
+
+        resolved = batch.resolved[table]
+        if not unique:
+            resolved.update(self.fetch_ids(table, key_columns, list(pending)))
+        else:
+            # Unique indexes let rows with a NULL through, so those keys are
+            # looked up first to not insert them again
+            nullable = [key for key in pending if self.has_null(key)]
+            resolved.update(self.fetch_ids(table, key_columns, nullable))
+
+        missing = [key for key in pending if key not in resolved]
+        rows = [row_of(batch.items[pending[key][0]]) for key in missing]
+        errors = self.insert_rows(
+            table, columns, rows, self.backend.on_duplicate() if unique else None
+        )
+
+        inserted = [
+            key for position, key in enumerate(missing) if position not in errors
+        ]
+        resolved.update(self.fetch_ids(table, key_columns, inserted))
+
+        for position, key in enumerate(missing):
+            if key in resolved:
+                continue
+            reason = errors.get(position, f"{key} not found in {table} table")
+            for index in pending[key]:
+                batch.fail(index, f"Error at {table}, inserting: {reason}")
+
+    def fetch_ids(self, table, key_columns, keys):
+        """Retrieves the ids of several natural keys with as few SELECTs as possible
+
+        Keys without NULLs are matched with a row value IN list, which never
+        matches a NULL, and keys with one are compared column by column with the
+        NULL-safe operator of the backend.
+
+        Args:
+            table (str): The table to read from
+            key_columns (tuple): The columns of the natural key
+            keys (list): The natural keys to look up
+
+        Returns:
+            dict: Every found natural key mapped to its id
+        """
+        ids = {}
+        columns = ", ".join(key_columns)
+        placeholder = "(" + ", ".join(["%s"] * len(key_columns)) + ")"
+        null_safe = (
+            "("
+            + " AND ".join(
+                f"{column} {self.backend.NULL_SAFE_EQUAL} %s" for column in key_columns
+            )
+            + ")"
+        )
+
+        for nullable in (False, True):
+            selected = [key for key in keys if self.has_null(key) == nullable]
+            condition = null_safe if nullable else placeholder
+
+            for start in range(0, len(selected), self.IN_CHUNK_SIZE):
+                chunk = selected[start : start + self.IN_CHUNK_SIZE]
+                params = []
+                for key in chunk:
+                    params.extend(key if len(key_columns) > 1 else (key,))
+
+                conditions = [condition] * len(chunk)
+                if nullable:
+                    where = " OR ".join(conditions)
+                else:
+                    where = f"({columns}) IN ({', '.join(conditions)})"
+
+                self.cursor.execute(
+                    f"SELECT {columns}, id FROM {table} WHERE {where}",
+                    tuple(params),
+                )
+                for *key, row_id in self.cursor.fetchall():
+                    ids[key[0] if len(key) == 1 else tuple(key)] = row_id
+
+        return ids
+
+    @staticmethod
+    def has_null(key):
+        """Checks if a natural key has a NULL column
+
+        Args:
+            key (Hashable): A value, or a tuple of values for composite keys
+
+        Returns:
+            bool: True if the key or one of its values is None
+        """
+        return key is None or (isinstance(key, tuple) and None in key)
+
+    def insert_rows(self, table, columns, rows, on_duplicate=None):
+        """Inserts rows with executemany, retrying them one by one if the batch fails
+
+        Args:
+            table (str): The table to insert into
+            columns (tuple): The inserted columns
+            rows (list): The rows to insert
+            on_duplicate (str): Clause of the backend handling existing rows, if any
+
+        Returns:
+            dict: Position of every row that could not be inserted mapped to its error
+        """
+        if not rows:
+            return {}
+
+        query = f"""
+            INSERT INTO {table}
+            ({", ".join(columns)})
+            VALUES
+            ({", ".join(["%s"] * len(columns))})"""
+
+        if on_duplicate:
+            query += f"\n            {on_duplicate}"
+
+        self.cursor.execute("SAVEPOINT batch_rows")
+        try:
+            self.cursor.executemany(query, rows)
+            return {}
+        except self.backend.Error as err:
+            if self.is_connection_error(err):
+                raise
+            self.cursor.execute("ROLLBACK TO SAVEPOINT batch_rows")
+
+        errors = {}
+        for position, row in enumerate(rows):
+            self.cursor.execute("SAVEPOINT batch_row")
+            try:
+                self.cursor.execute(query, row)
+            except self.backend.Error as err:
+                if self.is_connection_error(err):
+                    raise
+                self.cursor.execute("ROLLBACK TO SAVEPOINT batch_row")
+                errors[position] = err
+
+        return errors
+
+    def transaction_row(self, item, lookup):
+        """Builds the Transactions row of an item from already resolved ids
+
+        Args:
+            item (scrapy.Item): The currently scraped item
+            lookup (Callable): Looks up an id in the batch or the cache
+
+        Returns:
+            tuple: The values of TRANSACTION_COLUMNS
+        """
+        company_id = lookup("Companies", item["issuer"])
+
+        return (
+            lookup("People", (company_id, item["name"])),
+            lookup(
+                "Instruments",
+                self.instrument_key(
+                    company_id,
+                    item["instrument_name"],
+                    item["instrument_type"],
+                    item["isin"],
+                ),
+            ),
+            self.calendar.id_of(item["transaction_date"]),
+            self.calendar.id_of(item["publication_date"]),
+            item["nature_of_purchase"],
+            item["related"],
+            item["volume"],
+            item["volume_unit"],
+            item["price"],
+            lookup("Currencies", item["currency"]),
+            row_occurrence(item),
+        )
+
+    """EVENT IDS"""
+
+    def cached_lookup(self, table, key):
+        """Looks up a committed id in the cache
+
+        Args:
+            table (str): The table the key belongs to
+            key (Hashable): The natural key
+
+        Returns:
+            int: The id, or None if it is not cached
+        """
+        return self.caches[table].get(key)
+
+    def transaction_ids(self, item, row, transaction_id, lookup):
+        """Collects the ids a committed item was stored with
+
+        Args:
+            item (scrapy.Item): The committed item
+            row (tuple): The values of TRANSACTION_COLUMNS it was written with
+            transaction_id (int): The id of its Transactions row, if known
+            lookup (Callable): Looks up the id of a dimension key
+
+        Returns:
+            dict: The transaction id and the ids of its dimension rows
+        """
+        ids = dict(zip(self.TRANSACTION_COLUMNS, row))
+
+        return {
+            "transaction_id": transaction_id,
+            "people_id": ids["people_id"],
+            "instrument_id": ids["instrument_id"],
+            "company_id": lookup("Companies", item["issuer"]),
+            "role_id": lookup("Roles", item["role"]),
+            "currency_id": ids["currency_id"],
+            "purchase_date_id": ids["purchase_date_id"],
+            "publication_date_id": ids["publication_date_id"],
+        }
+
+    def fetch_transaction_ids(self, rows):
+        """Looks up the ids of committed Transactions rows by their natural key
+
+        The key is computed by the database the same way as the generated
+        natural_key column, so the values do not have to be formatted like the
+        database does. Repeated rows share the natural key and are told apart by
+        their occurrence.
+
+        Args:
+            rows (list): Committed values of TRANSACTION_COLUMNS
+
+        Returns:
+            list: The id of every row, None where it could not be found
+        """
+        natural_key = self.backend.natural_key(
+            [
+                self.backend.cast("%s", "DECIMAL(14, 6)") if column == "price" else "%s"
+                for column in TRANSACTION_KEY_COLUMNS
+            ]
+        )
+        key_of = (
+            f"SELECT %s AS position, {natural_key} AS natural_key, %s AS occurrence"
+        )
+        key_positions = [
+            self.TRANSACTION_COLUMNS.index(column)
+            for column in TRANSACTION_KEY_COLUMNS + ("occurrence",)
+        ]
+        ids = [None] * len(rows)
+
+        for start in range(0, len(rows), self.IN_CHUNK_SIZE):
+            chunk = rows[start : start + self.IN_CHUNK_SIZE]
+            params = []
+            for position, row in enumerate(chunk, start):
+                params.append(position)
+                params.extend(row[index] for index in key_positions)
+
+            try:
+                self.cursor.execute(
+                    f"""
+                    SELECT keys_.position, t.id
+                    FROM ({" UNION ALL ".join([key_of] * len(chunk))}) AS keys_
+                    JOIN Transactions AS t ON t.natural_key = keys_.natural_key
+                    AND t.occurrence = keys_.occurrence""",
+                    tuple(params),
+                )
+                result = self.cursor.fetchall()
+            except self.backend.Error as err:
+                if self.is_connection_error(err):
+                    raise
+                logger.error(f"Error at Transactions, reading ids: {err}")
+                continue
+
+            for position, row_id in result:
+                ids[position] = row_id
+
+        return ids
+
+    """ACTIVITY TABLES"""
+
+    @timed
+    def refresh_activity(self, days):
+        """Recomputes the activity rows of the transaction dates of written rows
+
+        Runs before the commit of the rows, so the aggregates are committed with
+        them. Does nothing if ACTIVITY_TABLES_ENABLED is off.
+
+        Args:
+            days (Iterable): Transaction dates of the written items
+        """
+        if self.activity:
+            self.activity.refresh(self.cursor, days)
+
     """CLOSE SPIDER"""
 
     def close_spider(self, spider):
         """Method called when the spider is closed"""
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+
+        deferred = self.flush_buffer()
+        deferred.addCallback(lambda _: self.run_in_pool(self.close_db))
+        deferred.addBoth(self.stop_threadpool)
+
+        return deferred
+
+    def close_db(self):
+        """Saves the in-memory state and closes the database, called on the database thread"""
+        self.save_high_water_mark()
         self.close_db_connection()
 
+    def stop_threadpool(self, result):
+        """Stops the database thread once all of its work is done
+
+        Args:
+            result (Any): Result of the previous callback, passed through
+        """
+        self.threadpool.stop()
+        return result
+
+    def save_high_water_mark(self):
+        """Writes the newest committed publication to the state file, if one is configured"""
+        if self.high_water_mark_file and self.high_water_mark:
+            self.high_water_mark.save(self.high_water_mark_file)
+
     def close_db_connection(self):
-        """Close both the cursor and the connection to the database."""
+        """Close the cursors and the connection to the database.
+
+        Every cursor is closed on its own, so a cursor of a dropped connection
+        cannot keep the connection from being closed.
+        """
+        cursors = list(self.statements.values())
+        if self.cursor:
+            cursors.append(self.cursor)
+        self.statements = {}
+
         try:
-            if self.cursor:
-                self.cursor.close()
+            for cursor in cursors:
+                try:
+                    cursor.close()
+                except self.backend.Error as err:
+                    logger.warning(f"Error closing cursor: {err}")
+        finally:
             if self.conn:
-                self.conn.close()
-        except mysql.connector.Error as err:
-            print(f"Error closing connection: {err}")
+                try:
+                    self.conn.close()
+                except self.backend.Error as err:
+                    logger.warning(f"Error closing connection: {err}")
+
+
+class BulkLoadPipeline(MySqlPipeline):
+    """Backfill variant of MySqlPipeline that loads the whole crawl at once
+
+    Items are streamed to a gzipped, tab separated spool file while crawling. When
+    the spider closes the spool is loaded with LOAD DATA LOCAL INFILE into a
+    staging table and the dimension tables and Transactions are resolved with
+    set-based SQL. The server needs local_infile enabled. With BULK_LOAD_DEFERRED
+    the spool is kept so the spools of several crawls can be loaded together.
+    """
+
+    STAGING_COLUMNS = (
+        "publication_date",
+        "issuer",
+        "name",
+        "role",
+        "related",
+        "nature_of_purchase",
+        "instrument_name",
+        "instrument_type",
+        "isin",
+        "transaction_date",
+        "volume",
+        "volume_unit",
+        "price",
+        "currency",
+        "occurrence",
+    )
+    # Escapes of the default LOAD DATA format (FIELDS ESCAPED BY '\\')
+    ESCAPES = str.maketrans(
+        {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"}
+    )
+
+    def __init__(self, spool_dir: str = ".spool", defer_load: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.spool_dir = spool_dir
+        self.defer_load = defer_load
+        self.spool_path = None
+        self.spool = None
+        self.spooled_items = 0
+        self.backend.connect_options = {"allow_local_infile": True}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Creates the pipeline using the crawler settings"""
+        if not bulk_load_enabled(crawler.settings):
+            raise NotConfigured("MYSQL_BULK_LOAD is not set or not supported")
+
+        kwargs = cls.settings_kwargs(crawler.settings)
+        # Everything is written by the load at close, nothing is buffered
+        kwargs["batch_size"] = 0
+
+        pipeline = cls(
+            spool_dir=crawler.settings.get("BULK_LOAD_SPOOL_DIR", ".spool"),
+            defer_load=crawler.settings.getbool("BULK_LOAD_DEFERRED"),
+            **kwargs,
+        )
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    """OPEN SPIDER"""
+
+    def open_spider(self, spider):
+        """Method called when the spider is opened"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spool_path = os.path.join(
+            self.spool_dir,
+            f"{spider.name}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}.tsv.gz",
+        )
+        self.spool = gzip.open(self.spool_path, "wt", encoding="utf-8", newline="")
+
+        # The spool is merged by whoever loads it, the crawl needs no database
+        if self.defer_load:
+            return None
+
+        return super().open_spider(spider)
+
+    """PROCESS ITEM"""
+
+    @timed
+    def process_item(self, item, spider):
+        """Method called for every item pipeline component"""
+        self.spool.write(self.spool_line(item))
+        self.spooled_items += 1
+        self.high_water_mark.update(item)
+
+        return item
+
+    def spool_line(self, item):
+        """Formats an item as a line of the spool file
+
+        Args:
+            item (scrapy.Item): The currently scraped item
+
+        Returns:
+            str: Tab separated line in the default LOAD DATA format
+        """
+        fields = []
+        for column in self.STAGING_COLUMNS:
+            value = row_occurrence(item) if column == "occurrence" else item[column]
+            fields.append(
+                "\\N" if value is None else str(value).translate(self.ESCAPES)
+            )
+
+        return "\t".join(fields) + "\n"
+
+    """CLOSE SPIDER"""
+
+    def close_spider(self, spider):
+        """Method called when the spider is closed"""
+        self.spool.close()
+
+        if self.defer_load:
+            if not self.spooled_items:
+                os.remove(self.spool_path)
+            return None
+
+        if self.spooled_items:
+            deferred = self.run_in_pool(
+                self.with_reconnect, self.load_spools, [self.spool_path]
+            )
+        else:
+            os.remove(self.spool_path)
+            deferred = defer.succeed(None)
+
+        deferred.addCallback(lambda _: self.run_in_pool(self.close_db))
+        deferred.addBoth(self.stop_threadpool)
+
+        return deferred
+
+    @timed
+    def load_spools(self, paths):
+        """Loads spool files into the database in one transaction and removes them
+
+        Args:
+            paths (list): The gzipped spool files
+        """
+        # Dates added by a load that was rolled back are not in the table anymore
+        self.calendar = DateCalendar()
+        self.fill_dates_table()
+
+        self.create_staging_table()
+
+        for path in paths:
+            self.load_spool(path)
+
+        # A temporary table can only be referred to once per statement
+        staged_dates = {}
+        for column in ("publication_date", "transaction_date"):
+            self.cursor.execute(f"SELECT DISTINCT {column} FROM staging_transactions")
+            staged_dates[column] = [value for value, in self.cursor.fetchall()]
+        self.extend_calendar(
+            staged_dates["publication_date"] + staged_dates["transaction_date"],
+            commit=False,
+        )
+
+        self.resolve_staged_dimensions()
+        inserted, updated = self.resolve_staged_transactions()
+        self.refresh_activity(staged_dates["transaction_date"])
+        self.conn.commit()
+
+        self.cursor.execute("SELECT COUNT(*) FROM staging_transactions")
+        (staged,) = self.cursor.fetchone()
+        self.cursor.execute("DROP TEMPORARY TABLE staging_transactions")
+
+        logger.info(
+            f"Bulk load: {staged} staged rows, {inserted} rows inserted into and "
+            f"{updated} rows updated in Transactions"
+        )
+
+        self.save_high_water_mark()
+        for path in paths:
+            os.remove(path)
+
+    def create_staging_table(self):
+        """Create the temporary staging table the spool files are loaded into."""
+        self.cursor.execute("DROP TEMPORARY TABLE IF EXISTS staging_transactions")
+        self.cursor.execute(
+            """CREATE TEMPORARY TABLE staging_transactions (
+            publication_date DATE,
+            issuer VARCHAR(255),
+            name VARCHAR(255),
+            role VARCHAR(255),
+            related VARCHAR(20),
+            nature_of_purchase VARCHAR(100),
+            instrument_name VARCHAR(200),
+            instrument_type VARCHAR(75),
+            isin VARCHAR(40),
+            transaction_date DATE,
+            volume INT,
+            volume_unit VARCHAR(50),
+            price DECIMAL(14, 6),
+            currency VARCHAR(10),
+            occurrence INT NOT NULL DEFAULT 1,
+            KEY (issuer),
+            KEY (isin)
+            )"""
+        )
+
+    def load_spool(self, path):
+        """Decompresses a spool file and loads it into the staging table
+
+        Args:
+            path (str): The gzipped spool file
+        """
+        with tempfile.NamedTemporaryFile(suffix=".tsv", delete=False) as plain:
+            with gzip.open(path, "rb") as spool:
+                shutil.copyfileobj(spool, plain)
+
+        try:
+            self.cursor.execute(
+                f"""LOAD DATA LOCAL INFILE %s INTO TABLE staging_transactions
+                CHARACTER SET utf8mb4
+                ({", ".join(self.STAGING_COLUMNS)})""",
+                (plain.name,),
+            )
+        finally:
+            os.remove(plain.name)
+
+    def resolve_staged_dimensions(self):
+        """Inserts the dimension rows of every staged transaction with set-based SQL."""
+        # Non-dependet tables
+        for table, column, staged in (
+            ("Currencies", "currency", "currency"),
+            ("Roles", "role", "role"),
+            ("Companies", "name", "issuer"),
+        ):
+            self.cursor.execute(
+                f"""
+                INSERT INTO {table}
+                ({column})
+                SELECT DISTINCT {staged} FROM staging_transactions
+                WHERE {staged} IS NOT NULL
+                ON DUPLICATE KEY UPDATE id = {table}.id"""
+            )
+
+        # Dependet tables
+        self.cursor.execute(
+            """
+            INSERT INTO Instruments
+            (company_id, name, type, isin)
+            SELECT MIN(c.id), MIN(s.instrument_name), MIN(s.instrument_type), s.isin
+            FROM staging_transactions s
+            JOIN Companies c ON c.name = s.issuer
+            WHERE s.isin IS NOT NULL
+            GROUP BY s.isin
+            ON DUPLICATE KEY UPDATE id = Instruments.id"""
+        )
+        self.cursor.execute(
+            """
+            INSERT INTO Instruments
+            (company_id, name, type, isin)
+            SELECT DISTINCT c.id, s.instrument_name, s.instrument_type, NULL
+            FROM staging_transactions s
+            JOIN Companies c ON c.name = s.issuer
+            WHERE s.isin IS NULL AND NOT EXISTS (
+                SELECT 1 FROM Instruments i
+                WHERE i.isin IS NULL AND i.company_id = c.id
+                AND i.name <=> s.instrument_name AND i.type <=> s.instrument_type
+            )"""
+        )
+        self.cursor.execute(
+            """
+            INSERT INTO People
+            (role_id, company_id, name)
+            SELECT MIN(r.id), c.id, s.name
+            FROM staging_transactions s
+            JOIN Companies c ON c.name = s.issuer
+            LEFT JOIN Roles r ON r.role = s.role
+            GROUP BY c.id, s.name
+            ON DUPLICATE KEY UPDATE id = People.id"""
+        )
+
+    def resolve_staged_transactions(self):
+        """Inserts every staged transaction whose dimension rows could be resolved
+
+        ON DUPLICATE KEY UPDATE reports an updated row as two affected rows, so the
+        inserted rows are counted in the table.
+
+        Returns:
+            tuple: The number of rows inserted into and updated in Transactions
+        """
+        self.cursor.execute("SELECT COUNT(*) FROM Transactions")
+        (before,) = self.cursor.fetchone()
+        affected = 0
+
+        for instrument_join, isin_filter in (
+            ("JOIN Instruments i ON i.isin = s.isin", "s.isin IS NOT NULL"),
+            (
+                """JOIN Instruments i ON i.id = (
+                SELECT MIN(id) FROM Instruments
+                WHERE isin IS NULL AND company_id = c.id
+                AND name <=> s.instrument_name AND type <=> s.instrument_type
+                )""",
+                "s.isin IS NULL",
+            ),
+        ):
+            self.cursor.execute(
+                f"""
+                INSERT INTO Transactions
+                ({", ".join(self.TRANSACTION_COLUMNS)})
+                SELECT p.id, i.id, pur.id, pub.id, s.nature_of_purchase, s.related,
+                s.volume, s.volume_unit, s.price, cur.id, s.occurrence
+                FROM staging_transactions s
+                JOIN Companies c ON c.name = s.issuer
+                JOIN People p ON p.company_id = c.id AND p.name = s.name
+                {instrument_join}
+                JOIN Dates pub ON pub.date = s.publication_date
+                JOIN Dates pur ON pur.date = s.transaction_date
+                JOIN Currencies cur ON cur.currency = s.currency
+                WHERE {isin_filter}
+                ON DUPLICATE KEY UPDATE related = VALUES(related)"""
+            )
+            affected += self.cursor.rowcount
+
+        self.cursor.execute("SELECT COUNT(*) FROM Transactions")
+        (after,) = self.cursor.fetchone()
+        inserted = after - before
+
+        return inserted, (affected - inserted) // 2
+
+
+class EventStreamPipeline:
+    """Publishes every committed transaction to a local Server-Sent Events stream
+
+    Runs after MySqlPipeline, so it only sees items whose transaction has been
+    committed, with the ids MySqlPipeline stored them under. Consumers connect to
+    /events on EVENT_STREAM_PORT or EVENT_STREAM_SOCKET instead of polling the
+    Transactions table, and a reconnecting consumer is replayed the events it
+    missed from the last EVENT_STREAM_REPLAY_SIZE.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8070,
+        socket_path: str = None,
+        replay_size: int = 1000,
+        keep_alive: float = 15.0,
+    ):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.replay_size = replay_size
+        self.keep_alive = keep_alive
+
+        self.channel = None
+        self.listeners = []
+        self.keep_alive_loop = None
+
+        # Crawler stats, published events are only counted when set
+        self.stats = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Creates the pipeline using the crawler settings"""
+        settings = crawler.settings
+        if not settings.getbool("EVENT_STREAM_ENABLED"):
+            raise NotConfigured("EVENT_STREAM_ENABLED is not set")
+        if bulk_load_enabled(settings):
+            raise NotConfigured("MYSQL_BULK_LOAD is set, items are committed at close")
+
+        pipeline = cls(
+            host=settings.get("EVENT_STREAM_HOST", "127.0.0.1"),
+            port=settings.getint("EVENT_STREAM_PORT", 8070),
+            socket_path=settings.get("EVENT_STREAM_SOCKET"),
+            replay_size=settings.getint("EVENT_STREAM_REPLAY_SIZE", 1000),
+            keep_alive=settings.getfloat("EVENT_STREAM_KEEP_ALIVE", 15.0),
+        )
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    """OPEN SPIDER"""
+
+    def open_spider(self, spider):
+        """Method called when the spider is opened"""
+        from twisted.internet import reactor
+
+        self.channel = EventChannel(self.replay_size, self.stats)
+        site = event_site(self.channel)
+
+        if self.port:
+            self.listeners.append(
+                reactor.listenTCP(self.port, site, interface=self.host)
+            )
+            spider.logger.info(f"Event stream on http://{self.host}:{self.port}/events")
+
+        if self.socket_path:
+            # A socket left behind by a crawl that did not close cleanly
+            if os.path.exists(self.socket_path) and stat.S_ISSOCK(
+                os.stat(self.socket_path).st_mode
+            ):
+                os.remove(self.socket_path)
+            self.listeners.append(reactor.listenUNIX(self.socket_path, site))
+            spider.logger.info(f"Event stream on {self.socket_path}, path /events")
+
+        self.keep_alive_loop = task.LoopingCall(self.channel.keep_alive)
+        self.keep_alive_loop.start(self.keep_alive, now=False)
+
+    """PROCESS ITEM"""
+
+    def process_item(self, item, spider):
+        """Method called for every item pipeline component"""
+        self.channel.publish("transaction", transaction_event(item))
+        return item
+
+    """CLOSE SPIDER"""
+
+    def close_spider(self, spider):
+        """Method called when the spider is closed"""
+        if self.keep_alive_loop and self.keep_alive_loop.running:
+            self.keep_alive_loop.stop()
+
+        self.channel.close()
+
+        return defer.DeferredList(
+            [defer.maybeDeferred(listener.stopListening) for listener in self.listeners]
+        )
+
+
+class AnalyticsPipeline:
+    """Appends the cleansed transactions to the Parquet analytics store
+
+    Runs after MySqlPipeline and keeps aggregations off the transactional
+    database: the rows go to files partitioned by publication month under
+    ANALYTICS_DIR, which `scrapy analytics` queries with DuckDB. Rows are written
+    on a thread of their own in batches of ANALYTICS_BATCH_SIZE, every
+    ANALYTICS_FLUSH_INTERVAL seconds and when the spider closes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        batch_size: int = 10000,
+        flush_interval: float = 60.0,
+    ):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.store = None
+        self.buffer = []
+        self.flush_loop = None
+        # Chain of the writes, so batches are written in order
+        self.writing = defer.succeed(None)
+
+        # Crawler stats, written rows are only counted when set
+        self.stats = None
+
+        # The store is only used on this thread
+        self.threadpool = ThreadPool(
+            minthreads=1, maxthreads=1, name="AnalyticsPipeline"
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Creates the pipeline using the crawler settings"""
+        settings = crawler.settings
+        if not settings.get("ANALYTICS_DIR"):
+            raise NotConfigured("ANALYTICS_DIR is not set")
+        if analytics.pa is None:
+            raise NotConfigured("pyarrow is not installed")
+
+        pipeline = cls(
+            directory=settings.get("ANALYTICS_DIR"),
+            batch_size=settings.getint("ANALYTICS_BATCH_SIZE", 10000),
+            flush_interval=settings.getfloat("ANALYTICS_FLUSH_INTERVAL", 60.0),
+        )
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    """OPEN SPIDER"""
+
+    def open_spider(self, spider):
+        """Method called when the spider is opened"""
+        self.store = analytics.ParquetStore(self.directory, self.stats)
+        self.threadpool.start()
+
+        self.flush_loop = task.LoopingCall(self.flush_buffer)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    """PROCESS ITEM"""
+
+    def process_item(self, item, spider):
+        """Method called for every item pipeline component"""
+        self.buffer.append(item)
+        if len(self.buffer) >= self.batch_size:
+            self.flush_buffer()
+
+        return item
+
+    def flush_buffer(self):
+        """Hands the buffered items to the analytics thread
+
+        Returns:
+            Deferred: Fires once every batch handed over so far is written
+        """
+        from twisted.internet import reactor
+
+        if self.buffer:
+            items, self.buffer = self.buffer, []
+            self.writing.addCallback(
+                lambda _: threads.deferToThreadPool(
+                    reactor, self.threadpool, self.write_items, items
+                )
+            )
+            self.writing.addErrback(self.write_failed, items)
+
+        return self.writing
+
+    def write_items(self, items):
+        """Writes the items that are not stored yet, called on the analytics thread
+
+        Args:
+            items (list): The buffered items
+        """
+        for item in items:
+            self.store.add(item)
+        self.store.flush()
+
+    def write_failed(self, failure, items):
+        """Reports a batch that could not be written, later batches are still written
+
+        Args:
+            failure (Failure): The error of the write
+            items (list): The items of the batch
+        """
+        logger.error(f"Error writing analytics: {failure.value}")
+        if self.stats is not None:
+            self.stats.inc_value("analytics/write_failures")
+            self.stats.inc_value("analytics/rows_failed", len(items))
+
+        # Rows of the batch that were taken as stored are offered again
+        self.store.forget_stored()
+
+    """CLOSE SPIDER"""
+
+    def close_spider(self, spider):
+        """Method called when the spider is closed"""
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+
+        deferred = self.flush_buffer()
+        deferred.addBoth(self.stop_threadpool)
+
+        return deferred
+
+    def stop_threadpool(self, result):
+        """Stops the analytics thread once all of its work is done
+
+        Args:
+            result (Any): Result of the previous callback, passed through
+        """
+        self.threadpool.stop()
+        return result
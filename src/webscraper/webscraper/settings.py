@@ -50,23 +50,128 @@ ROBOTSTXT_OBEY = False
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "webscraper.middlewares.WebscraperDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+    "webscraper.middlewares.WebscraperDownloaderMiddleware": 543,
+    # After RetryMiddleware (550) so it sees the errors before they are retried
+    "webscraper.middlewares.AdaptiveThrottleMiddleware": 560,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-# }
+EXTENSIONS = {
+    "webscraper.extensions.CheckpointExtension": 500,
+    "webscraper.extensions.CrawlResultExtension": 510,
+    "webscraper.extensions.MetricsExtension": 520,
+    "webscraper.extensions.FingerprintExtension": 530,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
     "webscraper.pipelines.DataCleansePipeline": 100,
     "webscraper.pipelines.MySqlPipeline": 200,
+    "webscraper.pipelines.BulkLoadPipeline": 200,
+    "webscraper.pipelines.AnalyticsPipeline": 250,
+    "webscraper.pipelines.EventStreamPipeline": 300,
 }
 
+# Append the cleansed transactions to Parquet files partitioned by publication
+# month under ANALYTICS_DIR, for `scrapy analytics` to aggregate with DuckDB
+# instead of the transactional database. Needs pyarrow, and duckdb to query.
+# Rows are written every ANALYTICS_BATCH_SIZE items, every
+# ANALYTICS_FLUSH_INTERVAL seconds and when the spider closes.
+# ANALYTICS_DIR = ".analytics"
+ANALYTICS_BATCH_SIZE = 10000
+ANALYTICS_FLUSH_INTERVAL = 60.0
+
+# Publish every committed transaction with its database ids as Server-Sent Events
+# on http://EVENT_STREAM_HOST:EVENT_STREAM_PORT/events, and on the Unix socket
+# EVENT_STREAM_SOCKET when set. The last EVENT_STREAM_REPLAY_SIZE events are
+# replayed to clients reconnecting with a Last-Event-ID.
+EVENT_STREAM_ENABLED = False
+EVENT_STREAM_HOST = "127.0.0.1"
+EVENT_STREAM_PORT = 8070
+# EVENT_STREAM_SOCKET = ".state/events.sock"
+EVENT_STREAM_REPLAY_SIZE = 1000
+EVENT_STREAM_KEEP_ALIVE = 15.0
+
+# Backfill mode, `scrapy crawl cas -s MYSQL_BULK_LOAD=1` spools the items to
+# BULK_LOAD_SPOOL_DIR and loads them with LOAD DATA LOCAL INFILE when the spider
+# closes. Only one of MySqlPipeline and BulkLoadPipeline is enabled at a time.
+MYSQL_BULK_LOAD = False
+BULK_LOAD_SPOOL_DIR = ".spool"
+# Keep the spool instead of loading it, `scrapy backfill --spool` merges the
+# spools of all its shards in one load at the end
+BULK_LOAD_DEFERRED = False
+
+# `scrapy backfill` splits a date window into shards that worker processes lease
+# from this queue
+COMMANDS_MODULE = "webscraper.commands"
+BACKFILL_QUEUE_FILE = ".state/backfill.sqlite3"
+
+# `scrapy benchmark` replays the synthetic pages shipped in BENCHMARK_PAGES_DIR, or
+# live ones recorded with `scrapy benchmark --record N`, and compares the results
+# with the stored baseline
+BENCHMARK_PAGES_DIR = "benchmarks/pages"
+BENCHMARK_BASELINE_FILE = "benchmarks/baseline.json"
+
+# Listing crawled by the cas spider, can point to a local fixture server
+# CAS_PAGE_URL = "http://127.0.0.1:8000/publiceringsklient?page={}"
+
+# Scrape rows as slotted WebscraperRecord objects instead of WebscraperItem,
+# smaller and cheaper to read in the pipelines. Compare with `scrapy benchmark`.
+COMPACT_ITEMS = False
+
+# Database MySqlPipeline writes to. SqliteBackend keeps everything in the
+# embedded SQLITE_DATABASE_FILE in WAL mode, with the same batches, for small
+# deployments, CI and benchmarks without a MySQL server. MYSQL_BULK_LOAD needs
+# MySqlBackend; with SqliteBackend the items are written by MySqlPipeline.
+STORAGE_BACKEND = "webscraper.storage.MySqlBackend"
+SQLITE_DATABASE_FILE = ".state/ik_index.sqlite3"
+
+# Keep the InstrumentActivity, IssuerActivity and RoleActivity tables of daily
+# and monthly net volume and value up to date as rows are written. The days a
+# batch touches are recomputed in its transaction, which costs about a dozen
+# statements per batch, or per item without MYSQL_BATCH_SIZE. Off by default:
+# `scrapy rebuild_activity` recomputes the tables after a crawl instead.
+ACTIVITY_TABLES_ENABLED = False
+
+# Maximum number of natural key -> id entries kept per dimension table
+# (Companies, Roles, Currencies, Instruments and People). Dates ids are computed
+# from the in-memory calendar instead.
+MYSQL_CACHE_SIZE = 10000
+
+# Buffer items and write them in one transaction per batch (0 writes every item
+# on its own). A batch is flushed when it is full, every MYSQL_FLUSH_INTERVAL
+# seconds and when the spider closes.
+MYSQL_BATCH_SIZE = 500
+MYSQL_FLUSH_INTERVAL = 5.0
+
+# Seconds the connection may sit idle before it is checked again, and how many
+# times lost work is replayed on a new connection
+MYSQL_PING_INTERVAL = 30.0
+MYSQL_RECONNECT_ATTEMPTS = 3
+
+# State file with the newest committed publication date and the rows stored on
+# it, written by MySqlPipeline and read by `scrapy crawl cas -a incremental=1`
+HIGH_WATER_MARK_FILE = ".state/high_water_mark.json"
+
+# Stage timings and SQL counters are kept in the crawler stats, MetricsExtension
+# logs a summary every METRICS_INTERVAL seconds and writes them in the Prometheus
+# text format to METRICS_PROMETHEUS_FILE when it is set
+METRICS_INTERVAL = 60.0
+# METRICS_PROMETHEUS_FILE = ".state/webscraper.prom"
+
+# Crawl progress written by CheckpointExtension as items are committed, a
+# killed crawl continues from it with `scrapy crawl cas -a resume=1`
+CHECKPOINT_FILE = ".state/checkpoint.json"
+CHECKPOINT_INTERVAL = 30.0
+
+# Content hashes of every listing page and row committed so far. With it set, a
+# recrawl only passes new rows and rows that changed (such as a new status) on to
+# the pipelines. Delete the file when the database is rebuilt from scratch.
+# FINGERPRINT_FILE = ".state/fingerprints.sqlite3"
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 # AUTOTHROTTLE_ENABLED = True
@@ -80,6 +185,41 @@ ITEM_PIPELINES = {
 # Enable showing throttling stats for every response received:
 # AUTOTHROTTLE_DEBUG = False
 
+# `scrapy watch` polls page 1 (and the next pages while all their rows are new)
+# every WATCH_MIN_INTERVAL seconds after a poll found new rows, backing off to
+# WATCH_MAX_INTERVAL while nothing is published. Identities of the last
+# WATCH_SEEN_SIZE rows are kept to tell new rows apart.
+WATCH_MIN_INTERVAL = 5.0
+WATCH_MAX_INTERVAL = 30.0
+WATCH_MAX_PAGES = 5
+WATCH_SEEN_SIZE = 1000
+
+# Adapt the download delay (starting from the spider's delay argument) and, for
+# `-a concurrency=N` crawls, the pages in flight to the response latency. Windows
+# of ADAPTIVE_THROTTLE_WINDOW responses with a mean latency up to the target speed
+# up, slower ones slow down, and 429, 5xx and timeouts back off exponentially.
+# Decisions are counted in the adaptive_throttle/* stats.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.5
+ADAPTIVE_THROTTLE_MAX_DELAY = 60.0
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 4
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 1.0
+ADAPTIVE_THROTTLE_WINDOW = 10
+
+# Keep listing pages gzipped in LISTING_CACHE_DIR for reprocessing and development
+# runs. Pages whose newest row is older than LISTING_CACHE_RECENT_DAYS are fresh
+# for LISTING_CACHE_OLD_TTL seconds, newer pages for LISTING_CACHE_RECENT_TTL, and
+# expired pages are revalidated with conditional requests. Cached pages predate
+# the rows published since they were stored, so a crawl that mixes them with
+# fresh pages can miss those rows at the boundary; leave it off for crawls that
+# must be complete.
+LISTING_CACHE_ENABLED = False
+LISTING_CACHE_DIR = ".cache/listing"
+LISTING_CACHE_RECENT_TTL = 600.0
+LISTING_CACHE_OLD_TTL = 30 * 86400.0
+LISTING_CACHE_RECENT_DAYS = 7
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 # HTTPCACHE_ENABLED = True
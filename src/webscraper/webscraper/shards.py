@@ -0,0 +1,234 @@
+import os
+import socket
+import sqlite3
+import time
+
+from datetime import timedelta
+
+from .dates import to_date
+
+
+def split_window(start_date, end_date, days):
+    """Splits a date window into consecutive shards of at most a number of days
+
+    A window collects the rows published after its end date up to and including
+    its start date, so the shards cover the window without gaps or overlaps.
+
+    Args:
+        start_date (str): The newest publication date of the window in YYYY-MM-DD format
+        end_date (str): The date the window stops at in YYYY-MM-DD format
+        days (int): The number of days of each shard
+
+    Returns:
+        list: The (start_date, end_date) pairs of the shards, newest first
+    """
+    start, end = to_date(start_date), to_date(end_date)
+    if start is None or end is None:
+        raise ValueError("Dates must be in YYYY-MM-DD format")
+    if days < 1:
+        raise ValueError("A shard must span at least one day")
+
+    shards = []
+    while start > end:
+        shard_end = max(start - timedelta(days=days), end)
+        shards.append((start.isoformat(), shard_end.isoformat()))
+        start = shard_end
+
+    return shards
+
+
+class ShardQueue:
+    """SQLite backed queue of date window shards that workers lease
+
+    A lease runs out unless it is renewed, after which the shard can be leased
+    again, so the shards of a worker that died are retried by another one.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300.0, attempts: int = 3):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.attempts = attempts
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS Shards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                error TEXT,
+                UNIQUE (start_date, end_date)
+            )"""
+        )
+
+    @staticmethod
+    def worker_name(slot=0):
+        """Returns a name for a worker that is unique on the network
+
+        Args:
+            slot (int): The number of the worker within its process
+
+        Returns:
+            str: The worker name
+        """
+        return f"{socket.gethostname()}:{os.getpid()}:{slot}"
+
+    def add(self, shards):
+        """Adds shards that are not in the queue yet
+
+        Args:
+            shards (list): The (start_date, end_date) pairs of the shards
+
+        Returns:
+            int: The number of shards added
+        """
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO Shards (start_date, end_date) VALUES (?, ?)",
+            shards,
+        )
+        return self.conn.total_changes - before
+
+    def lease(self, worker):
+        """Leases the newest pending shard, or a shard whose lease ran out
+
+        Args:
+            worker (str): The name of the worker
+
+        Returns:
+            tuple: The (id, start_date, end_date, attempts) of the shard, or None
+        """
+        now = time.time()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                """
+                SELECT id, start_date, end_date, attempts FROM Shards
+                WHERE state = 'pending'
+                OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY start_date DESC LIMIT 1""",
+                (now,),
+            ).fetchone()
+
+            if row is not None and row[3] >= self.attempts:
+                self.conn.execute(
+                    "UPDATE Shards SET state = 'failed', worker = NULL WHERE id = ?",
+                    (row[0],),
+                )
+                self.conn.execute("COMMIT")
+                return self.lease(worker)
+
+            if row is not None:
+                self.conn.execute(
+                    """
+                    UPDATE Shards SET state = 'leased', worker = ?,
+                    lease_expires = ?, attempts = attempts + 1
+                    WHERE id = ?""",
+                    (worker, now + self.lease_seconds, row[0]),
+                )
+                row = (row[0], row[1], row[2], row[3] + 1)
+
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return row
+
+    def renew(self, shard_id, worker):
+        """Extends the lease of a shard that is still being worked on
+
+        Args:
+            shard_id (int): The id of the shard
+            worker (str): The name of the worker holding the lease
+
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        cursor = self.conn.execute(
+            """
+            UPDATE Shards SET lease_expires = ?
+            WHERE id = ? AND worker = ? AND state = 'leased'""",
+            (time.time() + self.lease_seconds, shard_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id, worker):
+        """Marks a leased shard as done
+
+        Args:
+            shard_id (int): The id of the shard
+            worker (str): The name of the worker holding the lease
+        """
+        self.conn.execute(
+            """
+            UPDATE Shards SET state = 'done', lease_expires = NULL, error = NULL
+            WHERE id = ? AND worker = ?""",
+            (shard_id, worker),
+        )
+
+    def fail(self, shard_id, worker, error):
+        """Releases a shard that could not be collected so it is retried
+
+        Args:
+            shard_id (int): The id of the shard
+            worker (str): The name of the worker holding the lease
+            error (str): Why the shard failed
+        """
+        self.conn.execute(
+            """
+            UPDATE Shards SET
+            state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            worker = NULL, lease_expires = NULL, error = ?
+            WHERE id = ? AND worker = ?""",
+            (self.attempts, error, shard_id, worker),
+        )
+
+    def counts(self):
+        """Counts the shards in every state
+
+        Returns:
+            dict: The number of shards per state
+        """
+        return dict(
+            self.conn.execute("SELECT state, COUNT(*) FROM Shards GROUP BY state")
+        )
+
+    def unfinished(self):
+        """Counts the shards that may still be leased or are being worked on
+
+        Returns:
+            int: The number of pending and leased shards
+        """
+        (count,) = self.conn.execute(
+            "SELECT COUNT(*) FROM Shards WHERE state IN ('pending', 'leased')"
+        ).fetchone()
+        return count
+
+    def shards(self, state=None):
+        """Returns the shards of the queue
+
+        Args:
+            state (str): Only return shards in this state
+
+        Returns:
+            list: The (id, start_date, end_date, state) of the shards, newest first
+        """
+        query = "SELECT id, start_date, end_date, state FROM Shards"
+        params = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            params = (state,)
+
+        return self.conn.execute(query + " ORDER BY start_date DESC", params).fetchall()
+
+    def close(self):
+        self.conn.close()
@@ -1,10 +1,18 @@
 import scrapy
+import time
 
 from datetime import datetime, timedelta
+from lxml import etree
+from urllib.parse import urlparse
 from scrapy.http import Response
-from scrapy.exceptions import CloseSpider
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
 
-from ..items import WebscraperItem
+from ..cache import LRUCache
+from ..items import WebscraperItem, WebscraperRecord, row_identity
+from ..metrics import record_time, timed
+from ..state import CrawlCheckpoint, HighWaterMark
+from ..storage import storage_backend
 
 
 class AllFinancialDataSpider(scrapy.Spider):
@@ -13,12 +21,43 @@ class AllFinancialDataSpider(scrapy.Spider):
     start_urls = [
         "https://marknadssok.fi.se/publiceringsklient?page=",
     ]
+    page_url = "https://marknadssok.fi.se/publiceringsklient?page={}"
+
+    # Compiled once and reused for every page
+    ROWS_XPATH = etree.XPath('//*[@id="grid-list"]/div[1]/div/table/tbody/tr')
+    CELLS_XPATH = etree.XPath("td")
+    TEXT_XPATH = etree.XPath("text()")
+    STATUS_XPATH = etree.XPath("a/text()")
+
+    # Item fields in the order of the table columns, the status column is read from its link
+    ROW_FIELDS = (
+        "publication_date",
+        "issuer",
+        "name",
+        "role",
+        "related",
+        "nature_of_purchase",
+        "instrument_name",
+        "instrument_type",
+        "isin",
+        "transaction_date",
+        "volume",
+        "volume_unit",
+        "price",
+        "currency",
+    )
+    ITEM_FIELDS = ROW_FIELDS + ("status",)
 
     def __init__(
         self,
         start_date: str = None,
         end_date: str = None,
         page_jump: int = None,
+        concurrency: int = None,
+        delay: float = None,
+        incremental: str = None,
+        resume: str = None,
+        watch: str = None,
         *args,
         **kwargs,
     ):
@@ -27,9 +66,17 @@ class AllFinancialDataSpider(scrapy.Spider):
         self.COLLECTED_MAX_PAGES = False
 
         self.TODAY = datetime.today()
-        self.START_DATE = (
-            self._parse_date(start_date) if start_date else self._default_start_date()
-        )
+
+        # Only rows newer than what has already been stored are collected
+        self.INCREMENTAL = self._parse_flag(incremental)
+        self.HIGH_WATER_MARK = HighWaterMark()
+
+        if start_date:
+            self.START_DATE = self._parse_date(start_date)
+        elif self.INCREMENTAL:
+            self.START_DATE = self.TODAY.strftime("%Y-%m-%d")
+        else:
+            self.START_DATE = self._default_start_date()
         self.END_DATE = (
             self._parse_date(end_date) if end_date else self._default_end_date()
         )
@@ -39,8 +86,83 @@ class AllFinancialDataSpider(scrapy.Spider):
             1 if page_jump is None else self._validate_page_jump(page_jump)
         )
 
-        self.start_urls[0] = self.start_urls[0] + str(self.CURRENT_PAGE_NUMBER)
-        self.download_delay = 2
+        self.start_urls = [self.page_url.format(self.CURRENT_PAGE_NUMBER)]
+
+        # Pages requested at the same time once the page count is known
+        self.CONCURRENCY = (
+            1 if concurrency is None else self._validate_concurrency(concurrency)
+        )
+        self.max_concurrent_requests = self.CONCURRENCY
+        # Fixed for the whole crawl, CONCURRENCY may be adjusted while it runs
+        self.WINDOWED = self.CONCURRENCY > 1
+        self.download_delay = 2 if delay is None else self._validate_delay(delay)
+
+        self.NEXT_PAGE_NUMBER = self.CURRENT_PAGE_NUMBER + 1
+        self.END_PAGE_NUMBER = None
+        self.PAGES_IN_FLIGHT = set()
+
+        # Without a page jump the pages of a start date are found by bisection
+        self.LOCATING = bool(start_date) and page_jump is None
+        self.LOCATE_TARGETS = [self.START_DATE, self.END_DATE]
+        self.LOCATE_BOUNDS = None
+        self.LOCATE_STEP = 1
+        self.LOCATED_PAGES = []
+        self.PROBED_PAGES = {}
+
+        # Progress of the crawl, a resumed crawl continues from a stored checkpoint
+        self.RESUME = self._parse_flag(resume)
+        self.CHECKPOINT = CrawlCheckpoint(self.START_DATE, self.END_DATE)
+
+        # Rows are scraped as slotted records instead of scrapy items when set
+        self.COMPACT_ITEMS = False
+
+        # Content hashes of earlier crawls, unchanged rows are not passed on
+        self.FINGERPRINTS = None
+
+        # Watch mode keeps polling the first pages for new rows instead of closing
+        self.WATCH = self._parse_flag(watch)
+        self.WATCH_MIN_INTERVAL = 5.0
+        self.WATCH_MAX_INTERVAL = 30.0
+        self.WATCH_MAX_PAGES = 5
+        self.WATCH_INTERVAL = self.WATCH_MIN_INTERVAL
+        self.WATCH_SEEN = LRUCache(1000)
+        self.WATCH_DETECTED = {}
+        self.WATCH_POLL_STARTED = None
+        self.WATCH_PREVIOUS_POLL = None
+        self.WATCH_ROUND_NEW = 0
+        self.WATCH_CALL = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        page_url = crawler.settings.get("CAS_PAGE_URL")
+        if page_url:
+            spider.page_url = page_url
+            spider.allowed_domains = [urlparse(page_url).hostname]
+
+        spider.COMPACT_ITEMS = crawler.settings.getbool("COMPACT_ITEMS")
+
+        if spider.WATCH:
+            settings = crawler.settings
+            spider.WATCH_MIN_INTERVAL = settings.getfloat("WATCH_MIN_INTERVAL", 5.0)
+            spider.WATCH_MAX_INTERVAL = settings.getfloat("WATCH_MAX_INTERVAL", 30.0)
+            spider.WATCH_MAX_PAGES = settings.getint("WATCH_MAX_PAGES", 5)
+            spider.WATCH_INTERVAL = spider.WATCH_MIN_INTERVAL
+            spider.WATCH_SEEN = LRUCache(settings.getint("WATCH_SEEN_SIZE", 1000))
+
+            crawler.signals.connect(spider.watch_idle, signal=signals.spider_idle)
+            crawler.signals.connect(spider.watch_committed, signal=signals.item_scraped)
+            crawler.signals.connect(spider.watch_dropped, signal=signals.item_dropped)
+            crawler.signals.connect(spider.watch_dropped, signal=signals.item_error)
+
+        return spider
+
+    @property
+    def stats(self):
+        """The crawler stats, parsing is only timed when the spider runs in a crawler"""
+        crawler = getattr(self, "crawler", None)
+        return crawler.stats if crawler is not None else None
 
     def _parse_date(self, date_str: str):
         """Method parses the date and ensures correct fomatting
@@ -90,6 +212,106 @@ class AllFinancialDataSpider(scrapy.Spider):
             )
         return page_number
 
+    def _parse_flag(self, flag):
+        """Interpret a spider argument such as 1, true or yes as a boolean."""
+        return str(flag).strip().lower() in ("1", "true", "yes", "on")
+
+    def _validate_concurrency(self, concurrency):
+        """Validate and return the concurrency value as a positive integer."""
+        try:
+            value = int(concurrency)
+            if value < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"Invalid concurrency: {concurrency}. Must be a positive integer."
+            )
+        return value
+
+    def _validate_delay(self, delay):
+        """Validate and return the delay between requests as a non-negative number."""
+        try:
+            value = float(delay)
+            if value < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid delay: {delay}. Must be a non-negative number.")
+        return value
+
+    def start_requests(self):
+        """Loads the high water mark or the checkpoint before the first page is requested
+
+        Yields:
+            scrapy.Request: The first page
+        """
+        if self.WATCH:
+            self.HIGH_WATER_MARK = self.load_high_water_mark()
+            self.logger.info(
+                f"Watching for rows after {self.HIGH_WATER_MARK.publication_date}"
+            )
+            self.WATCH_POLL_STARTED = time.time()
+            yield self.watch_request(1)
+            return
+
+        if self.INCREMENTAL:
+            self.HIGH_WATER_MARK = self.load_high_water_mark()
+            self.logger.info(
+                f"Incremental crawl down to {self.HIGH_WATER_MARK.publication_date}"
+            )
+
+        if self.RESUME:
+            self.resume_crawl()
+
+        yield scrapy.Request(
+            self.page_url.format(self.CURRENT_PAGE_NUMBER),
+            callback=self.parse,
+            meta={"page": self.CURRENT_PAGE_NUMBER},
+            dont_filter=True,
+        )
+
+    def resume_crawl(self):
+        """Continues from the first page of the checkpoint that is not fully committed"""
+        path = self.settings.get("CHECKPOINT_FILE")
+        checkpoint = CrawlCheckpoint.load(path) if path else None
+
+        if checkpoint is None or checkpoint.resume_page() is None:
+            self.logger.warning("No checkpoint to resume from, starting over")
+            return
+
+        if checkpoint.finished:
+            self.logger.warning(
+                f"Checkpoint is from a crawl that finished ({checkpoint.finished})"
+            )
+
+        checkpoint.reopen()
+        self.CHECKPOINT = checkpoint
+
+        self.START_DATE = checkpoint.resume_date()
+        self.END_DATE = checkpoint.end_date
+        self.CURRENT_PAGE_NUMBER = checkpoint.resume_page()
+        self.NEXT_PAGE_NUMBER = self.CURRENT_PAGE_NUMBER + 1
+        self.start_urls = [self.page_url.format(self.CURRENT_PAGE_NUMBER)]
+        self.LOCATING = False
+
+        self.logger.info(
+            f"Resuming from page {self.CURRENT_PAGE_NUMBER} at {self.START_DATE}"
+            f" after {checkpoint.items_committed} committed items"
+        )
+
+    def load_high_water_mark(self):
+        """Reads the newest stored publication from the state file, or else the database
+
+        Returns:
+            HighWaterMark: The newest stored publication
+        """
+        path = self.settings.get("HIGH_WATER_MARK_FILE")
+        mark = HighWaterMark.load(path) if path else None
+
+        return (
+            mark if mark else HighWaterMark.load_from_db(storage_backend(self.settings))
+        )
+
+    @timed
     def parse(self, response: Response):
         """Method is in charge of processing the response and returning scraped data and/or more URLs to follow.
 
@@ -104,23 +326,263 @@ class AllFinancialDataSpider(scrapy.Spider):
         """
         self.set_max_page_number(response)
 
-        for row in range(0, self.get_table_lenght(response)):
-            item = self.extract_item(response, row)
+        if self.LOCATING:
+            yield from self.locate_pages(response)
+            return
+
+        if self.WINDOWED:
+            yield from self.parse_window(response)
+            return
+
+        page = response.meta.get("page", self.CURRENT_PAGE_NUMBER)
+        items = []
+        oldest = None
+        reason = None
+
+        for item in self.extract_items(self.get_table_rows(response), page):
+            oldest = item["publication_date"]
+
+            if item["publication_date"] <= self.END_DATE:
+                reason = "End date reached!"
+                break
+
+            if self.HIGH_WATER_MARK.is_ingested(item):
+                reason = "Stored rows reached!"
+                break
 
-            if item["publication_date"] == self.END_DATE:
-                raise CloseSpider("End date reached!")
+            if self.HIGH_WATER_MARK.is_known(item):
+                continue
+
+            # Rows committed before the crawl was resumed
+            if self.CHECKPOINT.is_committed(item):
+                continue
 
             if item["publication_date"] <= self.START_DATE:
-                yield item
+                items.append(item)
+
+        items = self.changed_rows(page, items)
+        yield from items
+
+        self.CHECKPOINT.page_parsed(page, len(items), oldest)
+
+        if reason is not None:
+            raise CloseSpider(reason)
 
         if self.CURRENT_PAGE_NUMBER < self.MAXIMUM_PAGE_NUMBER:
-            next_page_url = f"https://marknadssok.fi.se/publiceringsklient?page={self.CURRENT_PAGE_NUMBER + 1}"
-            if next_page_url is not None:
-                self.CURRENT_PAGE_NUMBER += 1
-                yield response.follow(next_page_url, callback=self.parse)
+            self.CURRENT_PAGE_NUMBER += 1
+            yield from self.fetch_page(self.CURRENT_PAGE_NUMBER)
         else:
             raise CloseSpider("Maximum page reached!")
 
+    @timed
+    def parse_window(self, response: Response):
+        """Processes a page when several pages are requested at the same time
+
+        Pages may arrive out of order, so every row is filtered on the date window
+        on its own and the end date only stops pages after the current one from
+        being scheduled.
+
+        Args:
+            response (Response): The response to parse
+
+        Yields:
+            scrapy.Item | scrapy.Request: Items of the page and the next pages to fetch
+        """
+        page = response.meta.get("page", self.CURRENT_PAGE_NUMBER)
+        self.PAGES_IN_FLIGHT.discard(page)
+        items = []
+        oldest = None
+
+        for item in self.extract_items(self.get_table_rows(response), page):
+            oldest = item["publication_date"]
+
+            if item["publication_date"] <= self.END_DATE or (
+                self.HIGH_WATER_MARK.is_ingested(item)
+            ):
+                if self.END_PAGE_NUMBER is None or page < self.END_PAGE_NUMBER:
+                    self.END_PAGE_NUMBER = page
+                break
+
+            if self.HIGH_WATER_MARK.is_known(item):
+                continue
+
+            # Rows committed before the crawl was resumed
+            if self.CHECKPOINT.is_committed(item):
+                continue
+
+            if item["publication_date"] <= self.START_DATE:
+                items.append(item)
+
+        items = self.changed_rows(page, items)
+        yield from items
+
+        self.CHECKPOINT.page_parsed(page, len(items), oldest)
+
+        yield from self.schedule_pages()
+
+    def changed_rows(self, page, items):
+        """Leaves out the rows of a page that are stored unchanged by an earlier crawl
+
+        Args:
+            page (int): The page number
+            items (list): The rows of the page inside the date window
+
+        Returns:
+            list: The rows to pass on to the pipelines
+        """
+        if self.FINGERPRINTS is None:
+            return items
+
+        return self.FINGERPRINTS.changed_rows(page, items)
+
+    def schedule_pages(self):
+        """Requests pages until the window of pages in flight is full
+
+        Yields:
+            scrapy.Request: The next pages to fetch
+        """
+        last_page = self.MAXIMUM_PAGE_NUMBER
+        if self.END_PAGE_NUMBER is not None:
+            last_page = min(last_page, self.END_PAGE_NUMBER)
+
+        while (
+            len(self.PAGES_IN_FLIGHT) < self.CONCURRENCY
+            and self.NEXT_PAGE_NUMBER <= last_page
+        ):
+            page = self.NEXT_PAGE_NUMBER
+            self.NEXT_PAGE_NUMBER += 1
+            self.PAGES_IN_FLIGHT.add(page)
+
+            yield from self.fetch_page(page, errback=self.page_failed)
+
+    def fetch_page(self, page, errback=None):
+        """Parses a page from its probe if the locator fetched it, or else requests it
+
+        Args:
+            page (int): The page number
+            errback (Callable): Called if the page can not be downloaded
+
+        Yields:
+            scrapy.Request | scrapy.Item: The request, or what parsing the probe yields
+        """
+        response = self.PROBED_PAGES.pop(page, None)
+        if response is not None:
+            yield from self.parse(response)
+            return
+
+        yield scrapy.Request(
+            self.page_url.format(page),
+            callback=self.parse,
+            errback=errback,
+            meta={"page": page},
+            dont_filter=True,
+        )
+
+    def page_failed(self, failure):
+        """Frees the slot of a page that could not be downloaded
+
+        Args:
+            failure (Failure): The download failure
+
+        Yields:
+            scrapy.Request: The next pages to fetch
+        """
+        page = failure.request.meta.get("page")
+        self.logger.error(f"Page {page} failed: {failure.value!r}")
+        self.PAGES_IN_FLIGHT.discard(page)
+
+        yield from self.schedule_pages()
+
+    def locate_pages(self, response: Response):
+        """Bisects over page numbers to find the pages covering the date window
+
+        The listing is ordered by publication date, newest first, so the first page
+        of the window is the first page whose oldest row is not newer than the start
+        date, and the last page is found the same way for the end date. The probes
+        gallop forward with doubling steps until they pass the date and bisect from
+        there, so a window close to the current page only costs a few probes.
+
+        Args:
+            response (Response): The probed page
+
+        Yields:
+            scrapy.Request | scrapy.Item: The next probe, or the first page of the window
+        """
+        page = response.meta.get("page", self.CURRENT_PAGE_NUMBER)
+        self.PROBED_PAGES[page] = response
+
+        rows = self.get_table_rows(response)
+        oldest = self.extract_item(rows[-1])["publication_date"] if rows else None
+
+        if self.LOCATE_BOUNDS is None:
+            self.LOCATE_BOUNDS = (1, self.MAXIMUM_PAGE_NUMBER)
+        low, high = self.LOCATE_BOUNDS
+
+        if oldest is None or oldest <= self.LOCATE_TARGETS[0]:
+            high = min(high, page)
+            self.LOCATE_STEP = None
+        else:
+            low = min(max(low, page + 1), high)
+            if self.LOCATE_STEP is not None:
+                self.LOCATE_STEP *= 2
+
+        while low == high:
+            self.LOCATED_PAGES.append(low)
+            self.LOCATE_TARGETS.pop(0)
+
+            if not self.LOCATE_TARGETS:
+                yield from self.start_window()
+                return
+
+            # The end of the window can not be before its start
+            low, high = low, self.MAXIMUM_PAGE_NUMBER
+            self.LOCATE_STEP = 1
+
+        self.LOCATE_BOUNDS = (low, high)
+        if self.LOCATE_STEP is None:
+            probe = (low + high) // 2
+        else:
+            probe = min(low + self.LOCATE_STEP - 1, high)
+
+        if probe in self.PROBED_PAGES:
+            yield from self.locate_pages(self.PROBED_PAGES[probe])
+            return
+
+        yield scrapy.Request(
+            self.page_url.format(probe),
+            callback=self.locate_pages,
+            meta={"page": probe},
+            dont_filter=True,
+        )
+
+    def start_window(self):
+        """Starts collecting from the first located page
+
+        The probes of the pages in the window are kept and parsed when their page
+        comes up instead of being requested again.
+
+        Yields:
+            scrapy.Request | scrapy.Item: Items of the first page and the next pages to fetch
+        """
+        first_page, last_page = self.LOCATED_PAGES
+        self.logger.info(
+            f"Located {self.START_DATE} - {self.END_DATE} on pages {first_page}-{last_page}"
+            f" after {len(self.PROBED_PAGES)} probes"
+        )
+
+        self.LOCATING = False
+        self.CURRENT_PAGE_NUMBER = first_page
+        self.NEXT_PAGE_NUMBER = first_page + 1
+        self.END_PAGE_NUMBER = last_page
+
+        self.PROBED_PAGES = {
+            page: response
+            for page, response in self.PROBED_PAGES.items()
+            if first_page <= page <= last_page
+        }
+
+        yield from self.fetch_page(first_page)
+
     def set_max_page_number(self, response: Response):
         """Method sets the maximum amount of pages on the site
 
@@ -145,76 +607,221 @@ class AllFinancialDataSpider(scrapy.Spider):
             page_number_str = response.xpath(xpath).get().replace("s", "")
             self.MAXIMUM_PAGE_NUMBER = int(page_number_str)
             self.COLLECTED_MAX_PAGES = True
+            self.CHECKPOINT.maximum_page_number = self.MAXIMUM_PAGE_NUMBER
 
-    def get_table_lenght(self, response: Response):
-        """The method gets the lenght of the current table
+    def watch_request(self, page):
+        """Returns the request of a page polled in watch mode
 
         Args:
-            response (Response): The response of the current request
+            page (int): The page number
 
         Returns:
-            int: The lenght of the table
+            scrapy.Request: The request, never answered from the listing cache
         """
-        return len(
-            response.xpath('//*[@id="grid-list"]/div[1]/div/table/tbody/tr').getall()
+        return scrapy.Request(
+            self.page_url.format(page),
+            callback=self.parse_watch,
+            errback=self.watch_failed,
+            meta={"page": page, "dont_cache": True},
+            dont_filter=True,
         )
 
-    def extract_item(self, response: Response, row: int):
-        """Method collects data for an item
+    @timed
+    def parse_watch(self, response: Response):
+        """Passes on the rows of a polled page that have not been seen before
+
+        Rows are diffed against the identities seen by earlier polls, and on the
+        first poll against the high water mark. When every row of a page is new,
+        the rows continue on the next page, which is polled as well.
 
         Args:
-            response (Response): The response from the current page
+            response (Response): The polled page
+
+        Yields:
+            scrapy.Item | scrapy.Request: The new rows, and the next page if needed
+        """
+        page = response.meta.get("page", 1)
+        detected = time.time()
+        rows = self.get_table_rows(response)
+        new = 0
+
+        for item in self.extract_items(rows, page):
+            identity = row_identity(item)
+
+            if identity in self.WATCH_SEEN:
+                continue
+            self.WATCH_SEEN.put(identity, True)
+
+            if self.HIGH_WATER_MARK.is_ingested(item) or (
+                self.HIGH_WATER_MARK.is_known(item)
+            ):
+                continue
+
+            new += 1
+            if self.WATCH_PREVIOUS_POLL is not None:
+                self.WATCH_DETECTED[identity] = (self.WATCH_PREVIOUS_POLL, detected)
+            yield item
+
+        self.WATCH_ROUND_NEW += new
+
+        if rows and new == len(rows):
+            if page < self.WATCH_MAX_PAGES:
+                yield self.watch_request(page + 1)
+                return
+            self.logger.warning(
+                f"Every row of the first {page} pages is new, older new rows may be"
+                " missing until an incremental crawl runs"
+            )
+
+        self.watch_round_done()
+
+    def watch_failed(self, failure):
+        """Ends a poll whose page could not be downloaded
+
+        Args:
+            failure (Failure): The download failure
+        """
+        page = failure.request.meta.get("page")
+        self.logger.error(f"Polling page {page} failed: {failure.value!r}")
+        self.watch_round_done()
+
+    def watch_round_done(self):
+        """Schedules the next poll, sooner after a poll that found new rows"""
+        if self.WATCH_ROUND_NEW:
+            self.WATCH_INTERVAL = self.WATCH_MIN_INTERVAL
+        else:
+            self.WATCH_INTERVAL = min(
+                self.WATCH_INTERVAL * 1.5, self.WATCH_MAX_INTERVAL
+            )
+
+        if self.stats is not None:
+            self.stats.inc_value("watch/polls")
+            self.stats.inc_value("watch/new_rows", self.WATCH_ROUND_NEW)
+            self.stats.set_value("watch/interval", self.WATCH_INTERVAL)
+
+        self.WATCH_ROUND_NEW = 0
+        self.schedule_poll()
+
+    def schedule_poll(self):
+        """Polls page 1 again after the current interval"""
+        from twisted.internet import reactor
+
+        if self.WATCH_CALL is not None and self.WATCH_CALL.active():
+            return
+
+        self.WATCH_CALL = reactor.callLater(self.WATCH_INTERVAL, self.poll)
+
+    def poll(self):
+        self.WATCH_CALL = None
+        self.WATCH_PREVIOUS_POLL = self.WATCH_POLL_STARTED
+        self.WATCH_POLL_STARTED = time.time()
+        self.crawler.engine.crawl(self.watch_request(1))
+
+    def watch_idle(self, spider):
+        """Keeps a watching spider open between polls"""
+        self.schedule_poll()
+        raise DontCloseSpider
+
+    def watch_committed(self, item, response, spider):
+        """Records how long a new row took from its publication to its commit
+
+        The listing only has publication dates, so the publication time is bounded
+        by the previous poll, which did not have the row yet.
+
+        Args:
+            item (scrapy.Item): The committed row
+            response (Response): The polled page
+            spider (scrapy.Spider): The running spider
+        """
+        polls = self.WATCH_DETECTED.pop(row_identity(item), None)
+        if polls is None or self.stats is None:
+            return
+
+        previous_poll, detected = polls
+        committed = time.time()
+        record_time(self.stats, "watch.detect_to_commit", committed - detected)
+        record_time(self.stats, "watch.publish_to_commit", committed - previous_poll)
+
+        self.logger.info(
+            f"New row of {item['issuer']} committed {committed - detected:.1f}s after"
+            f" it was seen, at most {committed - previous_poll:.1f}s after publication"
+        )
+
+    def watch_dropped(self, item, response, spider, **kwargs):
+        """Forgets a new row that was not stored, so the next poll offers it again
+
+        Args:
+            item (scrapy.Item): The dropped row
+            response (Response): The polled page
+            spider (scrapy.Spider): The running spider
+        """
+        identity = row_identity(item)
+        self.WATCH_DETECTED.pop(identity, None)
+        self.WATCH_SEEN.pop(identity)
+
+    def closed(self, reason):
+        if self.WATCH_CALL is not None and self.WATCH_CALL.active():
+            self.WATCH_CALL.cancel()
+
+    def get_table_rows(self, response: Response):
+        """The method selects the rows of the current table
+
+        Args:
+            response (Response): The response of the current request
+
+        Returns:
+            list: The <tr> elements of the table
+        """
+        return self.ROWS_XPATH(response.selector.root)
+
+    def extract_items(self, rows, page=None):
+        """Extracts the items of the rows of a page, numbering repeated rows
+
+        A row identical to an earlier row of the page is another trade with the
+        same details, its occurrence tells it apart so it is stored as a row of
+        its own.
+
+        Args:
+            rows (list): The <tr> elements of the page
+            page (int): The page number the items are stamped with
+
+        Yields:
+            WebscraperItem | WebscraperRecord: The item of every row, in page order
+        """
+        seen = {}
+
+        for row in rows:
+            item = self.extract_item(row)
+            identity = row_identity(item)
+            occurrence = seen.get(identity, 0) + 1
+            seen[identity] = occurrence
+            if occurrence > 1:
+                item["occurrence"] = occurrence
+            if page is not None:
+                item["page"] = page
+            yield item
+
+    @timed
+    def extract_item(self, row):
+        """Method collects data for an item by reading the cells of a row in one pass
+
+        Args:
+            row (lxml.html.HtmlElement): The <tr> element of the current row
 
         Returns:
-            WebscraperItem: The data that have been scraped
-        """
-
-        item = WebscraperItem()
-
-        item["publication_date"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[1]/text()'
-        ).extract_first()
-        item["issuer"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[2]/text()'
-        ).extract_first()
-        item["name"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[3]/text()'
-        ).extract_first()
-        item["role"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[4]/text()'
-        ).extract_first()
-        item["related"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[5]/text()'
-        ).extract_first()
-        item["nature_of_purchase"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[6]/text()'
-        ).extract_first()
-        item["instrument_name"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[7]/text()'
-        ).extract_first()
-        item["instrument_type"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[8]/text()'
-        ).extract_first()
-        item["isin"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[9]/text()'
-        ).extract_first()
-        item["transaction_date"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[10]/text()'
-        ).extract_first()
-        item["volume"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[11]/text()'
-        ).extract_first()
-        item["volume_unit"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[12]/text()'
-        ).extract_first()
-        item["price"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[13]/text()'
-        ).extract_first()
-        item["currency"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[14]/text()'
-        ).extract_first()
-        item["status"] = response.xpath(
-            f'//*[@id="grid-list"]/div[1]/div/table/tbody/tr[{row + 1}]/td[15]/a/text()'
-        ).extract_first()
-
-        return item
+            WebscraperItem | WebscraperRecord: The data that have been scraped
+        """
+        cells = self.CELLS_XPATH(row)
+        values = []
+
+        for index in range(len(self.ROW_FIELDS)):
+            texts = self.TEXT_XPATH(cells[index]) if index < len(cells) else []
+            values.append(str(texts[0]) if texts else None)
+
+        texts = self.STATUS_XPATH(cells[14]) if len(cells) > 14 else []
+        values.append(str(texts[0]) if texts else None)
+
+        if self.COMPACT_ITEMS:
+            return WebscraperRecord(*values)
+
+        return WebscraperItem(zip(self.ITEM_FIELDS, values))
@@ -0,0 +1,467 @@
+import json
+import logging
+import os
+import tempfile
+
+from .dates import to_date
+from .items import row_identity
+
+logger = logging.getLogger(__name__)
+
+
+def write_json_atomically(path, data):
+    """Writes JSON to a temporary file and moves it over the target in one step
+
+    Args:
+        path (str): The target file
+        data (Any): JSON serialisable data
+    """
+    write_text_atomically(path, json.dumps(data))
+
+
+def write_text_atomically(path, text):
+    """Writes text to a temporary file and moves it over the target in one step
+
+    Args:
+        path (str): The target file
+        text (str): The content of the file
+    """
+    write_bytes_atomically(path, text.encode("utf-8"))
+
+
+def write_bytes_atomically(path, data):
+    """Writes bytes to a temporary file and moves it over the target in one step
+
+    Args:
+        path (str): The target file
+        data (bytes): The content of the file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class CrawlCheckpoint:
+    """Progress of a crawl, counting only the rows the pipelines have committed
+
+    Pages are folded into a contiguous range once every item yielded from them is
+    committed. Rows newer than the oldest publication date of that range are
+    covered by the date, every other committed row by its identity.
+    """
+
+    def __init__(
+        self,
+        start_date=None,
+        end_date=None,
+        maximum_page_number=None,
+        completed_through=None,
+        boundary_date=None,
+        identities=(),
+        pages=None,
+        last_committed=None,
+        items_committed=0,
+        finished=None,
+    ):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.maximum_page_number = maximum_page_number
+        self.completed_through = completed_through
+        self.boundary_date = boundary_date
+        self.identities = {tuple(identity) for identity in identities}
+        self.pages = {}
+        self.last_committed = last_committed
+        self.items_committed = items_committed
+        self.finished = finished
+        self.dirty = False
+
+        for page, state in (pages or {}).items():
+            self.open_page(int(page)).update(
+                expected=state.get("expected"),
+                settled=state.get("settled", 0),
+                failed=state.get("failed", 0),
+                oldest=state.get("oldest"),
+                identities={
+                    tuple(identity) for identity in state.get("identities", ())
+                },
+            )
+
+        self.resumed_identities = set()
+
+    def open_page(self, page):
+        """Returns the progress of a page that has not been folded yet
+
+        Args:
+            page (int): The page number
+
+        Returns:
+            dict: The progress of the page
+        """
+        if self.completed_through is None:
+            self.completed_through = page - 1
+
+        return self.pages.setdefault(
+            page,
+            {
+                "expected": None,
+                "settled": 0,
+                "failed": 0,
+                "oldest": None,
+                "identities": set(),
+            },
+        )
+
+    def page_parsed(self, page, items, oldest):
+        """Records how many items a page yielded once the spider is done with it
+
+        Args:
+            page (int): The page number
+            items (int): The number of items yielded from the page
+            oldest (str): The oldest publication date on the page
+        """
+        state = self.open_page(page)
+        state["expected"] = items
+        state["oldest"] = oldest
+        self.fold_pages()
+
+    def item_settled(self, page, item, committed):
+        """Records an item that has left the pipelines
+
+        Args:
+            page (int): The page the item was scraped from
+            item (scrapy.Item): The item
+            committed (bool): True if the item was stored, False if it was dropped
+        """
+        if page is None:
+            return
+
+        state = self.open_page(page)
+        state["settled"] += 1
+
+        if committed:
+            identity = row_identity(item)
+            state["identities"].add(identity)
+            self.last_committed = list(identity)
+            self.items_committed += 1
+        else:
+            state["failed"] += 1
+
+        self.fold_pages()
+
+    def fold_pages(self):
+        """Moves the contiguous range forward over the pages that are fully committed"""
+        self.dirty = True
+
+        while True:
+            state = self.pages.get(self.completed_through + 1)
+            if (
+                state is None
+                or state["expected"] is None
+                or state["settled"] < state["expected"]
+                or state["failed"]
+            ):
+                return
+
+            del self.pages[self.completed_through + 1]
+            self.completed_through += 1
+
+            self.identities.update(state["identities"])
+
+            if state["oldest"] is not None and (
+                self.boundary_date is None or state["oldest"] < self.boundary_date
+            ):
+                self.boundary_date = state["oldest"]
+                self.identities = {
+                    identity
+                    for identity in self.identities
+                    if identity[0] <= self.boundary_date
+                }
+
+    def committed_identities(self):
+        """Returns the identities of the committed rows the date boundary does not cover
+
+        Returns:
+            set: The row identities
+        """
+        identities = set(self.identities)
+        for state in self.pages.values():
+            identities.update(state["identities"])
+        return identities
+
+    def reopen(self):
+        """Prepares the checkpoint for a resumed crawl
+
+        Pages are numbered again by the resumed crawl, so the rows committed from
+        the open pages are only kept as identities.
+        """
+        self.identities = self.committed_identities()
+        self.resumed_identities = set(self.identities)
+        self.pages = {}
+        self.finished = None
+
+    def is_committed(self, item):
+        """Checks if a row was committed before the crawl was resumed
+
+        Args:
+            item (scrapy.Item): A scraped row
+
+        Returns:
+            bool: True if the row is stored
+        """
+        return bool(self.resumed_identities) and (
+            row_identity(item) in self.resumed_identities
+        )
+
+    def resume_page(self):
+        """Returns the first page that is not fully committed
+
+        Rows only move to later pages as new rows are published, so no row that
+        was on a later page can have moved before it.
+
+        Returns:
+            int: The page number, or None if no page has been committed
+        """
+        return None if self.completed_through is None else self.completed_through + 1
+
+    def resume_date(self):
+        """Returns the newest publication date that may still hold uncommitted rows
+
+        Returns:
+            str: The date in YYYY-MM-DD format
+        """
+        if self.boundary_date is None:
+            return self.start_date
+        return min(self.start_date, self.boundary_date)
+
+    def save(self, path):
+        """Writes the checkpoint to a state file
+
+        Args:
+            path (str): The state file
+        """
+        write_json_atomically(
+            path,
+            {
+                "start_date": self.start_date,
+                "end_date": self.end_date,
+                "maximum_page_number": self.maximum_page_number,
+                "completed_through": self.completed_through,
+                "boundary_date": self.boundary_date,
+                "identities": sorted(self.identities),
+                "pages_in_flight": {
+                    page: {
+                        **state,
+                        "identities": sorted(state["identities"]),
+                    }
+                    for page, state in sorted(self.pages.items())
+                },
+                "last_committed": self.last_committed,
+                "items_committed": self.items_committed,
+                "finished": self.finished,
+            },
+        )
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Reads the checkpoint from a state file
+
+        Args:
+            path (str): The state file
+
+        Returns:
+            CrawlCheckpoint: The stored checkpoint, or None if there is no state file
+        """
+        try:
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+
+        return cls(
+            start_date=data.get("start_date"),
+            end_date=data.get("end_date"),
+            maximum_page_number=data.get("maximum_page_number"),
+            completed_through=data.get("completed_through"),
+            boundary_date=data.get("boundary_date"),
+            identities=data.get("identities", ()),
+            pages=data.get("pages_in_flight"),
+            last_committed=data.get("last_committed"),
+            items_committed=data.get("items_committed", 0),
+            finished=data.get("finished"),
+        )
+
+
+class HighWaterMark:
+    """Newest stored publication date and the identities of the rows published on it"""
+
+    def __init__(self, publication_date=None, identities=()):
+        self.publication_date = publication_date
+        self.identities = {tuple(identity) for identity in identities}
+
+    def __bool__(self):
+        return self.publication_date is not None
+
+    def update(self, item):
+        """Moves the mark forward with a stored row
+
+        Args:
+            item (scrapy.Item): A row that has been committed
+        """
+        publication_date = to_date(item["publication_date"])
+        if publication_date is None:
+            return
+
+        publication_date = publication_date.isoformat()
+
+        if self.publication_date is None or publication_date > self.publication_date:
+            self.publication_date = publication_date
+            self.identities = set()
+
+        if publication_date == self.publication_date:
+            self.identities.add(row_identity(item))
+
+    def is_ingested(self, item):
+        """Checks if a row is older than the newest stored publication date
+
+        Args:
+            item (scrapy.Item): A scraped row
+
+        Returns:
+            bool: True if every row from here on has already been stored
+        """
+        publication_date = to_date(item["publication_date"])
+        return (
+            self.publication_date is not None
+            and publication_date is not None
+            and publication_date.isoformat() < self.publication_date
+        )
+
+    def is_known(self, item):
+        """Checks if a row has already been stored
+
+        Args:
+            item (scrapy.Item): A scraped row
+
+        Returns:
+            bool: True if the row is stored
+        """
+        if self.is_ingested(item):
+            return True
+
+        publication_date = to_date(item["publication_date"])
+        return (
+            publication_date is not None
+            and publication_date.isoformat() == self.publication_date
+            and row_identity(item) in self.identities
+        )
+
+    def save(self, path):
+        """Writes the mark to a state file
+
+        Args:
+            path (str): The state file
+        """
+        write_json_atomically(
+            path,
+            {
+                "publication_date": self.publication_date,
+                "identities": sorted(self.identities),
+            },
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Reads the mark from a state file
+
+        Args:
+            path (str): The state file
+
+        Returns:
+            HighWaterMark: The stored mark, or None if there is no state file
+        """
+        try:
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+
+        return cls(data.get("publication_date"), data.get("identities", ()))
+
+    @classmethod
+    def load_from_db(cls, backend):
+        """Reads the mark from the Transactions table of the configured database
+
+        Args:
+            backend (StorageBackend): The database MySqlPipeline writes to
+
+        Returns:
+            HighWaterMark: The stored mark, empty if nothing has been stored or the
+                database could not be read
+        """
+        mark = cls()
+
+        try:
+            conn = backend.connect()
+        except backend.Error as err:
+            logger.error(
+                f"Could not connect to read the high water mark, every row is collected: {err}"
+            )
+            return mark
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT pub.date, c.name, p.name, i.isin, i.name,
+                t.nature_of_purchase, pur.date, t.volume, t.price, t.occurrence
+                FROM Transactions t
+                JOIN Dates pub ON pub.id = t.publication_date_id
+                JOIN Dates pur ON pur.id = t.purchase_date_id
+                JOIN People p ON p.id = t.people_id
+                JOIN Companies c ON c.id = p.company_id
+                JOIN Instruments i ON i.id = t.instrument_id
+                WHERE pub.date = (
+                    SELECT MAX(d.date) FROM Transactions tr
+                    JOIN Dates d ON d.id = tr.publication_date_id
+                )"""
+            )
+
+            for row in cursor.fetchall():
+                mark.update(
+                    dict(
+                        zip(
+                            (
+                                "publication_date",
+                                "issuer",
+                                "name",
+                                "isin",
+                                "instrument_name",
+                                "nature_of_purchase",
+                                "transaction_date",
+                                "volume",
+                                "price",
+                                "occurrence",
+                            ),
+                            row,
+                        )
+                    )
+                )
+        except backend.Error as err:
+            logger.error(
+                f"Could not read the high water mark, every row is collected: {err}"
+            )
+            return cls()
+        finally:
+            conn.close()
+
+        return mark
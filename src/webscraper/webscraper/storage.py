@@ -0,0 +1,536 @@
+import logging
+import os
+import sqlite3
+
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+import mysql.connector
+
+from mysql.connector import errors
+from dotenv import load_dotenv
+from scrapy.utils.misc import load_object
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Stored as text, like the default adapters that are deprecated since Python 3.12
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(Decimal, str)
+
+# Columns identifying a transaction, everything but its id and related flag.
+# Identical trades listed on the same page share them and are told apart by
+# the occurrence column, which is unique together with the natural key.
+TRANSACTION_KEY_COLUMNS = (
+    "people_id",
+    "instrument_id",
+    "purchase_date_id",
+    "publication_date_id",
+    "nature_of_purchase",
+    "volume",
+    "volume_unit",
+    "price",
+    "currency_id",
+)
+
+
+def storage_backend(settings):
+    """Creates the storage backend configured by STORAGE_BACKEND
+
+    Args:
+        settings (Settings): The crawler settings
+
+    Returns:
+        StorageBackend: The backend, not connected yet
+    """
+    backend_class = load_object(
+        settings.get("STORAGE_BACKEND", "webscraper.storage.MySqlBackend")
+    )
+    return backend_class.from_settings(settings)
+
+
+def bulk_load_enabled(settings):
+    """Checks if the items are bulk loaded by BulkLoadPipeline
+
+    Args:
+        settings (Settings): The crawler settings
+
+    Returns:
+        bool: True if MYSQL_BULK_LOAD is set and the backend supports it
+    """
+    return settings.getbool("MYSQL_BULK_LOAD") and storage_backend(settings).LOAD_DATA
+
+
+class StorageBackend:
+    """Database MySqlPipeline writes to
+
+    The pipeline keeps the schema, the id resolution and the SQL the databases
+    share, written with %s placeholders. A backend makes the connections and
+    supplies the parts of the dialect that differ: the id column, upserts, the
+    natural key of Transactions and the errors of its driver.
+    """
+
+    name = None
+    # Base class of the errors raised by the driver
+    Error = Exception
+    # Definition of an auto-incremented id column
+    ID_COLUMN = None
+    # Supports LOAD DATA LOCAL INFILE, which BulkLoadPipeline needs
+    LOAD_DATA = False
+    # Comparison operator that is true for two NULLs
+    NULL_SAFE_EQUAL = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def create_database(self):
+        """Creates the database if it does not exist yet"""
+
+    def drop_database(self):
+        """Drops the database, used for throwaway benchmark databases"""
+        raise NotImplementedError
+
+    def use_throwaway(self, name=None):
+        """Points the backend at an empty throwaway database
+
+        Args:
+            name (str): The database to use, derived from the configured one if None
+        """
+        raise NotImplementedError
+
+    def connect(self):
+        """Opens a connection
+
+        Returns:
+            Connection: A DB-API connection whose cursors take %s placeholders
+        """
+        raise NotImplementedError
+
+    def is_connection_error(self, err):
+        """Checks if an error means the connection to the database was lost
+
+        Args:
+            err (Exception): An error of the driver
+
+        Returns:
+            bool: True if the work should be replayed on a new connection
+        """
+        return False
+
+    def migrate(self, cursor):
+        """Adds the keys that tables created by older versions are missing
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+        """
+
+    def on_duplicate(self, update=(), return_id=False):
+        """Returns the clause an INSERT ends with to handle rows that already exist
+
+        Args:
+            update (tuple): Columns set to the inserted values, the row is kept if empty
+            return_id (bool): If the id of the row is read with upserted_id
+
+        Returns:
+            str: The clause
+        """
+        raise NotImplementedError
+
+    def upserted_id(self, cursor):
+        """Returns the id of the row written by an INSERT ending with on_duplicate
+
+        Args:
+            cursor (Cursor): The cursor that ran the INSERT with return_id set
+
+        Returns:
+            int: The id of the new or existing row
+        """
+        raise NotImplementedError
+
+    def natural_key(self, expressions):
+        """Returns the expression identifying a row by the values of its key columns
+
+        Args:
+            expressions (list): SQL expressions of the key columns
+
+        Returns:
+            str: The SQL expression of the natural key
+        """
+        raise NotImplementedError
+
+    def natural_key_column(self, columns):
+        """Returns the definition of a stored natural_key column
+
+        Args:
+            columns (tuple): The key columns
+
+        Returns:
+            str: The column definition
+        """
+        raise NotImplementedError
+
+    def cast(self, expression, column_type):
+        """Returns an expression converted like a value stored in a column
+
+        Args:
+            expression (str): The SQL expression
+            column_type (str): The type of the column, e.g. DECIMAL(14, 6)
+
+        Returns:
+            str: The converted expression
+        """
+        raise NotImplementedError
+
+
+class MySqlBackend(StorageBackend):
+    """MySQL server configured by DB_HOST, DB_USER, DB_PASSWORD and DB_SCHEMA
+
+    MySqlPipeline runs its database work one call at a time on a single thread,
+    which keeps the statements of a batch in order, so it holds one connection
+    and a lost connection is replaced by a new one.
+    """
+
+    name = "mysql"
+    Error = mysql.connector.Error
+    ID_COLUMN = "id INT AUTO_INCREMENT PRIMARY KEY"
+    LOAD_DATA = True
+    NULL_SAFE_EQUAL = "<=>"
+    # Server gone away, lost connection and disconnected for inactivity
+    CONNECTION_ERRORS = (2006, 2013, 2055, 4031)
+
+    def __init__(self):
+        self.host = os.getenv("DB_HOST")
+        self.user = os.getenv("DB_USER")
+        self.password = os.getenv("DB_PASSWORD")
+        self.database = os.getenv("DB_SCHEMA")
+
+        self.connect_options = {}
+
+    def server_connection(self):
+        """Opens a connection to the server without selecting the database
+
+        Returns:
+            MySQLConnection: The connection
+        """
+        return mysql.connector.connect(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+        )
+
+    def create_database(self):
+        """Checks if the database exists and creates it if not."""
+        try:
+            db_conn = self.server_connection()
+            cursor = db_conn.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+        except mysql.connector.Error as err:
+            print(f"Error: {err}")
+
+    def drop_database(self):
+        conn = self.server_connection()
+        try:
+            conn.cursor().execute(f"DROP DATABASE IF EXISTS `{self.database}`")
+        finally:
+            conn.close()
+
+    def use_throwaway(self, name=None):
+        self.database = name or f"{self.database}_benchmark"
+        self.drop_database()
+
+    def connect(self):
+        """Opens a connection to the database
+
+        Raises:
+            mysql.connector.Error: The database could not be reached
+        """
+        return mysql.connector.connect(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database,
+            **self.connect_options,
+        )
+
+    def is_connection_error(self, err):
+        return isinstance(err, errors.InterfaceError) or (
+            err.errno in self.CONNECTION_ERRORS
+        )
+
+    def migrate(self, cursor):
+        """Adds the unique keys and columns that tables created by older versions miss
+
+        Transactions rows that are duplicated are removed, the row with the lowest
+        id is kept. Duplicated roles, people and dates are referred to by other rows
+        and have to be merged by hand.
+
+        Raises:
+            mysql.connector.Error: A table could not be migrated, the pipeline
+                does not write to a half migrated schema
+        """
+        keys = self.unique_keys(cursor)
+        cursor.execute(
+            """SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = DATABASE()"""
+        )
+        columns = {(table.lower(), column) for table, column in cursor.fetchall()}
+
+        for table, index, alteration in (
+            ("Roles", "uq_roles_role", "ADD UNIQUE KEY uq_roles_role (role)"),
+            (
+                "People",
+                "uq_people_company_name",
+                "ADD UNIQUE KEY uq_people_company_name (company_id, name)",
+            ),
+        ):
+            if (table.lower(), index) not in keys:
+                self.alter(cursor, table, alteration)
+
+        # Concurrent writers insert the same dates and rely on the key to skip them
+        if ["date"] not in [
+            key for (table, _), key in keys.items() if table == "dates"
+        ]:
+            self.alter(cursor, "Dates", "ADD UNIQUE KEY uq_dates_date (date)")
+
+        if ("transactions", "natural_key") not in columns:
+            self.alter(
+                cursor,
+                "Transactions",
+                f"ADD COLUMN {self.natural_key_column(TRANSACTION_KEY_COLUMNS)}",
+            )
+        if ("transactions", "occurrence") not in columns:
+            self.alter(
+                cursor, "Transactions", "ADD COLUMN occurrence INT NOT NULL DEFAULT 1"
+            )
+
+        key = keys.get(("transactions", "uq_transactions_natural_key"))
+        if key == ["natural_key", "occurrence"]:
+            return
+
+        self.remove_duplicate_transactions(cursor)
+        self.alter(
+            cursor,
+            "Transactions",
+            ("DROP INDEX uq_transactions_natural_key, " if key else "")
+            + "ADD UNIQUE KEY uq_transactions_natural_key (natural_key, occurrence)",
+        )
+
+    def unique_keys(self, cursor):
+        """Reads the columns of every unique key of the database
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+
+        Returns:
+            dict: The columns in key order per (lower case table, index)
+        """
+        cursor.execute(
+            """SELECT table_name, index_name, column_name FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND non_unique = 0
+            ORDER BY table_name, index_name, seq_in_index"""
+        )
+        keys = {}
+        for table, index, column in cursor.fetchall():
+            keys.setdefault((table.lower(), index), []).append(column)
+        return keys
+
+    def alter(self, cursor, table, alteration):
+        """Alters a table, logging the error before raising it
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+            table (str): The table
+            alteration (str): The ALTER TABLE clauses
+        """
+        try:
+            cursor.execute(f"ALTER TABLE {table} {alteration}")
+        except mysql.connector.Error as err:
+            logger.error(f"Error migrating {table} ({alteration}): {err}")
+            raise
+
+    def remove_duplicate_transactions(self, cursor):
+        """Deletes the Transactions rows whose natural key and occurrence an older row has
+
+        Args:
+            cursor (Cursor): A cursor of the open connection
+        """
+        cursor.execute(
+            """DELETE t FROM Transactions t
+            JOIN (
+                SELECT natural_key, occurrence, MIN(id) AS id FROM Transactions
+                GROUP BY natural_key, occurrence HAVING COUNT(*) > 1
+            ) AS kept
+            ON kept.natural_key = t.natural_key AND kept.occurrence = t.occurrence
+            AND t.id > kept.id"""
+        )
+        if cursor.rowcount > 0:
+            logger.warning(
+                f"Removed {cursor.rowcount} duplicated rows from Transactions"
+            )
+
+    def on_duplicate(self, update=(), return_id=False):
+        assignments = [f"{column} = VALUES({column})" for column in update]
+        if return_id:
+            # Makes the id of an existing row the insert id as well
+            assignments.append("id = LAST_INSERT_ID(id)")
+
+        return f"ON DUPLICATE KEY UPDATE {', '.join(assignments) or 'id = id'}"
+
+    def upserted_id(self, cursor):
+        return cursor.lastrowid
+
+    def natural_key(self, expressions):
+        values = ", ".join(f"IFNULL({expression}, '')" for expression in expressions)
+        return f"SHA1(CONCAT_WS('|', {values}))"
+
+    def natural_key_column(self, columns):
+        return f"natural_key CHAR(40) AS ({self.natural_key(columns)}) STORED"
+
+    def cast(self, expression, column_type):
+        return f"CAST({expression} AS {column_type})"
+
+
+class SqliteBackend(StorageBackend):
+    """Embedded SQLite database in a single file, in WAL mode
+
+    Needs no server, so small deployments, CI and benchmarks can run the whole
+    pipeline. Batches are written in one transaction each like on MySQL.
+    """
+
+    name = "sqlite"
+    Error = sqlite3.Error
+    ID_COLUMN = "id INTEGER PRIMARY KEY"
+    NULL_SAFE_EQUAL = "IS"
+
+    def __init__(self, database: str = ".state/ik_index.sqlite3", timeout=30.0):
+        self.database = database
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            database=settings.get("SQLITE_DATABASE_FILE", ".state/ik_index.sqlite3")
+        )
+
+    def create_database(self):
+        directory = os.path.dirname(os.path.abspath(self.database))
+        os.makedirs(directory, exist_ok=True)
+
+    def drop_database(self):
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.database + suffix)
+            except FileNotFoundError:
+                pass
+
+    def use_throwaway(self, name=None):
+        root, extension = os.path.splitext(self.database)
+        self.database = name or f"{root}_benchmark{extension}"
+        self.drop_database()
+
+    def connect(self):
+        # The pipeline only uses a connection on its database thread, one at a time
+        conn = sqlite3.connect(
+            self.database, timeout=self.timeout, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+
+        return SqliteConnection(conn)
+
+    def migrate(self, cursor):
+        """Indexes the purchase dates the activity tables are refreshed by
+
+        MySQL indexes foreign keys by itself.
+        """
+        cursor.execute(
+            """CREATE INDEX IF NOT EXISTS ix_transactions_purchase_date
+            ON Transactions (purchase_date_id)"""
+        )
+
+    def on_duplicate(self, update=(), return_id=False):
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in update)
+        if return_id:
+            return f"ON CONFLICT DO UPDATE SET {assignments or 'id = id'} RETURNING id"
+        if assignments:
+            return f"ON CONFLICT DO UPDATE SET {assignments}"
+        return "ON CONFLICT DO NOTHING"
+
+    def upserted_id(self, cursor):
+        return cursor.fetchone()[0]
+
+    def natural_key(self, expressions):
+        return " || '|' || ".join(
+            f"IFNULL({expression}, '')" for expression in expressions
+        )
+
+    def natural_key_column(self, columns):
+        return f"natural_key TEXT AS ({self.natural_key(columns)}) STORED"
+
+    def cast(self, expression, column_type):
+        # Numbers are stored with NUMERIC affinity whatever the declared type
+        return f"CAST({expression} AS NUMERIC)"
+
+
+@lru_cache(maxsize=1024)
+def qmark(query):
+    """Converts the %s placeholders of a statement to the ? of sqlite3"""
+    return query.replace("%s", "?")
+
+
+class SqliteConnection:
+    """sqlite3 connection with the interface of the mysql.connector ones"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self, **kwargs):
+        # Statements are prepared and cached by sqlite3, buffered and prepared
+        # cursors need no special handling
+        return SqliteCursor(self.conn.cursor())
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class SqliteCursor:
+    """sqlite3 cursor taking statements with %s placeholders"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        self.cursor.execute(qmark(query), params)
+
+    def executemany(self, query, rows):
+        self.cursor.executemany(qmark(query), rows)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()